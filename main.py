@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from datetime import datetime
@@ -16,6 +16,7 @@ import time
 from memory_api.config_loader import load_config
 
 from memory_api.memory_api import (
+    ingest_buffer,
     log_memory,
     MemoryEntry,
     memory_router,
@@ -25,9 +26,15 @@ from mesh_api.peer_registry import save_peer
 from memory_api.memory_api import memory_sync_loop
 from mesh_api.mesh_routes import mesh_routes as mesh_router
 from memory_api.log_pruner import prune_synced_logs
-from memory_api.qdrant_interface import ensure_panai_memory_collection
+from memory_api.qdrant_interface import async_client, client, ensure_panai_memory_collection
+from memory_api.embedding import start_warmup, model_status
+from memory_api.executors import loop_lag_monitor
 
 from memory_api.memory_logger import log_interaction
+from memory_api.llm_client import llm_client, model_residency
+from memory_api.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_WARMUP, SchedulerBusy
+from memory_api.token_stream import token_stream_response
+from mesh_api.inference_router import inference_router, router as inference_mesh_router
 
 logging.basicConfig(
     filename="server.log",
@@ -37,6 +44,9 @@ logging.basicConfig(
 
 app = FastAPI()
 
+# Every async llm_client call (chat, reflective endpoints, summaries) may now run on a mesh peer.
+llm_client.router = inference_router
+
 logger = logging.getLogger(__name__)
 
 async def schedule_log_cleanup():
@@ -91,6 +101,7 @@ def resolve_node_name(identity_json):
 app.include_router(memory_router, prefix="/memory")
 app.include_router(memory_stats_router, prefix="/memory/stats")
 app.include_router(mesh_router, prefix="/mesh")
+app.include_router(inference_mesh_router, prefix="/mesh")
 # Updated for memory router sync check
 
 # --- mDNS Service Registration ---
@@ -106,7 +117,8 @@ async def register_mdns_service():
             properties={b"name": service_name.encode()},
             server=service_name,  # Pass as str, not bytes
         )
-        zeroconf.register_service(service_info)
+        # Registration probes the LAN for a few seconds; keep it off the event loop.
+        await asyncio.to_thread(zeroconf.register_service, service_info)
         print(f"[Startup] Registered mDNS service: {service_name}.")
         log_ops_event(f"Registered mDNS service: {service_name}")
         return zeroconf
@@ -115,21 +127,15 @@ async def register_mdns_service():
         log_ops_event(f"[Startup] Error registering mDNS service: {e}")
 
 async def preload_models():
-    import httpx
-    warmup_prompts = [
-        {"model": model, "prompt": "Hello", "stream": False}
-        for model in identity.get("warmup_models", [])
-    ]
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for p in warmup_prompts:
-            try:
-                response = await client.post("http://localhost:11434/api/generate", json=p)
-                response.raise_for_status()
-                logger.info(f"[Startup] Model {p['model']} warmed up.")
-                log_ops_event(f"Model {p['model']} warmed up during startup.")
-            except httpx.HTTPError as e:
-                logger.error(f"[Startup] Warmup failed for {p['model']}: {e}")
-                log_ops_event(f"[Startup] Warmup failed for {p['model']}: {e}")
+    """One warm-up generation per ``warmup_models`` entry, for when model residency is off."""
+    for model in identity.get("warmup_models", []):
+        try:
+            await llm_client.generate_local(model, "Hello", PRIORITY_WARMUP)
+            logger.info(f"[Startup] Model {model} warmed up.")
+            log_ops_event(f"Model {model} warmed up during startup.")
+        except (httpx.HTTPError, SchedulerBusy) as e:
+            logger.error(f"[Startup] Warmup failed for {model}: {e}")
+            log_ops_event(f"[Startup] Warmup failed for {model}: {e}")
 
 async def periodic_health_check():
     await asyncio.sleep(10)  # Give server a moment to fully start
@@ -176,19 +182,39 @@ async def periodic_health_check():
         await asyncio.sleep(900)  # 15 minutes
 
 
+# Readiness flags for /ready; /health stays up regardless.
+readiness = {"qdrant_collection": False}
+
+async def ensure_collection_in_background():
+    while not readiness["qdrant_collection"]:
+        try:
+            await asyncio.to_thread(ensure_panai_memory_collection, client)
+            readiness["qdrant_collection"] = True
+            log_ops_event("Qdrant collection ensured.")
+        except Exception as e:
+            logger.warning(f"[Startup] Qdrant collection check failed: {e}")
+            log_ops_event(f"[Startup] Qdrant collection check failed: {e}")
+            await asyncio.sleep(10)  # Qdrant may still be starting; retry
+
 @app.on_event("startup")
 async def startup_tasks():
-    try:
-        ensure_panai_memory_collection()
-        log_ops_event("Qdrant collection ensured.")
-    except Exception as e:
-        logger.warning(f"[Startup] Qdrant collection check failed: {e}")
-        log_ops_event(f"[Startup] Qdrant collection check failed: {e}")
-    log_ops_event("Ensured Qdrant collection at startup")
+    # Model loading and the Qdrant check run in the background so the
+    # server accepts connections immediately; see /ready for their status.
+    start_warmup()
+    log_ops_event("Embedding model warm-up started in background")
+    loop_lag_monitor.start()
+    asyncio.create_task(ensure_collection_in_background())
     log_ops_event("Registering mDNS service")
-    await register_mdns_service()  # Register mDNS service when the app starts
-    asyncio.create_task(preload_models())
+    asyncio.create_task(register_mdns_service())  # Register mDNS service when the app starts
+    if llm_client.residency is not None:
+        # Tracks resident models, pre-warms warmup_models and predicted models, evicts LRU.
+        asyncio.create_task(model_residency.run(identity.get("warmup_models", [])))
+    else:
+        asyncio.create_task(preload_models())
     asyncio.create_task(periodic_health_check())
+    inference_router.node_name = resolve_node_name(identity)
+    if inference_router.enabled:
+        asyncio.create_task(inference_router.run())  # polls peers' /health load for routing
     asyncio.create_task(memory_sync_loop())
     asyncio.create_task(schedule_log_cleanup())
     log_ops_event("Startup tasks complete and background tasks launched.")
@@ -203,6 +229,7 @@ class ChatRequest(BaseModel):
     prompt: str
     user_id: str = "local"
     tags: list[str] = []
+    stream: bool = False  # stream tokens as NDJSON (or SSE with Accept: text/event-stream)
 
 class ChatResponse(BaseModel):
     response: str
@@ -211,16 +238,20 @@ class ChatResponse(BaseModel):
 
 # --- Chat Endpoint ---
 @app.post("/chat", response_model=ChatResponse, operation_id="chat_with_model")
-async def chat(req: ChatRequest):
-    payload = {
-        "model": model_name,
-        "prompt": req.prompt,
-        "stream": False  # optional, disables token streaming
-    }
+async def chat(req: ChatRequest, request: Request):
+    if req.stream:
+        async def finish(content: str) -> dict:
+            log_interaction(req.prompt, content, req.tags, access, model_name)
+            return {"response": content, "model": model_name, "timestamp": datetime.now().isoformat()}
+
+        node = llm_client.admit(model_name, PRIORITY_INTERACTIVE)
+        tokens = llm_client.stream(model_name, req.prompt, PRIORITY_INTERACTIVE, node=node)
+        return token_stream_response(request, tokens, finish)
+
     try:
-        r = requests.post("http://localhost:11434/api/generate", json=payload, timeout=10)
-        r.raise_for_status()
-        content = r.json()["response"]
+        content = await llm_client.generate(model_name, req.prompt, PRIORITY_INTERACTIVE)
+    except SchedulerBusy:
+        raise
     except Exception as e:
         content = f"Error contacting model '{model_name}': {e}"
         log_ops_event(f"Error contacting model '{model_name}': {e}")
@@ -237,9 +268,7 @@ async def chat(req: ChatRequest):
 @app.get("/health", operation_id="health_check_status")
 async def health_check():
     try:
-        from qdrant_client import QdrantClient
-        client = QdrantClient("localhost", port=6333)
-        collections = client.get_collections().collections
+        collections = (await async_client.get_collections()).collections
         memory_ok = any(c.name == "panai_memory" for c in collections)
     except Exception as e:
         memory_ok = False
@@ -259,8 +288,24 @@ async def health_check():
         "values": identity.get("values", []),
         "uptime_seconds": int(time.time() - start_time),
         "started_at": datetime.fromtimestamp(start_time).isoformat(),
-        "memory_status": "ok" if memory_ok else "missing"
+        "memory_status": "ok" if memory_ok else "missing",
+        "load": inference_router.local_load(),
+    }
+
+# --- Node Readiness Check ---
+@app.get("/ready", operation_id="readiness_check_status")
+async def readiness_check():
+    embedding = model_status()
+    ready = embedding["ready"] and readiness["qdrant_collection"]
+    body = {
+        "ready": ready,
+        "embedding_model": embedding,
+        "qdrant_collection": readiness["qdrant_collection"],
+        "uptime_seconds": int(time.time() - start_time),
     }
+    if not ready:
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "5"})
+    return body
 
 # --- Node Connection Test ---
 class NodePingRequest(BaseModel):
@@ -328,5 +373,10 @@ log_ops_event(f"{resolve_node_name(identity)} startup complete.")
 # --- Shutdown Event Handler ---
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Flush queued memories so the WAL is empty on a clean shutdown.
+    await asyncio.to_thread(ingest_buffer.stop)
+    await async_client.close()
+    await llm_client.aclose()
+    await inference_router.aclose()
     log_shutdown_event("Application shutdown complete.")
     log_ops_event("Application shutdown complete.")
\ No newline at end of file
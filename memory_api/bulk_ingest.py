@@ -0,0 +1,209 @@
+"""Streaming NDJSON bulk ingest.
+
+``/memory/ingest`` accepts one memory per line, either flat
+(``{"text": ..., "session_id": ..., "tags": [...], "vector": [...], "id": ...}``)
+or in the ``export_qdrant_log`` format (``{"id": ..., "vector": [...],
+"payload": {...}}``), so a peer's export can be piped straight back in.
+
+The body is read incrementally. Valid lines are grouped into chunks, lines
+without a vector are embedded together, and each chunk becomes one
+multi-point upsert. The upsert of one chunk overlaps with parsing and
+embedding the next. A result is yielded per line as soon as its chunk is
+committed, so memory use stays bounded by the chunk size, not the body size.
+Line numbers in results count every line of the body, blank ones included.
+If the client goes away mid-body, the chunk already being committed is
+still finished, and lines read but not yet committed are released so a
+retry does not report them as duplicates.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from qdrant_client.http.models import PointStruct
+
+from memory_api.dedup import CONTENT_HASH_FIELD, content_hash, point_id_for_hash
+from memory_api.memory_logger import logger
+
+
+class LineTooLong(ValueError):
+    pass
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without buffering more than one line."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(f"line exceeds {max_line_bytes} bytes")
+    if buffer:
+        yield bytes(buffer)
+
+
+def _valid_point_id(value):
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    if isinstance(value, str):
+        return str(uuid.UUID(value))
+    raise ValueError("id must be a UUID string or a non-negative integer")
+
+
+def parse_ingest_line(raw: bytes, vector_size: int) -> dict:
+    """Turn one NDJSON line into ``{"id", "payload", "vector"}`` or raise ValueError."""
+    try:
+        obj = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}") from e
+    if not isinstance(obj, dict):
+        raise ValueError("line must be a JSON object")
+
+    if not isinstance(obj.get("payload", {}), dict):
+        raise ValueError("'payload' must be an object")
+    fields = {**obj.get("payload", {}), **{k: v for k, v in obj.items() if k not in ("payload", "id", "vector")}}
+    text = fields.get("text")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("missing 'text'")
+    session_id = fields.get("session_id") or "default"
+    tags = fields.get("tags") or []
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise ValueError("'tags' must be a list of strings")
+
+    vector = obj.get("vector")
+    if vector is not None:
+        if not isinstance(vector, list) or len(vector) != vector_size:
+            raise ValueError(f"'vector' must be a list of {vector_size} floats")
+        if not all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in vector):
+            raise ValueError("'vector' must contain only numbers")
+
+    digest = content_hash(session_id, text)
+    point_id = _valid_point_id(obj["id"]) if obj.get("id") is not None else point_id_for_hash(digest)
+    payload = {
+        **fields,
+        "text": text,
+        "session_id": session_id,
+        "tags": sorted(set(tag.lower() for tag in tags)),
+        "timestamp": fields.get("timestamp") or datetime.now(timezone.utc).isoformat(),
+        CONTENT_HASH_FIELD: digest,
+    }
+    return {"id": point_id, "payload": payload, "vector": vector}
+
+
+async def ingest_ndjson(
+    chunks: AsyncIterator[bytes],
+    embed: Callable[[List[str]], Awaitable[List[Optional[list]]]],
+    upsert: Callable[[List[PointStruct]], Awaitable[None]],
+    vector_size: int,
+    chunk_size: int = 256,
+    max_line_bytes: int = 1 << 20,
+    seen: Optional[Callable[[str], bool]] = None,
+    forget: Optional[Callable[[str], None]] = None,
+) -> AsyncIterator[dict]:
+    """Parse, embed and upsert an NDJSON stream; yield one result per line, then a summary.
+
+    ``seen(content_hash)`` returns True for memories already accepted (they
+    are reported as duplicates and skipped); ``forget`` undoes that for lines
+    whose chunk failed so a retry is not mistaken for a duplicate.
+    """
+    started = time.perf_counter()
+    counts = {"lines": 0, "ok": 0, "duplicate": 0, "error": 0, "embedded": 0}
+    line_no = 0
+    chunk: List[tuple] = []
+    pending: Optional[asyncio.Task] = None
+
+    async def commit(batch: List[tuple]) -> List[dict]:
+        missing = [i for i, (_, record) in enumerate(batch) if record["vector"] is None]
+        if missing:
+            try:
+                vectors = await embed([batch[i][1]["payload"]["text"] for i in missing])
+            except Exception as e:
+                logger.error(f"[BulkIngest] Embedding {len(missing)} lines failed: {e}")
+                vectors = [None] * len(missing)
+            for i, vector in zip(missing, vectors):
+                batch[i][1]["vector"] = vector
+            counts["embedded"] += sum(1 for v in vectors if v is not None)
+        ready = [(n, r) for n, r in batch if r["vector"] is not None]
+        results = [
+            {"line": n, "status": "error", "error": "embedding failed"}
+            for n, r in batch if r["vector"] is None
+        ]
+        try:
+            if ready:
+                await upsert([PointStruct(id=r["id"], vector=r["vector"], payload=r["payload"]) for _, r in ready])
+            results += [{"line": n, "status": "ok", "id": r["id"]} for n, r in ready]
+        except Exception as e:
+            results += [{"line": n, "status": "error", "error": f"upsert failed: {e}"} for n, _ in ready]
+        if forget is not None:
+            failed = {res["line"] for res in results if res["status"] == "error"}
+            for n, record in batch:
+                if n in failed:
+                    forget(record["payload"][CONTENT_HASH_FIELD])
+        return sorted(results, key=lambda res: res["line"])
+
+    async def drain() -> List[dict]:
+        nonlocal pending
+        if pending is None:
+            return []
+        results, pending = await asyncio.shield(pending), None
+        for result in results:
+            counts[result["status"]] += 1
+        return results
+
+    try:
+        try:
+            async for raw in iter_ndjson_lines(chunks, max_line_bytes):
+                line_no += 1
+                if not raw.strip():
+                    continue
+                counts["lines"] += 1
+                try:
+                    record = parse_ingest_line(raw, vector_size)
+                except ValueError as e:
+                    counts["error"] += 1
+                    yield {"line": line_no, "status": "error", "error": str(e)}
+                    continue
+                if seen is not None and seen(record["payload"][CONTENT_HASH_FIELD]):
+                    counts["duplicate"] += 1
+                    yield {"line": line_no, "status": "duplicate", "id": record["id"]}
+                    continue
+                chunk.append((line_no, record))
+                if len(chunk) >= chunk_size:
+                    for result in await drain():
+                        yield result
+                    pending, chunk = asyncio.create_task(commit(chunk)), []
+        except LineTooLong as e:
+            counts["error"] += 1
+            yield {"line": line_no + 1, "status": "error", "error": f"{e}; stopped reading"}
+
+        for result in await drain():
+            yield result
+        if chunk:
+            pending, chunk = asyncio.create_task(commit(chunk)), []
+            for result in await drain():
+                yield result
+    finally:
+        # Only reached with work left when the stream broke off (client disconnect, read error).
+        if forget is not None:
+            for _, record in chunk:
+                forget(record["payload"][CONTENT_HASH_FIELD])
+        if pending is not None:
+            # commit() reports its own failures; shielded so a cancelled request still lands the chunk.
+            await asyncio.shield(pending)
+
+    elapsed = time.perf_counter() - started
+    yield {"summary": {**counts, "seconds": round(elapsed, 3),
+                       "lines_per_sec": round(counts["lines"] / elapsed, 1) if elapsed else 0.0}}
+
+
+__all__ = ["iter_ndjson_lines", "parse_ingest_line", "ingest_ndjson", "LineTooLong"]
@@ -0,0 +1,71 @@
+"""Commit stamps: the order in which memories reached the store.
+
+Every write path stamps ``committed_at`` (nanoseconds since the epoch,
+strictly increasing per process) on the points it upserts. A point that is
+already stored keeps its first stamp, so re-delivering or re-tagging a memory
+does not make it new again. ``horizon()`` is the highest stamp at or below
+which every stamped write of this process has landed: a reader paging
+``committed_at > cursor`` up to the horizon never skips a slower write.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
+
+COMMIT_FIELD = "committed_at"
+
+
+def _point_parts(point):
+    if isinstance(point, dict):
+        return point["id"], point["payload"]
+    return point.id, point.payload
+
+
+def stored_stamps(client, collection_name: str, ids: list) -> Dict[str, int]:
+    """``committed_at`` of those ``ids`` that are already stored."""
+    if not ids:
+        return {}
+    records = client.retrieve(collection_name=collection_name, ids=ids, with_payload=[COMMIT_FIELD])
+    return {str(r.id): r.payload[COMMIT_FIELD] for r in records if r.payload and r.payload.get(COMMIT_FIELD)}
+
+
+class CommitClock:
+    """Hands out commit stamps and tracks which of them are still being written."""
+
+    def __init__(self):
+        self._last = 0
+        self._in_flight: Set[int] = set()
+        self._lock = threading.Lock()
+        self.stamped = 0
+
+    @contextmanager
+    def commit(self, points: list, existing: Optional[Dict[str, int]] = None):
+        """Stamp ``points`` (dicts or point structs) for an upsert made inside the block."""
+        existing = existing or {}
+        with self._lock:
+            first = max(time.time_ns(), self._last + 1)
+            self._last = first + len(points) - 1
+            if points:
+                self._in_flight.add(first)
+        for offset, point in enumerate(points):
+            point_id, payload = _point_parts(point)
+            payload[COMMIT_FIELD] = existing.get(str(point_id)) or first + offset
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight.discard(first)
+            self.stamped += len(points)
+
+    def horizon(self) -> int:
+        with self._lock:
+            return min(self._in_flight) - 1 if self._in_flight else self._last
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {"stamped": self.stamped, "batches_in_flight": in_flight, "last_stamp": self._last}
+
+
+__all__ = ["COMMIT_FIELD", "CommitClock", "stored_stamps"]
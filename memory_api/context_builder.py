@@ -0,0 +1,186 @@
+"""Token-budgeted LLM context from a session's memories.
+
+The reflective prompts used to join the first ``limit`` memories a scroll
+returned, whatever their size. Long sessions either got truncated silently by
+Ollama or made it spend most of its time evaluating the prompt.
+``build_context`` instead:
+
+1. ranks candidate memories by relevance (cosine similarity to the session
+   centroid, or MMR when requested) blended with recency (exponential decay
+   on ``timestamp``), and keeps the best ``limit``;
+2. if their text fits ``CONTEXT_TOKEN_BUDGET``, joins them in chronological
+   order;
+3. otherwise it map-reduces. Chronological chunks of about
+   ``CONTEXT_CHUNK_TOKENS`` are summarized in parallel, the summaries are
+   combined, and the combine step repeats until the text fits the budget.
+
+Chunk summaries go through ``generation_cache`` keyed by the chunk's memory
+IDs. Re-running a reflection on a long session only summarizes the chunks
+that changed. Token counts are a characters-per-token estimate
+(``CONTEXT_CHARS_PER_TOKEN``), because the Ollama models do not share one
+tokenizer.
+"""
+
+import asyncio
+import math
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Sequence
+
+import numpy as np
+
+from memory_api.memory_logger import logger
+from memory_api.mmr import mmr_select
+
+MAP_TEMPLATE = (
+    "Summarize these memories from session '{session_id}' in a few sentences. "
+    "Keep names, decisions and open questions:\n\n{combined_text}\n\nSummary:"
+)
+REDUCE_TEMPLATE = (
+    "Combine these partial summaries of session '{session_id}' into one summary. "
+    "Keep names, decisions and open questions:\n\n{combined_text}\n\nSummary:"
+)
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def _age_hours(timestamp: Optional[str], now: datetime) -> Optional[float]:
+    if not timestamp:
+        return None
+    try:
+        moment = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (now - moment).total_seconds() / 3600.0)
+
+
+def rank_memories(points: Sequence, limit: int, recency_weight: float = 0.3, half_life_hours: float = 72.0,
+                  mmr_lambda: Optional[float] = None) -> list:
+    """Return the ``limit`` best points, best first.
+
+    The score is ``(1 - w) * relevance + w * recency``. Relevance is the
+    cosine similarity to the centroid of the candidates' vectors. Recency is
+    ``0.5 ** (age / half_life)``. With ``mmr_lambda`` set, MMR picks from the
+    points that have vectors, so near-duplicates are skipped.
+    """
+    if len(points) <= limit and mmr_lambda is None:
+        return list(points)
+    if mmr_lambda is not None:
+        with_vector = [p for p in points if p.vector]
+        return [with_vector[i] for i in mmr_select([p.vector for p in with_vector], limit, mmr_lambda)]
+
+    now = datetime.now(timezone.utc)
+    ages = [_age_hours((p.payload or {}).get("timestamp"), now) for p in points]
+    recency = np.array([0.0 if a is None else 0.5 ** (a / half_life_hours) for a in ages], dtype=np.float32)
+    relevance = np.zeros(len(points), dtype=np.float32)
+    has_vector = [i for i, p in enumerate(points) if p.vector]
+    if has_vector:
+        vectors = np.asarray([points[i].vector for i in has_vector], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroid = vectors.mean(axis=0)
+        centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+        relevance[has_vector] = vectors @ centroid
+    scores = (1.0 - recency_weight) * relevance + recency_weight * recency
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return [points[i] for i in order]
+
+
+def chronological(points: Sequence) -> list:
+    return sorted(points, key=lambda p: (p.payload or {}).get("timestamp") or "")
+
+
+def chunk_by_tokens(texts: Sequence[str], chunk_tokens: int, chars_per_token: float = 4.0) -> List[List[int]]:
+    """Group consecutive texts into chunks of at most ``chunk_tokens`` (an oversized text is its own chunk)."""
+    chunks, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text, chars_per_token) + 1
+        if current and used + cost > chunk_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def map_reduce(session_id: str, texts: List[str], ids: List, summarize: Callable[[str, str, list], Awaitable[str]],
+                     budget: int, chunk_tokens: int, chars_per_token: float = 4.0, max_rounds: int = 4) -> str:
+    """Summarize ``texts`` chunk by chunk, in parallel, until the result fits ``budget``.
+
+    ``summarize(template, prompt, memory_ids)`` runs one generation. The IDs
+    let it cache the summary of each chunk.
+    """
+    template = MAP_TEMPLATE
+    rounds = 0
+    while True:
+        chunks = chunk_by_tokens(texts, chunk_tokens, chars_per_token)
+        summaries = await asyncio.gather(*[
+            summarize(template,
+                      template.format(session_id=session_id, combined_text="\n".join(texts[i] for i in chunk)),
+                      [ids[i] for i in chunk])
+            for chunk in chunks
+        ])
+        texts = [s.strip() for s in summaries]
+        # A summary is identified by the memories under it, so reduce steps cache too.
+        ids = [",".join(str(ids[i]) for i in chunk) for chunk in chunks]
+        combined = "\n".join(texts)
+        rounds += 1
+        if estimate_tokens(combined, chars_per_token) <= budget or len(texts) == 1 or rounds >= max_rounds:
+            return combined
+        template = REDUCE_TEMPLATE
+
+
+def pack(texts: Sequence[str], budget: int, chars_per_token: float = 4.0) -> List[int]:
+    """Indices of the leading texts that fit ``budget`` (texts are in priority order)."""
+    kept, used = [], 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text, chars_per_token) + 1
+        if used + cost > budget:
+            continue
+        kept.append(i)
+        used += cost
+    return kept
+
+
+async def build_context(session_id: str, points: Sequence, summarize: Callable[[str, str, list], Awaitable[str]],
+                        budget: int, chunk_tokens: int, chars_per_token: float = 4.0) -> dict:
+    """Join the (already ranked) ``points`` into context text within ``budget`` tokens.
+
+    Returns ``{"text", "strategy", "tokens"}``. ``strategy`` is ``"all"`` when
+    everything fit, ``"map_reduce"`` when it was summarized, or ``"packed"``
+    when summarization failed and the best-ranked memories that fit were kept.
+    """
+    ordered = chronological(points)
+    texts = [(p.payload or {}).get("text", "") for p in ordered]
+    combined = "\n".join(texts)
+    tokens = estimate_tokens(combined, chars_per_token)
+    if tokens <= budget:
+        return {"text": combined, "strategy": "all", "tokens": tokens}
+    try:
+        reduced = await map_reduce(session_id, texts, [p.id for p in ordered], summarize,
+                                   budget, chunk_tokens, chars_per_token)
+        reduced = reduced[:int(budget * chars_per_token)]  # still too long after the last round
+        return {"text": reduced, "strategy": "map_reduce", "tokens": estimate_tokens(reduced, chars_per_token)}
+    except Exception as e:
+        logger.warning(f"[Context] Map-reduce for session '{session_id}' failed ({e}); packing instead")
+        ranked_texts = [(p.payload or {}).get("text", "") for p in points]
+        keep = set(pack(ranked_texts, budget, chars_per_token))
+        kept = chronological([p for i, p in enumerate(points) if i in keep])
+        text = "\n".join((p.payload or {}).get("text", "") for p in kept)
+        return {"text": text, "strategy": "packed", "tokens": estimate_tokens(text, chars_per_token)}
+
+
+__all__ = [
+    "build_context",
+    "chunk_by_tokens",
+    "estimate_tokens",
+    "map_reduce",
+    "pack",
+    "rank_memories",
+    "MAP_TEMPLATE",
+    "REDUCE_TEMPLATE",
+]
@@ -0,0 +1,186 @@
+"""Content-hash deduplication for memories.
+
+Every memory carries a ``content_hash`` payload field (SHA-256 of session_id
+and the whitespace-normalized text). The point ID is derived from the same
+hash, so writing the same memory twice is an idempotent upsert rather than a
+scroll-then-insert. A bounded in-process set of recently seen hashes skips
+obvious duplicates before they reach the encoder or Qdrant at all.
+
+Run ``python -m memory_api.dedup`` once to backfill hashes (and deterministic
+IDs) for points written before this scheme existed.
+"""
+
+import argparse
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+
+from qdrant_client.http.models import PayloadSchemaType, PointStruct
+
+from memory_api.embedding_cache import normalize_text
+from memory_api.memory_logger import logger
+
+CONTENT_HASH_FIELD = "content_hash"
+
+
+def content_hash(session_id: str, text: str) -> str:
+    return hashlib.sha256(f"{session_id}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def point_id_for_hash(digest: str) -> str:
+    """Qdrant point IDs must be UUIDs or integers; use the first 128 bits of the hash."""
+    return str(uuid.UUID(digest[:32]))
+
+
+class RecentHashes:
+    """Bounded LRU set of content hashes already stored by this process."""
+
+    def __init__(self, capacity: int = 100000):
+        self.capacity = max(1, capacity)
+        self._hashes: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check_and_add(self, digest: str) -> bool:
+        """Return True if ``digest`` was already seen; record it either way."""
+        with self._lock:
+            if digest in self._hashes:
+                self._hashes.move_to_end(digest)
+                self.hits += 1
+                return True
+            self._hashes[digest] = None
+            if len(self._hashes) > self.capacity:
+                self._hashes.popitem(last=False)
+            self.misses += 1
+            return False
+
+    def seen(self, digest: str) -> bool:
+        """Return True if ``digest`` was already committed (does not record it)."""
+        with self._lock:
+            if digest in self._hashes:
+                self._hashes.move_to_end(digest)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, digests):
+        """Record the hashes of committed memories."""
+        with self._lock:
+            for digest in digests:
+                if not digest:
+                    continue
+                self._hashes[digest] = None
+                self._hashes.move_to_end(digest)
+            while len(self._hashes) > self.capacity:
+                self._hashes.popitem(last=False)
+
+    def discard(self, digest: str):
+        with self._lock:
+            self._hashes.pop(digest, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._hashes),
+            "capacity": self.capacity,
+            "duplicates_skipped": self.hits,
+            "new": self.misses,
+        }
+
+
+def ensure_content_hash_index(client, collection_name: str = "panai_memory"):
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name=CONTENT_HASH_FIELD,
+        field_schema=PayloadSchemaType.KEYWORD,
+    )
+
+
+def migrate_content_hashes(client, collection_name: str = "panai_memory",
+                           batch_size: int = 256, rekey: bool = True, lexical_index=None) -> dict:
+    """Backfill ``content_hash`` on existing points.
+
+    With ``rekey`` the point is re-inserted under its hash-derived ID and the
+    old ID deleted, which also collapses existing exact duplicates. A
+    ``lexical_index`` is re-keyed along with the points.
+    """
+    ensure_content_hash_index(client, collection_name)
+    scanned = backfilled = rekeyed = skipped = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=rekey,
+        )
+        to_upsert, to_delete = [], []
+        stale, reindex = [], []  # lexical entries under an outdated hash, and their replacements
+        for point in points:
+            scanned += 1
+            payload = point.payload or {}
+            text = payload.get("text")
+            if not text:
+                skipped += 1
+                continue
+            digest = content_hash(payload.get("session_id", "default"), text)
+            new_id = point_id_for_hash(digest)
+            if payload.get(CONTENT_HASH_FIELD) == digest and str(point.id) == new_id:
+                continue
+            if payload.get(CONTENT_HASH_FIELD) != digest:
+                stale.append(payload.get(CONTENT_HASH_FIELD))
+                reindex.append({**payload, CONTENT_HASH_FIELD: digest})
+            if rekey and str(point.id) != new_id:
+                if not point.vector:
+                    skipped += 1
+                    continue
+                to_upsert.append(PointStruct(id=new_id, vector=point.vector,
+                                             payload={**payload, CONTENT_HASH_FIELD: digest}))
+                to_delete.append(point.id)
+                rekeyed += 1
+            else:
+                client.set_payload(collection_name=collection_name,
+                                   payload={CONTENT_HASH_FIELD: digest}, points=[point.id])
+                backfilled += 1
+        if to_upsert:
+            client.upsert(collection_name=collection_name, points=to_upsert)
+            client.delete(collection_name=collection_name, points_selector=to_delete)
+        if lexical_index is not None and reindex:
+            lexical_index.remove(stale)
+            lexical_index.add(reindex)
+        if offset is None:
+            break
+    summary = {"scanned": scanned, "backfilled": backfilled, "rekeyed": rekeyed, "skipped": skipped}
+    logger.info(f"[Dedup] Content hash migration finished: {summary}")
+    return summary
+
+
+__all__ = ["CONTENT_HASH_FIELD", "content_hash", "point_id_for_hash", "RecentHashes",
+           "ensure_content_hash_index", "migrate_content_hashes"]
+
+
+def main():
+    from memory_api.lexical_index import LexicalIndex
+    from memory_api.qdrant_interface import create_qdrant_client
+    from services.config import LEXICAL_INDEX_PATH
+
+    parser = argparse.ArgumentParser(description="Backfill content hashes and deterministic IDs in Qdrant.")
+    parser.add_argument("--host", default="localhost", help="Qdrant host (default: localhost)")
+    parser.add_argument("--port", type=int, default=6333, help="Qdrant port (default: 6333)")
+    parser.add_argument("--collection", default="panai_memory", help="Collection name (default: panai_memory)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Points per scroll page (default: 256)")
+    parser.add_argument("--no-rekey", action="store_true", help="Only add the payload field; keep existing IDs")
+    parser.add_argument("--index", default=LEXICAL_INDEX_PATH, help="Lexical index to re-key (SQLite path)")
+    args = parser.parse_args()
+
+    client = create_qdrant_client(args.host, args.port, timeout=60)
+    summary = migrate_content_hashes(client, args.collection, args.batch_size, rekey=not args.no_rekey,
+                                     lexical_index=LexicalIndex(args.index))
+    print(f"Migration complete: {summary}")
+
+
+if __name__ == "__main__":
+    main()
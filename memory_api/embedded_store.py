@@ -0,0 +1,562 @@
+"""Embedded vector store: run the memory API without a Qdrant server.
+
+``EmbeddedClient`` implements the subset of the ``QdrantClient`` interface
+that PanAI uses (upsert, search, search_batch, scroll, count, retrieve,
+delete, set_payload, batch_update_points with set-payload operations,
+collection management). With ``MEMORY_BACKEND=embedded``,
+``qdrant_interface`` hands it out as the shared ``client`` / ``async_client``,
+so no route has to know which backend is active.
+
+Each collection lives in ``EMBEDDED_STORE_PATH``:
+
+- ``<name>.vectors``: a memory-mapped float32 matrix, one row per point.
+  Rows are L2-normalized for cosine distance, and the file doubles in size
+  as the collection grows.
+- ``<name>.payloads.jsonl``: an append-only log of upserts and deletes that
+  is replayed on open and compacted when mostly dead.
+- ``<name>.meta.json``: dimension, distance and row capacity.
+
+``session_id``, ``tags`` and ``content_hash`` have in-memory inverted
+indexes, so filtered searches only score matching rows. Other conditions,
+such as timestamp ranges, are checked against the payloads of those rows.
+Search is exact by default. With ``EMBEDDED_INDEX=ivf``, collections larger
+than ``EMBEDDED_IVF_MIN_POINTS`` also train a k-means inverted-file index and
+probe only the nearest ``EMBEDDED_IVF_NPROBE`` lists.
+
+The store belongs to one process; run uvicorn with a single worker.
+"""
+
+import asyncio
+import functools
+import json
+import math
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from qdrant_client.http.models import (
+    CollectionDescription,
+    CollectionsResponse,
+    CountResult,
+    Record,
+    ScoredPoint,
+    UpdateResult,
+    UpdateStatus,
+)
+
+from memory_api.memory_logger import logger
+
+INDEXED_FIELDS = ("session_id", "tags", "content_hash")
+
+
+def _point_id(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return str(uuid.UUID(str(value)))
+
+
+def _as_dict(model) -> Optional[dict]:
+    if model is None or isinstance(model, dict):
+        return model
+    return model.model_dump(exclude_none=True)
+
+
+def _field(point, name):
+    return point.get(name) if isinstance(point, dict) else getattr(point, name, None)
+
+
+def _comparable(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return value
+    return value
+
+
+class EmbeddedCollection:
+    """One collection: mmap'd vectors, payload log and keyword inverted indexes."""
+
+    def __init__(self, directory: str, name: str, size: Optional[int] = None, distance: str = "Cosine",
+                 index: str = "exact", ivf_min_points: int = 5000, ivf_nprobe: int = 8):
+        self.name = name
+        self.index = index
+        self.ivf_min_points = ivf_min_points
+        self.ivf_nprobe = ivf_nprobe
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(directory, f"{name}.meta.json")
+        self._vectors_path = os.path.join(directory, f"{name}.vectors")
+        self._log_path = os.path.join(directory, f"{name}.payloads.jsonl")
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        elif size is None:
+            raise FileNotFoundError(f"Embedded collection '{name}' does not exist")
+        else:
+            meta = {"size": size, "distance": distance, "capacity": 1024}
+        self.size = meta["size"]
+        self.distance = meta["distance"]
+        self.capacity = meta["capacity"]
+        self._write_meta()
+        self._open_vectors()
+
+        self.ids: List = []  # row -> point id
+        self.payloads: List[Optional[dict]] = []  # row -> payload, None once deleted
+        self.rows: Dict = {}  # point id -> row
+        self.inverted: Dict[str, Dict[str, Set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[Set[int]] = []
+        self._trained_at = 0
+        self._replay()
+        self._log = open(self._log_path, "a", encoding="utf-8")
+
+    # --- persistence -----------------------------------------------------
+
+    def _write_meta(self):
+        with open(self._meta_path, "w", encoding="utf-8") as f:
+            json.dump({"size": self.size, "distance": self.distance, "capacity": self.capacity}, f)
+
+    def _open_vectors(self):
+        needed = self.capacity * self.size * 4
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < needed:
+                f.truncate(needed)
+        self.vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.size))
+
+    def _grow(self, rows_needed: int):
+        if rows_needed <= self.capacity:
+            return
+        self.vectors.flush()
+        del self.vectors
+        while self.capacity < rows_needed:
+            self.capacity *= 2
+        self._write_meta()
+        self._open_vectors()
+
+    def _replay(self):
+        if not os.path.exists(self._log_path):
+            return
+        entries = 0
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"[EmbeddedStore] Skipping unreadable log line in {self._log_path}")
+                    continue
+                entries += 1
+                if op["op"] == "upsert":
+                    self._apply_upsert(op["id"], op["row"], op["payload"])
+                elif op["op"] == "delete":
+                    self._apply_delete(op["id"])
+        live = len(self.rows)
+        if entries > 2 * live + 1000:
+            self._compact()
+
+    def _compact(self):
+        tmp_path = f"{self._log_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for point_id, row in self.rows.items():
+                tmp.write(json.dumps({"op": "upsert", "id": point_id, "row": row, "payload": self.payloads[row]}) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self._log_path)
+
+    def _append(self, ops: Iterable[dict]):
+        for op in ops:
+            self._log.write(json.dumps(op) + "\n")
+        self._log.flush()
+
+    def close(self):
+        with self._lock:
+            self.vectors.flush()
+            self._log.close()
+
+    # --- indexes ---------------------------------------------------------
+
+    def _index(self, row: int, payload: dict, add: bool):
+        for field in INDEXED_FIELDS:
+            values = payload.get(field)
+            if values is None:
+                continue
+            for value in values if isinstance(values, list) else [values]:
+                rows = self.inverted[field].setdefault(str(value), set())
+                if add:
+                    rows.add(row)
+                else:
+                    rows.discard(row)
+
+    def _apply_upsert(self, point_id, row: int, payload: dict):
+        while len(self.ids) <= row:
+            self.ids.append(None)
+            self.payloads.append(None)
+        if self.payloads[row] is not None:
+            self._index(row, self.payloads[row], add=False)
+        self.ids[row] = point_id
+        self.payloads[row] = payload
+        self.rows[point_id] = row
+        self._index(row, payload, add=True)
+
+    def _apply_delete(self, point_id):
+        row = self.rows.pop(point_id, None)
+        if row is None:
+            return
+        self._index(row, self.payloads[row], add=False)
+        self.payloads[row] = None
+        for members in self._lists:
+            members.discard(row)
+
+    # --- writes ----------------------------------------------------------
+
+    def _prepare(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.size,):
+            raise ValueError(f"Vector has dimension {vector.shape[-1] if vector.ndim else 0}, expected {self.size}")
+        if self.distance == "Cosine":
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+        return vector
+
+    def upsert(self, points) -> None:
+        with self._lock:
+            ops = []
+            for point in points:
+                point_id = _point_id(_field(point, "id"))
+                vector = _field(point, "vector")
+                if isinstance(vector, dict):
+                    vector = vector.get("")
+                row = self.rows.get(point_id)
+                if row is None:
+                    row = len(self.ids)
+                    self._grow(row + 1)
+                if vector is not None:
+                    self.vectors[row] = self._prepare(vector)
+                payload = _field(point, "payload") or {}
+                self._apply_upsert(point_id, row, payload)
+                self._assign_ivf(row)
+                ops.append({"op": "upsert", "id": point_id, "row": row, "payload": payload})
+            self.vectors.flush()
+            self._append(ops)
+
+    def delete(self, ids) -> None:
+        with self._lock:
+            ids = [_point_id(i) for i in ids]
+            for point_id in ids:
+                self._apply_delete(point_id)
+            self._append({"op": "delete", "id": point_id} for point_id in ids)
+
+    def set_payload(self, payload: dict, ids) -> None:
+        with self._lock:
+            for point_id in ids:
+                row = self.rows.get(_point_id(point_id))
+                if row is None:
+                    continue
+                self._apply_upsert(self.ids[row], row, {**self.payloads[row], **payload})
+                self._append([{"op": "upsert", "id": self.ids[row], "row": row, "payload": self.payloads[row]}])
+
+    # --- filtering -------------------------------------------------------
+
+    def _all_rows(self) -> Set[int]:
+        return set(self.rows.values())
+
+    def _condition_rows(self, condition: dict, candidates: Set[int]) -> Set[int]:
+        if "must" in condition or "should" in condition or "must_not" in condition:
+            return self._filter_rows(condition, candidates)
+        key = condition.get("key")
+        match = condition.get("match")
+        if key in self.inverted and match is not None:
+            values = match.get("any") if "any" in match else [match.get("value")]
+            hits = set()
+            for value in values:
+                hits |= self.inverted[key].get(str(value), set())
+            return candidates & hits
+        return {row for row in candidates if self._matches(self.payloads[row], condition)}
+
+    @staticmethod
+    def _matches(payload: dict, condition: dict) -> bool:
+        if "is_empty" in condition:
+            value = payload.get(condition["is_empty"].get("key"))
+            return value is None or value == []
+        value = payload.get(condition.get("key"))
+        match = condition.get("match")
+        if match is not None:
+            wanted = match.get("any") if "any" in match else [match.get("value")]
+            values = value if isinstance(value, list) else [value]
+            return any(v in wanted for v in values)
+        bounds = condition.get("range")
+        if bounds is not None:
+            if value is None:
+                return False
+            value = _comparable(value)
+            checks = {"gt": lambda b: value > b, "gte": lambda b: value >= b,
+                      "lt": lambda b: value < b, "lte": lambda b: value <= b}
+            try:
+                return all(checks[op](_comparable(bound)) for op, bound in bounds.items() if op in checks)
+            except TypeError:
+                return False
+        return True
+
+    def _filter_rows(self, query_filter: Optional[dict], candidates: Optional[Set[int]] = None) -> Set[int]:
+        rows = self._all_rows() if candidates is None else candidates
+        if not query_filter:
+            return rows
+        for condition in query_filter.get("must") or []:
+            rows = self._condition_rows(condition, rows)
+        if query_filter.get("should"):
+            rows = set().union(*(self._condition_rows(c, rows) for c in query_filter["should"]))
+        for condition in query_filter.get("must_not") or []:
+            rows = rows - self._condition_rows(condition, rows)
+        return rows
+
+    # --- IVF -------------------------------------------------------------
+
+    def _assign_ivf(self, row: int):
+        if self._centroids is None:
+            return
+        for members in self._lists:
+            members.discard(row)
+        self._lists[int(np.argmax(self._centroids @ self.vectors[row]))].add(row)
+
+    def _train_ivf(self):
+        rows = np.fromiter(self.rows.values(), dtype=np.int64)
+        lists = max(1, int(math.sqrt(len(rows))))
+        data = np.asarray(self.vectors[np.sort(rows)])
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(len(data), lists, replace=False)]
+        for _ in range(10):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(lists):
+                members = data[assignment == c]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    centroids[c] = mean / (np.linalg.norm(mean) or 1.0)
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [set() for _ in range(lists)]
+        for row, c in zip(np.sort(rows), assignment):
+            self._lists[int(c)].add(int(row))
+        self._trained_at = len(rows)
+        logger.info(f"[EmbeddedStore] Trained IVF index for '{self.name}': {lists} lists over {len(rows)} points")
+
+    def _ivf_rows(self, query: np.ndarray) -> Optional[Set[int]]:
+        if self.index != "ivf" or len(self.rows) < self.ivf_min_points:
+            return None
+        if self._centroids is None or len(self.rows) > 2 * self._trained_at:
+            self._train_ivf()
+        nearest = np.argsort(-(self._centroids @ query))[:self.ivf_nprobe]
+        return set().union(*(self._lists[int(c)] for c in nearest))
+
+    # --- reads -----------------------------------------------------------
+
+    def _record(self, row: int, with_payload, with_vectors, score: Optional[float] = None):
+        payload = self.payloads[row] if with_payload else None
+        vector = self.vectors[row].tolist() if with_vectors else None
+        if score is None:
+            return Record(id=self.ids[row], payload=payload, vector=vector)
+        return ScoredPoint(id=self.ids[row], version=0, score=score, payload=payload, vector=vector)
+
+    def search(self, query_vector, query_filter=None, limit: int = 10, offset: int = 0,
+               score_threshold: Optional[float] = None, with_payload=True, with_vectors=False) -> List[ScoredPoint]:
+        with self._lock:
+            query = self._prepare(query_vector)
+            query_filter = _as_dict(query_filter)
+            candidates = self._ivf_rows(query) if not query_filter else None
+            rows = self._filter_rows(query_filter, candidates)
+            if not rows:
+                return []
+            rows = np.fromiter(rows, dtype=np.int64)
+            scores = np.asarray(self.vectors[rows]) @ query
+            if score_threshold is not None:
+                keep = scores >= score_threshold
+                rows, scores = rows[keep], scores[keep]
+            wanted = min(offset + limit, len(rows))
+            if wanted == 0:
+                return []
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            top = top[np.argsort(-scores[top])][offset:]
+            return [self._record(int(rows[i]), with_payload, with_vectors, float(scores[i])) for i in top]
+
+    def scroll(self, scroll_filter=None, limit: int = 10, offset=None, with_payload=True, with_vectors=False,
+               order_by=None):
+        with self._lock:
+            rows = sorted(self._filter_rows(_as_dict(scroll_filter)))
+            if order_by is not None:
+                # Like Qdrant: ordered scrolls return one page, without an offset.
+                order = {"key": order_by} if isinstance(order_by, str) else _as_dict(order_by)
+                present = [r for r in rows if self.payloads[r].get(order["key"]) is not None]
+                present.sort(key=lambda r: self.payloads[r][order["key"]], reverse=order.get("direction") == "desc")
+                return [self._record(r, with_payload, with_vectors) for r in present[:limit]], None
+            start = int(offset or 0)
+            page = [r for r in rows if r >= start][:limit + 1]
+            next_offset = page[limit] if len(page) > limit else None
+            return [self._record(r, with_payload, with_vectors) for r in page[:limit]], next_offset
+
+    def retrieve(self, ids, with_payload=True, with_vectors=False) -> List[Record]:
+        with self._lock:
+            rows = [self.rows.get(_point_id(i)) for i in ids]
+            return [self._record(r, with_payload, with_vectors) for r in rows if r is not None]
+
+    def count(self, count_filter=None) -> int:
+        with self._lock:
+            return len(self._filter_rows(_as_dict(count_filter)))
+
+    def stats(self) -> dict:
+        return {
+            "points": len(self.rows),
+            "rows": len(self.ids),
+            "capacity": self.capacity,
+            "dimension": self.size,
+            "index": self.index,
+            "ivf_lists": len(self._lists),
+        }
+
+
+class EmbeddedClient:
+    """Drop-in for the parts of ``QdrantClient`` PanAI uses, backed by local files."""
+
+    def __init__(self, path: str = "embedded_store", index: str = "exact",
+                 ivf_min_points: int = 5000, ivf_nprobe: int = 8):
+        self.path = path
+        self._options = {"index": index, "ivf_min_points": ivf_min_points, "ivf_nprobe": ivf_nprobe}
+        self._collections: Dict[str, EmbeddedCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _collection(self, name: str) -> EmbeddedCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = EmbeddedCollection(self.path, name, **self._options)
+            return self._collections[name]
+
+    # --- collections -----------------------------------------------------
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections or os.path.exists(
+            os.path.join(self.path, f"{collection_name}.meta.json"))
+
+    def get_collections(self) -> CollectionsResponse:
+        names = {f[:-len(".meta.json")] for f in os.listdir(self.path) if f.endswith(".meta.json")}
+        return CollectionsResponse(collections=[CollectionDescription(name=n) for n in sorted(names | set(self._collections))])
+
+    def get_collection(self, collection_name: str) -> dict:
+        return self._collection(collection_name).stats()
+
+    def create_collection(self, collection_name: str, vectors_config, **_ignored) -> bool:
+        """Create a collection; HNSW, quantization and similar options do not apply here."""
+        with self._lock:
+            self._collections[collection_name] = EmbeddedCollection(
+                self.path, collection_name, size=_field(vectors_config, "size"),
+                distance=str(getattr(_field(vectors_config, "distance"), "value", _field(vectors_config, "distance")) or "Cosine"),
+                **self._options,
+            )
+        return True
+
+    def recreate_collection(self, collection_name: str, vectors_config, **kwargs) -> bool:
+        self.delete_collection(collection_name)
+        return self.create_collection(collection_name, vectors_config, **kwargs)
+
+    def delete_collection(self, collection_name: str) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection is not None:
+                collection.close()
+            for suffix in (".meta.json", ".vectors", ".payloads.jsonl"):
+                path = os.path.join(self.path, f"{collection_name}{suffix}")
+                if os.path.exists(path):
+                    os.remove(path)
+        return True
+
+    def create_payload_index(self, collection_name: str, field_name: str, **_ignored):
+        if field_name not in INDEXED_FIELDS:
+            logger.debug(f"[EmbeddedStore] '{field_name}' is filtered by scanning candidate payloads")
+
+    def ensure_collection(self, schema: dict) -> list:
+        if self.collection_exists(schema["name"]):
+            self._collection(schema["name"])
+            return []
+        self.create_collection(schema["name"], schema["vectors"])
+        return ["created"]
+
+    # --- points ----------------------------------------------------------
+
+    def upsert(self, collection_name: str, points, **_ignored):
+        self._collection(collection_name).upsert(points)
+
+    def delete(self, collection_name: str, points_selector, **_ignored):
+        ids = _field(points_selector, "points") if not isinstance(points_selector, list) else points_selector
+        self._collection(collection_name).delete(ids)
+
+    def set_payload(self, collection_name: str, payload: dict, points, **_ignored):
+        self._collection(collection_name).set_payload(payload, points)
+
+    def batch_update_points(self, collection_name: str, update_operations, **_ignored) -> List[UpdateResult]:
+        """Apply ``SetPayloadOperation``s in order; PanAI sends no other operation types."""
+        collection = self._collection(collection_name)
+        results = []
+        for operation in update_operations:
+            operation = _as_dict(operation)
+            if "set_payload" not in operation:
+                raise NotImplementedError(f"Embedded store does not support {sorted(operation)} in batch_update_points")
+            collection.set_payload(operation["set_payload"]["payload"], operation["set_payload"]["points"])
+            results.append(UpdateResult(operation_id=len(results), status=UpdateStatus.COMPLETED))
+        return results
+
+    def search(self, collection_name: str, query_vector, query_filter=None, limit: int = 10, offset: int = 0,
+               score_threshold=None, with_payload=True, with_vectors=False, **_ignored):
+        return self._collection(collection_name).search(
+            query_vector, query_filter, limit, offset or 0, score_threshold, with_payload, with_vectors)
+
+    def search_batch(self, collection_name: str, requests, **_ignored):
+        collection = self._collection(collection_name)
+        return [
+            collection.search(r.vector, r.filter, r.limit, r.offset or 0, r.score_threshold,
+                              r.with_payload if r.with_payload is not None else True, bool(r.with_vector))
+            for r in requests
+        ]
+
+    def scroll(self, collection_name: str, scroll_filter=None, limit: int = 10, offset=None,
+               with_payload=True, with_vectors=False, order_by=None, **_ignored):
+        return self._collection(collection_name).scroll(scroll_filter, limit, offset, with_payload, with_vectors, order_by)
+
+    def retrieve(self, collection_name: str, ids, with_payload=True, with_vectors=False, **_ignored):
+        return self._collection(collection_name).retrieve(ids, with_payload, with_vectors)
+
+    def count(self, collection_name: str, count_filter=None, exact: bool = True, **_ignored) -> CountResult:
+        return CountResult(count=self._collection(collection_name).count(count_filter))
+
+    def close(self, **_ignored):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.close()
+            self._collections.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "embedded", "path": self.path,
+                "collections": {name: c.stats() for name, c in self._collections.items()}}
+
+
+class AsyncEmbeddedClient:
+    """Async face of an ``EmbeddedClient``; each call runs on a worker thread."""
+
+    def __init__(self, inner: EmbeddedClient):
+        self._inner = inner
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name.startswith("_") or not callable(attr) or name == "stats":
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        return call
+
+
+__all__ = ["EmbeddedClient", "AsyncEmbeddedClient", "EmbeddedCollection"]
@@ -1,16 +1,321 @@
-from sentence_transformers import SentenceTransformer
+"""Text embedding pipeline with a micro-batching encoder front end.
+
+The encoder backend (see ``embedding_backends``) is loaded lazily, either by
+the first embed call or by ``start_warmup()`` on a background thread, so
+importing this module stays cheap and the API can accept connections
+immediately.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from memory_api.embedding_backends import EmbeddingBackend, create_backend
+from memory_api.embedding_cache import EmbeddingCache
+from memory_api.executors import run_embedding
+from memory_api.memory_logger import logger
+from services.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MEMORY_ITEMS,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANTIZE,
+    EMBEDDING_TIMEOUT,
+    NUM_THREADS,
+)
+
+# all-mpnet-base-v2 model for embedding (768-dimension)
+EMBED_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+backend: EmbeddingBackend = create_backend(
+    EMBEDDING_BACKEND,
+    EMBED_MODEL_NAME,
+    num_threads=NUM_THREADS,
+    onnx_dir=EMBEDDING_ONNX_DIR,
+    quantize=EMBEDDING_ONNX_QUANTIZE,
+)
+
+_backend_loaded = False
+_model_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_model_ready = threading.Event()
+_model_error: Optional[str] = None
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def get_backend() -> EmbeddingBackend:
+    """Return the configured embedding backend, loading it on first use."""
+    global _backend_loaded, _model_error
+    if _backend_loaded:
+        return backend
+    with _model_lock:
+        if not _backend_loaded:
+            started = time.monotonic()
+            try:
+                backend.load()
+            except Exception as e:
+                _model_error = str(e)
+                logger.error(f"[Embedding] Failed to load {backend.cache_name}: {e}")
+                raise
+            _backend_loaded = True
+            _model_error = None
+            _model_ready.set()
+            logger.info(f"[Embedding] Loaded {backend.cache_name} in {time.monotonic() - started:.1f}s")
+    return backend
+
+
+def _warmup():
+    try:
+        get_backend().encode(["warmup"])
+    except Exception:
+        pass  # already logged by get_backend; the next embed call retries
+
+
+def start_warmup() -> threading.Thread:
+    """Load the embedding model on a background thread (idempotent)."""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None or (not _warmup_thread.is_alive() and not _model_ready.is_set()):
+            _warmup_thread = threading.Thread(target=_warmup, name="embedding-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def is_ready() -> bool:
+    return _model_ready.is_set()
+
+
+def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    """Block until the model is loaded, starting the warm-up if needed."""
+    if _model_ready.is_set():
+        return True
+    start_warmup()
+    return _model_ready.wait(timeout)
+
+
+def model_status() -> dict:
+    return {
+        "model": EMBED_MODEL_NAME,
+        "backend": backend.cache_name,
+        "ready": is_ready(),
+        "loading": _warmup_thread is not None and _warmup_thread.is_alive(),
+        "error": _model_error,
+    }
+
+
+def _encode_batch(texts: List[str]) -> List[list]:
+    return get_backend().encode(texts).tolist()
+
+
+class EmbeddingBatcher:
+    """Collect concurrent embed requests and encode them in bounded batches.
+
+    A single worker thread drains the request queue. Each batch closes when it
+    reaches ``max_batch_size`` texts or when ``max_wait_ms`` has passed since
+    the first request of the batch arrived, whichever comes first.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], List[list]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[tuple[str, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._encode_time = 0.0
+        self._errors = 0
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        """Queue texts for embedding and return one future per text."""
+        self._ensure_worker()
+        futures = []
+        now = time.monotonic()
+        for text in texts:
+            fut: Future = Future()
+            self._queue.put((text, fut, now))
+            futures.append(fut)
+        return futures
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Drop requests whose caller has gone; the rest can no longer be cancelled.
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.monotonic()
+            texts = [text for text, _, _ in batch]
+            waits = [started - enqueued for _, _, enqueued in batch]
+            try:
+                vectors = self.encode_fn(texts)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"encoder returned {len(vectors)} vectors for {len(batch)} texts")
+                for (_, fut, _), vector in zip(batch, vectors):
+                    fut.set_result(vector)
+                failed = False
+            except Exception as e:
+                logger.error(f"[Embedding] Batch of {len(texts)} failed: {e}")
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                failed = True
+            self._record(len(batch), waits, time.monotonic() - started, failed)
+
+    def _record(self, size: int, waits: List[float], encode_time: float, failed: bool):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._max_batch = max(self._max_batch, size)
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._encode_time += encode_time
+            if failed:
+                self._errors += 1
+
+    def stats(self) -> dict:
+        """Return batch-size and queue-wait statistics since startup."""
+        with self._stats_lock:
+            batches = self._batches or 1
+            items = self._items or 1
+            return {
+                "batches": self._batches,
+                "texts": self._items,
+                "failed_batches": self._errors,
+                "queue_depth": self._queue.qsize(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "avg_batch_size": round(self._items / batches, 2),
+                "largest_batch": self._max_batch,
+                "avg_queue_wait_ms": round(self._total_wait / items * 1000, 3),
+                "max_queue_wait_ms": round(self._max_wait_seen * 1000, 3),
+                "avg_encode_ms_per_batch": round(self._encode_time / batches * 1000, 3),
+                "avg_encode_ms_per_text": round(self._encode_time / items * 1000, 3),
+            }
+
+    def avg_encode_seconds_per_text(self) -> float:
+        with self._stats_lock:
+            return self._encode_time / self._items if self._items else 0.0
+
+
+batcher = EmbeddingBatcher(
+    _encode_batch,
+    max_batch_size=EMBEDDING_BATCH_SIZE,
+    max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+)
+
+cache = EmbeddingCache(
+    backend.cache_name,
+    path=EMBEDDING_CACHE_PATH,
+    max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+) if EMBEDDING_CACHE_ENABLED else None
+
+
+def _submit_uncached(texts: List[str]) -> tuple[List[Optional[list]], List[int], List[Future]]:
+    """Serve what we can from the cache and queue the rest on the batcher."""
+    cached = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing = [i for i, v in enumerate(cached) if v is None]
+    futures = batcher.submit([texts[i] for i in missing]) if missing else []
+    return cached, missing, futures
+
+
+def _store(texts: List[str], vectors: List[Optional[list]]):
+    if cache is not None and texts:
+        cache.put_many(texts, vectors)
+
+
+def _check_vector(vector, text: str):
+    if not vector or len(vector) != 768:
+        print(f"[Embedding ERROR] Invalid vector — len={len(vector) if vector else 'None'} — text='{text[:50]}'")
+    else:
+        print(f"[Embedding OK] Vector len={len(vector)} for text: '{text[:50]}'")
 
-# Load all-mpnet-base-v2 model for embedding (768-dimension)
-embed_model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
 
 def embed_text(text: str) -> list:
     try:
-        vector = embed_model.encode(text, normalize_embeddings=True).tolist()
-        if not vector or len(vector) != 768:
-            print(f"[Embedding ERROR] Invalid vector — len={len(vector) if vector else 'None'} — text='{text[:50]}'")
-        else:
-            print(f"[Embedding OK] Vector len={len(vector)} for text: '{text[:50]}'")
+        cached, _, futures = _submit_uncached([text])
+        vector = cached[0]
+        if vector is None:
+            vector = futures[0].result(timeout=EMBEDDING_TIMEOUT)
+            _store([text], [vector])
+        _check_vector(vector, text)
         return vector
     except Exception as e:
         print(f"[Embedding EXCEPTION] Failed to embed: {text[:50]} — {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def embed_batch(texts: List[str]) -> List[Optional[list]]:
+    """Embed several texts through the cache and batcher, blocking until done.
+
+    Failed texts come back as ``None`` so callers can skip them individually.
+    """
+    vectors, missing, futures = _submit_uncached(texts)
+    deadline = time.monotonic() + EMBEDDING_TIMEOUT
+    for i, fut in zip(missing, futures):
+        try:
+            vectors[i] = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+        except Exception as e:
+            print(f"[Embedding EXCEPTION] Failed to embed: {texts[i][:50]} — {e}")
+    _store([texts[i] for i in missing], [vectors[i] for i in missing])
+    return vectors
+
+
+async def embed_texts(texts: List[str]) -> List[Optional[list]]:
+    """Async counterpart of ``embed_batch`` that never blocks the event loop."""
+    vectors, missing, futures = await run_embedding(_submit_uncached, texts)
+    results = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures), return_exceptions=True)
+    for i, result in zip(missing, results):
+        if isinstance(result, Exception):
+            print(f"[Embedding EXCEPTION] Failed to embed: {texts[i][:50]} — {result}")
+        else:
+            vectors[i] = result
+    if missing:
+        await run_embedding(_store, [texts[i] for i in missing], [vectors[i] for i in missing])
+    return vectors
+
+
+def embedding_stats() -> dict:
+    return {
+        "model": model_status(),
+        "batcher": batcher.stats(),
+        "cache": cache.stats(batcher.avg_encode_seconds_per_text()) if cache is not None else {"enabled": False},
+    }
+
+
+__all__ = ["get_backend", "start_warmup", "is_ready", "wait_until_ready", "model_status", "embed_text", "embed_batch", "embed_texts", "embedding_stats", "EmbeddingBatcher"]
@@ -0,0 +1,282 @@
+"""Pluggable embedding backends and an fp32 parity check.
+
+``sentence-transformers`` (PyTorch, fp32) is the default backend. The ``onnx``
+backend runs the same model through ONNX Runtime. It exports the transformer
+once to ``EMBEDDING_ONNX_DIR`` and can apply dynamic int8 quantization, which
+is usually much faster on the CPU-only seed nodes. Both backends return
+mean-pooled, L2-normalized vectors, so they can be swapped without touching
+the collection.
+
+Run ``python -m memory_api.embedding_backends`` to compare a candidate
+backend against the fp32 reference before switching a node over.
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from memory_api.memory_logger import logger
+
+
+class EmbeddingBackend:
+    """Interface every embedding backend implements."""
+
+    name = "base"
+
+    def __init__(self, model_name: str, num_threads: Optional[int] = None):
+        self.model_name = model_name
+        self.num_threads = num_threads
+
+    @property
+    def cache_name(self) -> str:
+        """Identifier used to key cached vectors produced by this backend."""
+        return f"{self.model_name}@{self.name}"
+
+    def load(self):
+        raise NotImplementedError
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Return an (n, dim) float32 array of normalized embeddings."""
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """PyTorch fp32 SentenceTransformer encoder (the original code path)."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str, num_threads: Optional[int] = None):
+        super().__init__(model_name, num_threads)
+        self.model = None
+
+    @property
+    def cache_name(self) -> str:
+        # Keep the plain model name so existing cache entries stay valid.
+        return self.model_name
+
+    def load(self):
+        import torch
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)  # Reserve 1–2 threads for system processes
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name)
+        return self
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True),
+            dtype=np.float32,
+        )
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime encoder, optionally with dynamic int8 weight quantization."""
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, num_threads: Optional[int] = None,
+                 onnx_dir: str = "models/onnx", quantize: bool = True):
+        super().__init__(model_name, num_threads)
+        self.onnx_dir = onnx_dir
+        self.quantize = quantize
+        self.session = None
+        self.tokenizer = None
+        self.max_length = 384
+
+    @property
+    def cache_name(self) -> str:
+        return f"{self.model_name}@onnx-{'int8' if self.quantize else 'fp32'}"
+
+    @property
+    def fp32_path(self) -> str:
+        return os.path.join(self.onnx_dir, "model.onnx")
+
+    @property
+    def int8_path(self) -> str:
+        return os.path.join(self.onnx_dir, "model.int8.onnx")
+
+    def export(self):
+        """Export the transformer behind the SentenceTransformer model to ONNX."""
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        os.makedirs(self.onnx_dir, exist_ok=True)
+        st_model = SentenceTransformer(self.model_name, device="cpu")
+        transformer = st_model[0]
+        transformer.tokenizer.save_pretrained(self.onnx_dir)
+        with open(os.path.join(self.onnx_dir, "export.json"), "w") as f:
+            json.dump({"model": self.model_name, "max_length": st_model.max_seq_length}, f)
+
+        auto_model = transformer.auto_model.eval()
+        sample = transformer.tokenizer(["export sample"], return_tensors="pt")
+        with torch.no_grad():
+            torch.onnx.export(
+                auto_model,
+                (sample["input_ids"], sample["attention_mask"]),
+                self.fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=14,
+            )
+        logger.info(f"[Embedding] Exported {self.model_name} to {self.fp32_path}")
+
+    def quantize_model(self):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(self.fp32_path, self.int8_path, weight_type=QuantType.QInt8)
+        logger.info(f"[Embedding] Wrote int8 model to {self.int8_path}")
+
+    def load(self):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "The onnx embedding backend needs 'onnxruntime' (pip install onnxruntime)"
+            ) from e
+
+        if not os.path.exists(self.fp32_path):
+            self.export()
+        if self.quantize and not os.path.exists(self.int8_path):
+            self.quantize_model()
+
+        export_info = os.path.join(self.onnx_dir, "export.json")
+        if os.path.exists(export_info):
+            with open(export_info) as f:
+                self.max_length = json.load(f).get("max_length", self.max_length)
+
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        path = self.int8_path if self.quantize else self.fp32_path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(self.onnx_dir)
+        return self
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+        )
+        mask = tokens["attention_mask"].astype(np.int64)
+        hidden = self.session.run(
+            ["last_hidden_state"],
+            {"input_ids": tokens["input_ids"].astype(np.int64), "attention_mask": mask},
+        )[0]
+        # Mean pooling over real tokens, then L2 normalization (matches the
+        # Pooling + Normalize modules of the SentenceTransformer pipeline).
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name: str, model_name: str, num_threads: Optional[int] = None,
+                   onnx_dir: str = "models/onnx", quantize: bool = True) -> EmbeddingBackend:
+    """Build (but do not load) the backend selected by ``name``."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    if name == OnnxBackend.name:
+        return OnnxBackend(model_name, num_threads, onnx_dir=onnx_dir, quantize=quantize)
+    return BACKENDS[name](model_name, num_threads)
+
+
+def _timed_encode(backend: EmbeddingBackend, texts: List[str], batch_size: int) -> tuple[np.ndarray, float]:
+    backend.encode(texts[:batch_size])  # warm-up, excluded from timing
+    started = time.perf_counter()
+    chunks = [backend.encode(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+    return np.vstack(chunks), time.perf_counter() - started
+
+
+def check_backend_parity(candidate: EmbeddingBackend, reference: EmbeddingBackend,
+                         texts: List[str], batch_size: int = 32, k: int = 10) -> dict:
+    """Compare a candidate backend against the fp32 reference on ``texts``.
+
+    Reports the per-text cosine similarity between the two embeddings, the
+    overlap of each text's top-k neighbours within the sample (a proxy for
+    recall being unchanged), and the throughput of both backends.
+    """
+    ref_vecs, ref_time = _timed_encode(reference, texts, batch_size)
+    cand_vecs, cand_time = _timed_encode(candidate, texts, batch_size)
+    cosine = np.sum(ref_vecs * cand_vecs, axis=1)
+
+    k = max(1, min(k, len(texts) - 1))
+    overlap = []
+    if len(texts) > 1:
+        ref_sims = ref_vecs @ ref_vecs.T
+        cand_sims = cand_vecs @ cand_vecs.T
+        np.fill_diagonal(ref_sims, -np.inf)
+        np.fill_diagonal(cand_sims, -np.inf)
+        ref_top = np.argsort(-ref_sims, axis=1)[:, :k]
+        cand_top = np.argsort(-cand_sims, axis=1)[:, :k]
+        overlap = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+
+    return {
+        "texts": len(texts),
+        "reference": reference.cache_name,
+        "candidate": candidate.cache_name,
+        "cosine_mean": round(float(cosine.mean()), 6),
+        "cosine_min": round(float(cosine.min()), 6),
+        f"neighbour_overlap_at_{k}": round(float(np.mean(overlap)), 4) if overlap else None,
+        "reference_texts_per_sec": round(len(texts) / ref_time, 1),
+        "candidate_texts_per_sec": round(len(texts) / cand_time, 1),
+        "speedup": round(ref_time / cand_time, 2),
+    }
+
+
+def _load_sample_texts(log_path: str, limit: int) -> List[str]:
+    from memory_api.log_pruner import load_memory_log
+    entries = load_memory_log(log_path)
+    texts = [e.get("text") for e in entries if isinstance(e, dict) and e.get("text")]
+    return texts[:limit]
+
+
+def main():
+    from services.config import (
+        EMBEDDING_BACKEND,
+        EMBEDDING_ONNX_DIR,
+        EMBEDDING_ONNX_QUANTIZE,
+        NUM_THREADS,
+    )
+    from memory_api.embedding import EMBED_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Compare an embedding backend against the fp32 SentenceTransformer encoder.")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND if EMBEDDING_BACKEND != "sentence-transformers" else "onnx",
+                        choices=list(BACKENDS), help="Candidate backend (default: onnx)")
+    parser.add_argument("--no-quantize", action="store_true", help="Use the fp32 ONNX model instead of int8")
+    parser.add_argument("--log", default="memory_log.json", help="Memory log to sample texts from")
+    parser.add_argument("--limit", type=int, default=500, help="Number of texts to compare (default: 500)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Encoder batch size (default: 32)")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Fail if mean cosine drops below this")
+    args = parser.parse_args()
+
+    texts = _load_sample_texts(args.log, args.limit)
+    if len(texts) < 2:
+        parser.error(f"Need at least two texts in {args.log} to run a parity check")
+
+    quantize = EMBEDDING_ONNX_QUANTIZE and not args.no_quantize
+    reference = create_backend("sentence-transformers", EMBED_MODEL_NAME, NUM_THREADS).load()
+    candidate = create_backend(args.backend, EMBED_MODEL_NAME, NUM_THREADS,
+                               onnx_dir=EMBEDDING_ONNX_DIR, quantize=quantize).load()
+    report = check_backend_parity(candidate, reference, texts, batch_size=args.batch_size)
+    print(json.dumps(report, indent=2))
+    if report["cosine_mean"] < args.min_cosine:
+        raise SystemExit(f"Parity check failed: mean cosine {report['cosine_mean']} < {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
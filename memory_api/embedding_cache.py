@@ -0,0 +1,151 @@
+"""Content-addressed embedding cache with an in-memory LRU tier and a SQLite tier.
+
+Vectors are keyed by a SHA-256 of the model name and the whitespace-normalized
+text, so the same memory re-logged, re-synced from a peer or re-embedded from
+the log never hits the encoder twice, including across restarts.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from memory_api.memory_logger import logger
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier vector cache: bounded LRU dict in front of a SQLite table."""
+
+    def __init__(self, model_name: str, path: Optional[str] = "embedding_cache.sqlite3",
+                 max_memory_items: int = 10000):
+        self.model_name = model_name
+        self.max_memory_items = max(0, max_memory_items)
+        self._memory: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.writes = 0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, "
+                    "vector BLOB NOT NULL, created REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[EmbeddingCache] Disk tier disabled, could not open {path}: {e}")
+                self._db = None
+
+    def _remember(self, key: str, vector: list):
+        if self.max_memory_items == 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[list]]:
+        """Return cached vectors in input order, ``None`` for misses."""
+        keys = [cache_key(self.model_name, t) for t in texts]
+        found: List[Optional[list]] = [None] * len(texts)
+        with self._lock:
+            disk_lookup = []
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self.hits_memory += 1
+                else:
+                    disk_lookup.append(i)
+            if disk_lookup and self._db is not None:
+                wanted = {keys[i] for i in disk_lookup}
+                placeholders = ",".join("?" * len(wanted))
+                try:
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        tuple(wanted),
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    logger.warning(f"[EmbeddingCache] Disk lookup failed: {e}")
+                    rows = []
+                from_disk = {k: np.frombuffer(blob, dtype=np.float32).tolist() for k, blob in rows}
+                for i in disk_lookup:
+                    vector = from_disk.get(keys[i])
+                    if vector is not None:
+                        found[i] = vector
+                        self._remember(keys[i], vector)
+                        self.hits_disk += 1
+            self.misses += sum(1 for v in found if v is None)
+        return found
+
+    def put_many(self, texts: List[str], vectors: List[Optional[list]]):
+        """Store freshly encoded vectors in both tiers, skipping failed ones."""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                if not vector:
+                    continue
+                key = cache_key(self.model_name, text)
+                self._remember(key, vector)
+                blob = np.asarray(vector, dtype=np.float32).tobytes()
+                rows.append((key, self.model_name, len(vector), blob, time.time()))
+            if rows and self._db is not None:
+                try:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"[EmbeddingCache] Disk write failed: {e}")
+            self.writes += len(rows)
+
+    def disk_entries(self) -> int:
+        if self._db is None:
+            return 0
+        with self._lock:
+            try:
+                return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            except sqlite3.Error:
+                return 0
+
+    def stats(self, avg_encode_seconds_per_text: float = 0.0) -> dict:
+        """Hit/miss counters plus an estimate of encoder time saved by hits."""
+        hits = self.hits_memory + self.hits_disk
+        lookups = hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "memory_entries": len(self._memory),
+            "memory_capacity": self.max_memory_items,
+            "disk_entries": self.disk_entries(),
+            "disk_enabled": self._db is not None,
+            "est_encoder_seconds_saved": round(hits * avg_encode_seconds_per_text, 3),
+        }
+
+
+__all__ = ["EmbeddingCache", "cache_key", "normalize_text"]
@@ -0,0 +1,133 @@
+"""
+Bounded thread pool for CPU-bound embedding work and an event-loop lag monitor.
+"""
+
+import asyncio
+import functools
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from memory_api.memory_logger import logger
+from services.config import (
+    EMBED_EXECUTOR_WORKERS,
+    EXECUTOR_MAX_PENDING,
+    LOOP_LAG_INTERVAL_MS,
+)
+
+
+class BoundedExecutor:
+    """Thread pool with an async front end that limits in-flight submissions."""
+
+    def __init__(self, name: str, max_workers: int, max_pending: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_slot_wait = 0.0
+        self.total_run_time = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        self.total_slot_wait += started - queued
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_run_time += time.perf_counter() - started
+            self._slots.release()
+
+    def stats(self) -> dict:
+        done = self.completed or 1
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "waiting_for_slot": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_slot_wait_ms": round(self.total_slot_wait / done * 1000, 3),
+            "avg_run_ms": round(self.total_run_time / done * 1000, 3),
+        }
+
+
+embedding_executor = BoundedExecutor("embed", EMBED_EXECUTOR_WORKERS, EXECUTOR_MAX_PENDING)
+
+
+async def run_embedding(fn: Callable, *args, **kwargs):
+    """Run CPU-bound embedding work off the event loop."""
+    return await embedding_executor.run(fn, *args, **kwargs)
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up from a fixed-interval sleep."""
+
+    def __init__(self, interval: float, window: int = 1200):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > 0.5:
+                logger.warning(f"[EventLoop] Loop was blocked for {lag * 1000:.0f} ms")
+
+    def start(self) -> asyncio.Task:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        return self.task
+
+    def stats(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"samples": 0, "interval_ms": self.interval * 1000}
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return {
+            "samples": len(samples),
+            "interval_ms": self.interval * 1000,
+            "last_lag_ms": round(self.samples[-1] * 1000, 3),
+            "mean_lag_ms": round(statistics.fmean(samples) * 1000, 3),
+            "p99_lag_ms": round(p99 * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL_MS / 1000.0)
+
+
+def executor_stats() -> dict:
+    return {
+        "event_loop_lag": loop_lag_monitor.stats(),
+        "embedding_executor": embedding_executor.stats(),
+    }
+
+
+__all__ = ["BoundedExecutor", "run_embedding", "loop_lag_monitor", "executor_stats"]
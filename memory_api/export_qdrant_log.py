@@ -1,32 +1,23 @@
 import argparse
 import json
-from qdrant_client import QdrantClient
+
+from memory_api.qdrant_interface import create_qdrant_client
 
 def export_memories(output_file, host='localhost', port=6333, collection_name='memory'):
-    client = QdrantClient(host=host, port=port, timeout=60.0)
-    scroll_filter = {}
+    client = create_qdrant_client(host, port, timeout=60)
 
     total_exported = 0
     offset = None
     with open(output_file, 'w') as f:
         while True:
-            for attempt in range(3):
-                try:
-                    result, next_page = client.scroll(
-                        collection_name=collection_name,
-                        filter=scroll_filter,
-                        offset=offset,
-                        with_payload=True,
-                        with_vectors=True,
-                        limit=100
-                    )
-                    break
-                except Exception:
-                    if attempt == 2:
-                        raise
-                    print(f"[Warning] Scroll failed (attempt {attempt + 1}/3), retrying in 5s...")
-                    import time
-                    time.sleep(5)
+            # Transient failures are retried with backoff by the client wrapper.
+            result, next_page = client.scroll(
+                collection_name=collection_name,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+                limit=100
+            )
             if not result:
                 break
             for point in result:
@@ -0,0 +1,124 @@
+"""Response cache for LLM-generated reflections, summaries, plans and dreams.
+
+The reflective endpoints send a whole session's memories to Ollama, which
+takes tens of seconds of CPU, even when nothing has changed since the last
+call. Responses are cached under (model, prompt template, session, hash of
+the IDs of the memories the prompt was built from), with a TTL and LRU
+eviction. The same memories under the same template reproduce the same
+prompt, so the cached answer is returned at once.
+
+An optional similarity mode (``similarity`` > 0) also reuses an answer when a
+new prompt's embedding is at least that cosine-similar to a cached prompt for
+the same model, template and session. This covers near-identical prompts, such as a
+session that only gained a memory that barely changes the context.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+def generation_key(model: str, template: str, session_id: str, memory_ids: Sequence) -> str:
+    ids = "\x1f".join(str(i) for i in memory_ids)
+    return hashlib.sha256(f"{model}\x00{template}\x00{session_id}\x00{ids}".encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """TTL + LRU cache of generated text with optional prompt-similarity lookup."""
+
+    def __init__(self, max_items: int = 256, ttl: float = 3600.0, similarity: float = 0.0, enabled: bool = True):
+        self.max_items = max(0, max_items)
+        self.ttl = ttl
+        self.similarity = similarity
+        self.enabled = enabled and self.max_items > 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.writes = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.enabled and self.similarity > 0
+
+    def _expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["stored_at"] > self.ttl
+
+    def get(self, key: str, model: str, template: str, session_id: str,
+            vector: Optional[list] = None) -> Optional[str]:
+        """Return a cached response for ``key``, or for a similar prompt when ``vector`` is given."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["response"]
+            if vector is not None and self.similarity > 0:
+                match = self._most_similar(model, template, session_id, vector)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match]["response"]
+            self.misses += 1
+            return None
+
+    def _most_similar(self, model: str, template: str, session_id: str, vector: list) -> Optional[str]:
+        keys = [k for k, e in self._entries.items()
+                if e["model"] == model and e["template"] == template and e["session_id"] == session_id
+                and e["vector"] is not None and not self._expired(e)]
+        if not keys:
+            return None
+        matrix = np.asarray([self._entries[k]["vector"] for k in keys], dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = (matrix @ query) / np.where(norms == 0, 1.0, norms)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def put(self, key: str, model: str, template: str, session_id: str, response: str,
+            vector: Optional[list] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = {
+                "model": model,
+                "template": template,
+                "session_id": session_id,
+                "response": response,
+                "vector": vector,
+                "stored_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            self.writes += 1
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def note_refresh(self):
+        self.refreshes += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "capacity": self.max_items,
+            "ttl_seconds": self.ttl,
+            "similarity_threshold": self.similarity if self.semantic else None,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "forced_refreshes": self.refreshes,
+            "hit_rate": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+        }
+
+
+__all__ = ["GenerationCache", "generation_key"]
@@ -0,0 +1,258 @@
+"""Write-behind ingest buffer for memories.
+
+Accepted memories are appended to a small write-ahead log (WAL) and queued in
+RAM. A background thread flushes the queue when it reaches ``max_batch`` items
+or when ``flush_interval`` seconds have passed. Each flush embeds all queued
+texts in one encoder batch and writes them to ``panai_memory`` with a single
+multi-point upsert, stamped by ``commit_clock``. A record leaves the WAL only
+once its upsert succeeds; one that fails to embed stays queued and is retried
+with exponential backoff. A record submitted again under a queued ID
+replaces the queued one, and every caller waiting on that ID is resolved
+by the flush that writes it.
+The WAL is compacted after every flush and replayed on startup, so writes
+that were accepted before a crash are never lost.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from qdrant_client.http.models import PointStruct
+
+from memory_api.commit_clock import CommitClock, stored_stamps
+from memory_api.memory_logger import logger
+
+
+class MemoryNotCommitted(RuntimeError):
+    """A submitted record is safe in the WAL but was not committed within the wait."""
+
+    def __init__(self, record_id: str, cause: Exception):
+        super().__init__(f"{cause}")
+        self.record_id = record_id
+
+
+class IngestBuffer:
+    """Batch memories into multi-point upserts with WAL-backed durability."""
+
+    max_retry_delay = 60.0  # seconds between embedding retries of one record, at most
+
+    def __init__(self, client, embed_batch: Callable[[List[str]], List[Optional[list]]],
+                 wal_path: str = "ingest_wal.jsonl", max_batch: int = 64,
+                 flush_interval: float = 0.5, collection_name: str = "panai_memory",
+                 on_commit: Optional[Callable[[List[dict]], None]] = None,
+                 commit_clock: Optional[CommitClock] = None):
+        self.client = client
+        self.embed_batch = embed_batch
+        self.wal_path = wal_path
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.collection_name = collection_name
+        self.on_commit = on_commit
+        self.commit_clock = commit_clock or CommitClock()
+        self._pending: Dict[str, dict] = {}  # record id -> newest record; a resubmission replaces it
+        self._futures: Dict[str, List[Future]] = {}  # record id -> every caller waiting on it
+        self._retries: dict = {}  # record id -> (failed attempts, monotonic time of next attempt)
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wal = None
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = False
+        self._retry_backoff = False
+        self.flushes = 0
+        self.committed = 0
+        self.failed_flushes = 0
+        self.embed_failures = 0
+        self.last_flush_ms = 0.0
+
+    # --- lifecycle -------------------------------------------------------
+
+    def start(self):
+        """Replay the WAL and start the flush thread (idempotent)."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            replayed = self._replay_wal()
+            self._wal = open(self.wal_path, "a", encoding="utf-8")
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="ingest-buffer", daemon=True)
+            self._worker.start()
+        if replayed:
+            logger.info(f"[Ingest] Replayed {replayed} uncommitted memories from {self.wal_path}")
+
+    def stop(self, timeout: float = 30.0):
+        """Flush whatever is queued and stop the flush thread."""
+        with self._lock:
+            self._stopping = True
+            self._wake.notify()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        self.flush_all()
+
+    def _replay_wal(self) -> int:
+        if not os.path.exists(self.wal_path):
+            return 0
+        replayed = 0
+        with open(self.wal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self._pending[record["id"]] = record
+                    replayed += 1
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; nothing was acknowledged for it.
+                    logger.warning(f"[Ingest] Skipping unreadable WAL line in {self.wal_path}")
+        return replayed
+
+    # --- submission ------------------------------------------------------
+
+    def submit(self, record: dict) -> Future:
+        """Durably queue a record and return a future resolved on commit.
+
+        ``record`` is ``{"id": ..., "payload": {...}}``; the vector is computed
+        at flush time. An optional ``"vector"`` skips embedding for that record.
+        """
+        self.start()
+        fut: Future = Future()
+        line = json.dumps(record)
+        with self._lock:
+            self._wal.write(line + "\n")
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._pending[record["id"]] = record
+            self._futures.setdefault(record["id"], []).append(fut)
+            if len(self._pending) >= self.max_batch:
+                self._wake.notify()
+        return fut
+
+    # --- flushing --------------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopping and (self._retry_backoff or len(self._pending) < self.max_batch):
+                    self._wake.wait(self.flush_interval)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def flush(self) -> int:
+        """Embed and upsert up to ``max_batch`` queued records; return count committed."""
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                batch = [r for r in self._pending.values()
+                         if self._retries.get(r["id"], (0, 0.0))[1] <= now][:self.max_batch]
+                # Callers who submit during this flush wait for the next one.
+                waiting = {r["id"]: self._futures.pop(r["id"], []) for r in batch}
+            if not batch:
+                return 0
+            flushed = {r["id"]: r for r in batch}
+            started = time.perf_counter()
+
+            need_vectors = [i for i, r in enumerate(batch) if not r.get("vector")]
+            vectors = self.embed_batch([batch[i]["payload"]["text"] for i in need_vectors]) if need_vectors else []
+            for i, vector in zip(need_vectors, vectors):
+                batch[i] = {**batch[i], "vector": vector}
+            ready = [r for r in batch if r.get("vector")]
+            unembeddable = [r for r in batch if not r.get("vector")]
+
+            try:
+                if ready:
+                    existing = stored_stamps(self.client, self.collection_name, [r["id"] for r in ready])
+                    with self.commit_clock.commit(ready, existing):
+                        self.client.upsert(
+                            collection_name=self.collection_name,
+                            points=[PointStruct(id=r["id"], vector=r["vector"], payload=r["payload"]) for r in ready],
+                        )
+            except Exception as e:
+                self.failed_flushes += 1
+                self._retry_backoff = True
+                logger.error(f"[Ingest] Upsert of {len(ready)} memories failed, will retry: {e}")
+                self._resolve(waiting, ready, error=e)
+                return 0
+
+            # Unembeddable records stay in the queue and the WAL; their callers hear "not yet committed".
+            for r in unembeddable:
+                attempts = self._retries.get(r["id"], (0, 0.0))[0] + 1
+                delay = min(self.max_retry_delay, self.flush_interval * 2 ** attempts)
+                self._retries[r["id"]] = (attempts, time.monotonic() + delay)
+                logger.error(f"[Ingest] Embedding failed for memory (attempt {attempts}, retry in {delay:.1f}s): "
+                             f"{r['payload'].get('text', '')[:50]}")
+            self._resolve(waiting, unembeddable, error=RuntimeError("embedding failed; will retry"))
+            self.embed_failures += len(unembeddable)
+
+            done_ids = {r["id"] for r in ready}
+            with self._lock:
+                for record_id in done_ids:
+                    if self._pending.get(record_id) is flushed[record_id]:  # not resubmitted meanwhile
+                        del self._pending[record_id]
+                        self._retries.pop(record_id, None)
+                if done_ids:
+                    self._compact_wal()
+            self._resolve(waiting, ready)
+
+            self._retry_backoff = False
+            self.flushes += 1
+            self.committed += len(ready)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            if ready and self.on_commit is not None:
+                try:
+                    self.on_commit([r["payload"] for r in ready])
+                except Exception as e:
+                    logger.warning(f"[Ingest] Post-commit hook failed: {e}")
+            return len(ready)
+
+    def flush_all(self):
+        """Flush until nothing more can be committed now (empty queue, failed upsert, or records in backoff)."""
+        while self.flush():
+            pass
+
+    def _compact_wal(self):
+        """Rewrite the WAL with only the still-pending records (caller holds the lock)."""
+        tmp_path = f"{self.wal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for record in self._pending.values():
+                tmp.write(json.dumps({k: v for k, v in record.items() if k != "vector" or v}) + "\n")
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        self._wal.close()
+        os.replace(tmp_path, self.wal_path)
+        self._wal = open(self.wal_path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _resolve(waiting: Dict[str, List[Future]], records: List[dict], error: Optional[Exception] = None):
+        for fut in (f for r in records for f in waiting.get(r["id"], [])):
+            if fut.done():
+                continue
+            if error is None:
+                fut.set_result(True)
+            else:
+                fut.set_exception(error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "max_batch": self.max_batch,
+            "flush_interval_ms": self.flush_interval * 1000,
+            "flushes": self.flushes,
+            "committed": self.committed,
+            "avg_batch_size": round(self.committed / self.flushes, 2) if self.flushes else 0.0,
+            "failed_flushes": self.failed_flushes,
+            "embed_failures": self.embed_failures,
+            "awaiting_retry": len(self._retries),
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "wal_bytes": os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0,
+        }
+
+
+__all__ = ["IngestBuffer", "MemoryNotCommitted"]
@@ -0,0 +1,306 @@
+"""Local BM25 index for exact-term recall and hybrid (dense + sparse) fusion.
+
+Dense cosine search is weak at exact terms such as names, hostnames and tags
+written inside the text. Every committed memory is therefore also written to
+a SQLite FTS5 table keyed by its ``content_hash``, and ranked with FTS5's
+built-in ``bm25()``. The file is shared by all workers on a node. Because it
+is keyed by the same hash as the Qdrant payload, lexical hits can be joined
+back to points with one filtered scroll. Re-adding a hash replaces its entry;
+``remove`` drops entries whose memory was deleted, and hits that no longer
+join to a point are pruned after the recall that found them.
+
+``rrf_fuse`` combines the dense and lexical rankings by reciprocal-rank
+fusion, so neither score scale has to be calibrated against the other.
+
+Run ``python -m memory_api.lexical_index backfill`` once to index memories
+written before this existed. Run ``python -m memory_api.lexical_index bench``
+to compare recall@k and latency of dense-only and hybrid recall.
+"""
+
+import argparse
+import json
+import random
+import re
+import sqlite3
+import statistics
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from memory_api.dedup import CONTENT_HASH_FIELD, content_hash
+from memory_api.memory_logger import logger
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def query_tokens(text: str) -> List[str]:
+    """Lower-cased word tokens of ``text``, without duplicates, in order."""
+    return list(dict.fromkeys(t.lower() for t in _TOKEN_RE.findall(text)))
+
+
+def _indexable_tags(tags: Iterable[str]) -> str:
+    # Peer bookkeeping tags would make every memory match every hostname query.
+    return " ".join(t for t in tags or [] if not t.startswith("synced:"))
+
+
+class LexicalIndex:
+    """BM25 full-text index over memory text and tags, backed by SQLite FTS5."""
+
+    def __init__(self, path: Optional[str] = "lexical_index.sqlite3"):
+        self.path = path or ":memory:"
+        self._lock = threading.Lock()
+        self._db = None
+        self.indexed = 0
+        self.removed = 0
+        self.queries = 0
+        self.total_query_time = 0.0
+        try:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS memories ("
+                "id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL UNIQUE, session_id TEXT)"
+            )
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS memory_terms USING fts5("
+                "text, tags, tokenize='unicode61 remove_diacritics 2')"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[LexicalIndex] Disabled, could not open {self.path}: {e}")
+            self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def add(self, payloads: Sequence[dict]) -> int:
+        """Index (or re-index) memory payloads; returns how many were written."""
+        if self._db is None:
+            return 0
+        written = 0
+        with self._lock:
+            try:
+                for payload in payloads:
+                    text = payload.get("text")
+                    if not text:
+                        continue
+                    session_id = payload.get("session_id", "default")
+                    digest = payload.get(CONTENT_HASH_FIELD) or content_hash(session_id, text)
+                    self._db.execute(
+                        "INSERT INTO memories (content_hash, session_id) VALUES (?, ?) "
+                        "ON CONFLICT(content_hash) DO UPDATE SET session_id = excluded.session_id",
+                        (digest, session_id),
+                    )
+                    rowid = self._db.execute(
+                        "SELECT id FROM memories WHERE content_hash = ?", (digest,)
+                    ).fetchone()[0]
+                    self._db.execute("DELETE FROM memory_terms WHERE rowid = ?", (rowid,))
+                    self._db.execute(
+                        "INSERT INTO memory_terms (rowid, text, tags) VALUES (?, ?, ?)",
+                        (rowid, text, _indexable_tags(payload.get("tags"))),
+                    )
+                    written += 1
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                logger.warning(f"[LexicalIndex] Write of {len(payloads)} memories failed: {e}")
+                return 0
+        self.indexed += written
+        return written
+
+    def remove(self, digests: Iterable[str]) -> int:
+        """Drop the entries for these content hashes; returns how many existed."""
+        if self._db is None:
+            return 0
+        digests = [d for d in digests if d]
+        removed = 0
+        with self._lock:
+            try:
+                for digest in digests:
+                    row = self._db.execute("SELECT id FROM memories WHERE content_hash = ?", (digest,)).fetchone()
+                    if row is None:
+                        continue
+                    self._db.execute("DELETE FROM memory_terms WHERE rowid = ?", (row[0],))
+                    self._db.execute("DELETE FROM memories WHERE id = ?", (row[0],))
+                    removed += 1
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                logger.warning(f"[LexicalIndex] Removal of {len(digests)} memories failed: {e}")
+                return 0
+        self.removed += removed
+        return removed
+
+    def search(self, text: str, limit: int = 50, session_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Return ``(content_hash, bm25_score)`` pairs, best first (higher is better).
+
+        With ``session_id`` only that session's memories are matched.
+        """
+        tokens = query_tokens(text)
+        if self._db is None or not tokens:
+            return []
+        # Quote every token so FTS5 query syntax in user text is taken literally.
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in tokens)
+        session_clause = " AND m.session_id = ?" if session_id else ""
+        started = time.perf_counter()
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    "SELECT m.content_hash, bm25(memory_terms) AS score "
+                    "FROM memory_terms JOIN memories m ON m.id = memory_terms.rowid "
+                    f"WHERE memory_terms MATCH ?{session_clause} ORDER BY score LIMIT ?",
+                    (match, *([session_id] if session_id else []), limit),
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"[LexicalIndex] Query failed: {e}")
+                rows = []
+        self.queries += 1
+        self.total_query_time += time.perf_counter() - started
+        # FTS5 reports bm25 as a negative number where lower is better.
+        return [(digest, -score) for digest, score in rows]
+
+    def count(self) -> int:
+        if self._db is None:
+            return 0
+        with self._lock:
+            try:
+                return self._db.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+            except sqlite3.Error:
+                return 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "documents": self.count(),
+            "indexed_this_process": self.indexed,
+            "removed_this_process": self.removed,
+            "queries": self.queries,
+            "avg_query_ms": round(self.total_query_time / self.queries * 1000, 3) if self.queries else 0.0,
+        }
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+    """Reciprocal-rank fusion: score(d) = sum over rankings of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return fused[:limit] if limit is not None else fused
+
+
+def backfill_lexical_index(client, index: LexicalIndex, collection_name: str = "panai_memory",
+                           batch_size: int = 256) -> dict:
+    """Index every memory already stored in Qdrant."""
+    scanned = indexed = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        scanned += len(points)
+        indexed += index.add([p.payload or {} for p in points])
+        if offset is None:
+            break
+    summary = {"scanned": scanned, "indexed": indexed, "documents": index.count()}
+    logger.info(f"[LexicalIndex] Backfill finished: {summary}")
+    return summary
+
+
+def _sample_queries(client, collection_name: str, sample: int, terms: int, seed: int) -> List[Tuple[str, str]]:
+    """Build ``(query, expected content_hash)`` pairs from stored memories.
+
+    Each query is a few of the rarest-looking words (longest first) of one
+    memory, which mimics looking up a name or hostname mentioned in it.
+    """
+    points, _ = client.scroll(collection_name=collection_name, limit=sample * 4, with_payload=True)
+    rng = random.Random(seed)
+    rng.shuffle(points)
+    pairs = []
+    for point in points:
+        payload = point.payload or {}
+        tokens = [t for t in query_tokens(payload.get("text", "")) if len(t) > 3]
+        if len(tokens) < terms or not payload.get(CONTENT_HASH_FIELD):
+            continue
+        picked = sorted(tokens, key=len, reverse=True)[:terms]
+        pairs.append((" ".join(picked), payload[CONTENT_HASH_FIELD]))
+        if len(pairs) >= sample:
+            break
+    return pairs
+
+
+def benchmark_recall(client, index: LexicalIndex, embed, queries: List[Tuple[str, str]],
+                     collection_name: str = "panai_memory", k: int = 10, candidates: int = 50,
+                     rrf_k: int = 60) -> dict:
+    """Compare recall@k and latency of dense-only and hybrid (RRF) recall."""
+    results = {"dense": {"hits": 0, "latency": []}, "hybrid": {"hits": 0, "latency": []}}
+    for query, expected in queries:
+        started = time.perf_counter()
+        vector = embed(query)
+        dense = client.search(collection_name=collection_name, query_vector=vector,
+                              limit=candidates, with_payload=True)
+        dense_hashes = [(p.payload or {}).get(CONTENT_HASH_FIELD) for p in dense]
+        dense_time = time.perf_counter() - started
+        results["dense"]["latency"].append(dense_time)
+        results["dense"]["hits"] += expected in dense_hashes[:k]
+
+        started = time.perf_counter()
+        lexical = [digest for digest, _ in index.search(query, candidates)]
+        fused = [digest for digest, _ in rrf_fuse([dense_hashes, lexical], rrf_k, k)]
+        results["hybrid"]["latency"].append(dense_time + time.perf_counter() - started)
+        results["hybrid"]["hits"] += expected in fused
+
+    report = {"queries": len(queries), "k": k}
+    for mode, r in results.items():
+        latency = sorted(r["latency"]) or [0.0]
+        report[mode] = {
+            f"recall_at_{k}": round(r["hits"] / len(queries), 4) if queries else 0.0,
+            "mean_ms": round(statistics.fmean(latency) * 1000, 3),
+            "p95_ms": round(latency[min(len(latency) - 1, int(len(latency) * 0.95))] * 1000, 3),
+        }
+    return report
+
+
+__all__ = ["LexicalIndex", "rrf_fuse", "query_tokens", "backfill_lexical_index", "benchmark_recall"]
+
+
+def main():
+    from memory_api.qdrant_interface import create_qdrant_client
+    from services.config import LEXICAL_INDEX_PATH, RECALL_CANDIDATES, RECALL_RRF_K
+
+    parser = argparse.ArgumentParser(description="Maintain and benchmark the local BM25 memory index.")
+    parser.add_argument("command", choices=["backfill", "bench"])
+    parser.add_argument("--host", default="localhost", help="Qdrant host (default: localhost)")
+    parser.add_argument("--port", type=int, default=6333, help="Qdrant port (default: 6333)")
+    parser.add_argument("--collection", default="panai_memory", help="Collection name (default: panai_memory)")
+    parser.add_argument("--index", default=LEXICAL_INDEX_PATH, help="SQLite index path")
+    parser.add_argument("--sample", type=int, default=200, help="bench: number of queries (default: 200)")
+    parser.add_argument("--terms", type=int, default=2, help="bench: words per query (default: 2)")
+    parser.add_argument("--k", type=int, default=10, help="bench: recall cut-off (default: 10)")
+    parser.add_argument("--seed", type=int, default=0, help="bench: sampling seed")
+    args = parser.parse_args()
+
+    client = create_qdrant_client(args.host, args.port, timeout=60)
+    index = LexicalIndex(args.index)
+    if args.command == "backfill":
+        print(json.dumps(backfill_lexical_index(client, index, args.collection), indent=2))
+        return
+
+    from memory_api.embedding import embed_text
+    queries = _sample_queries(client, args.collection, args.sample, args.terms, args.seed)
+    if not queries:
+        parser.error(f"No memories in '{args.collection}' with enough words to build queries")
+    report = benchmark_recall(client, index, embed_text, queries, args.collection,
+                              k=args.k, candidates=max(args.k, RECALL_CANDIDATES), rrf_k=RECALL_RRF_K)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
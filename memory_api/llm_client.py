@@ -0,0 +1,306 @@
+"""Shared, pooled HTTP client for every call to Ollama.
+
+Async calls take a slot from ``llm_scheduler`` and a ``keep_alive`` from
+``model_residency`` first; ``generate_sync`` is for threads outside the event
+loop and is not scheduled. With ``router`` set, ``generate``, ``stream`` and
+``admit`` may run on a mesh peer; the ``*_local`` variants never do.
+Connection errors, 5xx and 429 are retried ``LLM_RETRIES`` times with
+backoff; read timeouts and streams that already produced a token are not.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from memory_api.llm_scheduler import PRIORITY_BACKGROUND, LLMScheduler, parse_model_concurrency
+from memory_api.memory_logger import logger
+from model_manager.residency import ModelResidency
+from services.config import (
+    LLM_CONNECT_TIMEOUT,
+    LLM_MAX_CONCURRENCY,
+    LLM_MODEL_CONCURRENCY,
+    LLM_POOL_SIZE,
+    LLM_QUEUE_MAX,
+    LLM_RETRIES,
+    LLM_RETRY_BACKOFF_MS,
+    LLM_TIMEOUT,
+    MODEL_KEEP_ALIVE_MAX,
+    MODEL_KEEP_ALIVE_MIN,
+    MODEL_PREWARM_MIN_REQUESTS,
+    MODEL_RAM_LIMIT_MB,
+    MODEL_RESIDENCY_ENABLED,
+    MODEL_RESIDENCY_POLL_SECONDS,
+    MODEL_TRAFFIC_WINDOW_SECONDS,
+    OLLAMA_BASE_URL,
+)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return False
+
+
+class LLMClient:
+    """Pooled keep-alive client for Ollama's generate API, with retries."""
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, timeout: float = LLM_TIMEOUT,
+                 connect_timeout: float = LLM_CONNECT_TIMEOUT, retries: int = LLM_RETRIES,
+                 backoff: float = LLM_RETRY_BACKOFF_MS / 1000.0, pool_size: int = LLM_POOL_SIZE,
+                 scheduler: Optional[LLMScheduler] = None):
+        self.scheduler = scheduler
+        self.residency: Optional[ModelResidency] = None
+        self.router = None  # mesh InferenceRouter; when set, async calls may run on a peer
+        self.base_url = base_url.rstrip("/")
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.completed = 0
+        self.tokens_streamed = 0
+        self.total_time = 0.0
+        self.tokens_per_second = 0.0  # moving average of Ollama's eval rate
+        self.tokens_per_request = 0.0
+
+    def _client(self) -> httpx.AsyncClient:
+        # An AsyncClient's pool belongs to the loop that opened it.
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            self._async_loop = loop
+        return self._async_client
+
+    def _client_sync(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            return self._sync_client
+
+    def _give_up(self, attempt: int, exc: Exception) -> bool:
+        if attempt >= self.retries or not _is_retryable(exc):
+            self.failed += 1
+            return True
+        self.retried += 1
+        logger.warning(f"[LLM] Ollama call failed ({exc}); retry {attempt + 1}/{self.retries}")
+        return False
+
+    def _record(self, started: float):
+        self.completed += 1
+        self.total_time += time.perf_counter() - started
+
+    def _note_eval(self, result: dict):
+        # Ollama reports generated tokens and the time spent generating them (ns).
+        count, duration = result.get("eval_count"), result.get("eval_duration")
+        if not count or not duration:
+            return
+        rate = count / (duration / 1e9)
+        if self.tokens_per_second:
+            self.tokens_per_second += 0.2 * (rate - self.tokens_per_second)
+            self.tokens_per_request += 0.2 * (count - self.tokens_per_request)
+        else:
+            self.tokens_per_second, self.tokens_per_request = rate, float(count)
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt)
+
+    @staticmethod
+    def _payload(model: str, prompt: str, stream: bool, options: dict) -> dict:
+        return {"model": model, "prompt": prompt, "stream": stream, **options}
+
+    @asynccontextmanager
+    async def _slot(self, model: str, priority: int, options: dict):
+        """Hold a scheduler slot and yield ``options`` with the residency's ``keep_alive`` added."""
+        async with self.scheduler.slot(model, priority) if self.scheduler else nullcontext():
+            if self.residency is None:
+                yield options
+                return
+            keep_alive = await self.residency.acquire(model, priority)
+            try:
+                yield {"keep_alive": keep_alive, **options}
+            finally:
+                self.residency.release(model, priority)
+
+    async def generate(self, model: str, prompt: str, priority: int = PRIORITY_BACKGROUND, **options) -> str:
+        """``generate_local`` here, or on the node ``router`` picks."""
+        if self.router is not None:
+            return await self.router.generate(model, prompt, priority, **options)
+        return await self.generate_local(model, prompt, priority, **options)
+
+    async def generate_local(self, model: str, prompt: str, priority: int = PRIORITY_BACKGROUND, **options) -> str:
+        """Return the full response text; raises ``httpx.HTTPError`` once retries are spent.
+
+        Raises ``SchedulerBusy`` when the model's queue is full.
+        """
+        async with self._slot(model, priority, options) as options:
+            return await self._generate(model, prompt, options)
+
+    async def _generate(self, model: str, prompt: str, options: dict) -> str:
+        self.requests += 1
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = await self._client().post("/api/generate", json=self._payload(model, prompt, False, options))
+                response.raise_for_status()
+                self._record(started)
+                result = response.json()
+                self._note_eval(result)
+                return result["response"]
+            except httpx.HTTPError as e:
+                if self._give_up(attempt, e):
+                    raise
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    def generate_sync(self, model: str, prompt: str, **options) -> str:
+        """Blocking ``generate`` for sync routes and threads."""
+        if self.residency is not None:
+            options = {"keep_alive": self.residency.note_request(model), **options}
+        self.requests += 1
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = self._client_sync().post("/api/generate", json=self._payload(model, prompt, False, options))
+                response.raise_for_status()
+                self._record(started)
+                result = response.json()
+                self._note_eval(result)
+                return result["response"]
+            except httpx.HTTPError as e:
+                if self._give_up(attempt, e):
+                    raise
+            time.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def stream(self, model: str, prompt: str, priority: int = PRIORITY_BACKGROUND, node: Optional[str] = None,
+                     **options) -> AsyncIterator[str]:
+        """``stream_local`` here, or on ``node`` (from ``admit``) when ``router`` is set."""
+        if self.router is not None:
+            tokens = self.router.stream(model, prompt, priority, node=node, **options)
+        else:
+            tokens = self.stream_local(model, prompt, priority, **options)
+        async for token in tokens:
+            yield token
+
+    async def stream_local(self, model: str, prompt: str, priority: int = PRIORITY_BACKGROUND,
+                           **options) -> AsyncIterator[str]:
+        """Yield response tokens as Ollama generates them, holding a scheduler slot throughout.
+
+        Call ``admit`` first when the stream is returned from a route, so a
+        full queue is refused with 429 before the response has started.
+        """
+        async with self._slot(model, priority, options) as options:
+            async for token in self._stream(model, prompt, options):
+                yield token
+
+    def admit(self, model: str, priority: int = PRIORITY_BACKGROUND) -> Optional[str]:
+        """Refuse a full queue with ``SchedulerBusy``; returns the node to pass to ``stream``."""
+        if self.router is not None:
+            return self.router.admit(model, priority)
+        self.admit_local(model, priority)
+        return None
+
+    def admit_local(self, model: str, priority: int = PRIORITY_BACKGROUND):
+        if self.scheduler is not None:
+            self.scheduler.admit(model, priority)
+
+    async def _stream(self, model: str, prompt: str, options: dict) -> AsyncIterator[str]:
+        self.requests += 1
+        started = time.perf_counter()
+        attempt = 0
+        yielded = False
+        while True:
+            try:
+                async with self._client().stream("POST", "/api/generate",
+                                                 json=self._payload(model, prompt, True, options)) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise httpx.HTTPError(chunk["error"])
+                        if chunk.get("response"):
+                            yielded = True
+                            self.tokens_streamed += 1
+                            yield chunk["response"]
+                        if chunk.get("done"):
+                            self._note_eval(chunk)
+                            break
+                self._record(started)
+                return
+            except httpx.HTTPError as e:
+                if yielded or self._give_up(attempt, e):
+                    if yielded:
+                        self.failed += 1
+                    raise
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def get_json(self, path: str) -> dict:
+        """GET an Ollama admin endpoint such as ``/api/ps`` (not scheduled, not retried)."""
+        response = await self._client().get(path, timeout=self.timeout.connect + 5)
+        response.raise_for_status()
+        return response.json()
+
+    async def unload(self, model: str):
+        """Ask Ollama to unload ``model`` now."""
+        response = await self._client().post("/api/generate", json={"model": model, "keep_alive": 0},
+                                             timeout=self.timeout.connect + 30)
+        response.raise_for_status()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.limits.max_connections,
+            "requests": self.requests,
+            "retries": self.retried,
+            "failed_calls": self.failed,
+            "completed": self.completed,
+            "tokens_streamed": self.tokens_streamed,
+            "avg_request_seconds": round(self.total_time / self.completed, 3) if self.completed else 0.0,
+            "tokens_per_second": round(self.tokens_per_second, 2),
+            "tokens_per_request": round(self.tokens_per_request, 1),
+        }
+
+
+llm_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_QUEUE_MAX, parse_model_concurrency(LLM_MODEL_CONCURRENCY))
+llm_client = LLMClient(scheduler=llm_scheduler)
+model_residency = ModelResidency(
+    llm_client,
+    ram_limit_bytes=int(MODEL_RAM_LIMIT_MB * 2**20),
+    keep_alive_min=MODEL_KEEP_ALIVE_MIN,
+    keep_alive_max=MODEL_KEEP_ALIVE_MAX,
+    window_seconds=MODEL_TRAFFIC_WINDOW_SECONDS,
+    prewarm_min_requests=MODEL_PREWARM_MIN_REQUESTS,
+    poll_seconds=MODEL_RESIDENCY_POLL_SECONDS,
+)
+if MODEL_RESIDENCY_ENABLED:
+    llm_client.residency = model_residency
+
+
+__all__ = ["LLMClient", "llm_client", "llm_scheduler", "model_residency"]
@@ -0,0 +1,174 @@
+"""Per-model concurrency limits and priority queueing for Ollama calls.
+
+Each model runs at most ``LLM_MAX_CONCURRENCY`` generations at once
+(``LLM_MODEL_CONCURRENCY`` overrides it per model); waiters are served
+interactive first, then background, then warm-up. A call that would wait
+behind ``LLM_QUEUE_MAX`` or more callers of equal or higher priority is
+refused with ``SchedulerBusy`` (HTTP 429 with ``Retry-After``). The queue is
+per process.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_WARMUP = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background", PRIORITY_WARMUP: "warmup"}
+
+
+class SchedulerBusy(HTTPException):
+    """Raised (as HTTP 429) when too many calls are already queued for a model."""
+
+    def __init__(self, model: str, queued: int, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail=f"LLM queue for '{model}' is full ({queued} waiting); retry later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.model = model
+        self.retry_after = retry_after
+
+
+def parse_model_concurrency(spec: str) -> Dict[str, int]:
+    """Parse ``"mistral-nemo=1,llama3.2:latest=2"`` into a dict."""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.strip().rpartition("=")
+        if name and value.strip().isdigit():
+            limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+class _Timings:
+    def __init__(self, window: int = 512):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1) if ordered else 0.0,
+        }
+
+
+class _ModelQueue:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiters = []  # heap of (priority, seq, future)
+
+
+class LLMScheduler:
+    """Priority queue with a concurrency limit per model and queue-depth admission control."""
+
+    def __init__(self, concurrency: int = 1, max_queue: int = 8, model_concurrency: Optional[Dict[str, int]] = None):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.model_concurrency = model_concurrency or {}
+        self._models: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self.queue_wait = {name: _Timings() for name in PRIORITY_NAMES.values()}
+        self.generation = {name: _Timings() for name in PRIORITY_NAMES.values()}
+        self.rejected = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._models.get(model)
+        if queue is None:
+            queue = self._models[model] = _ModelQueue(self.model_concurrency.get(model, self.concurrency))
+        return queue
+
+    def _retry_after(self, queue: _ModelQueue, ahead: int) -> int:
+        count = sum(t.count for t in self.generation.values())
+        per_call = sum(t.total for t in self.generation.values()) / count if count else 10.0
+        return max(1, math.ceil(per_call * (ahead + 1) / queue.limit))
+
+    def admit(self, model: str, priority: int = PRIORITY_BACKGROUND):
+        """Raise ``SchedulerBusy`` if a call at ``priority`` would be refused right now."""
+        if self.max_queue <= 0:
+            return
+        queue = self._queue(model)
+        if queue.active < queue.limit and not queue.waiters:
+            return
+        ahead = sum(1 for p, _, _ in queue.waiters if p <= priority)
+        if ahead >= self.max_queue:
+            self.rejected[PRIORITY_NAMES.get(priority, "background")] += 1
+            raise SchedulerBusy(model, len(queue.waiters), self._retry_after(queue, ahead))
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITY_BACKGROUND):
+        """Hold one of ``model``'s generation slots for the body of the ``async with``."""
+        name = PRIORITY_NAMES.get(priority, "background")
+        queue = self._queue(model)
+        queued_at = time.perf_counter()
+        if queue.active < queue.limit and not queue.waiters:
+            queue.active += 1
+        else:
+            self.admit(model, priority)
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (priority, next(self._seq), waiter)
+            heapq.heappush(queue.waiters, entry)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(queue)  # the slot was handed over just as we gave up
+                else:
+                    queue.waiters.remove(entry)
+                    heapq.heapify(queue.waiters)
+                raise
+        started = time.perf_counter()
+        self.queue_wait[name].add(started - queued_at)
+        try:
+            yield
+        finally:
+            self.generation[name].add(time.perf_counter() - started)
+            self._release(queue)
+
+    def _release(self, queue: _ModelQueue):
+        # Hand the slot straight to the next waiter so nobody can jump the queue.
+        while queue.waiters:
+            _, _, waiter = heapq.heappop(queue.waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        queue.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            "default_concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "models": {
+                model: {"limit": q.limit, "active": q.active, "queued": len(q.waiters)}
+                for model, q in self._models.items()
+            },
+            "queue_wait": {name: t.summary() for name, t in self.queue_wait.items()},
+            "generation": {name: t.summary() for name, t in self.generation.items()},
+            "rejected": dict(self.rejected),
+        }
+
+
+__all__ = [
+    "LLMScheduler",
+    "SchedulerBusy",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BACKGROUND",
+    "PRIORITY_WARMUP",
+    "parse_model_concurrency",
+]
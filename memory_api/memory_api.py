@@ -15,18 +15,20 @@ def normalize_peer_url(url: str) -> str:
         logger.warning(f"Could not normalize peer URL '{url}': {e}")
         return url  # fallback to original
 # Standard library imports
-from typing import List
+from typing import List, Literal
 from datetime import datetime
 from datetime import timezone
-import uuid
 import asyncio
 import httpx
 import os
 import json
+import weakref
 #third-party imports
-from fastapi import FastAPI, APIRouter, Request
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from memory_api.qdrant_interface import client
+from memory_api.qdrant_interface import async_client, client, load_collection_schema, qdrant_stats
+from qdrant_client.http.models import Direction, OrderBy, SearchRequest, SetPayload, SetPayloadOperation
 import socket
 
 # Zeroconf/mDNS imports for LAN peer discovery
@@ -34,8 +36,6 @@ from zeroconf import Zeroconf, ServiceBrowser, ServiceStateChange
 SERVICE_TYPE = "_panai-memory._tcp.local."
 
 import requests
-import torch
-torch.set_num_threads(14)  # Reserve 1–2 threads for system processes
 
 memory_router = APIRouter()
 stats_router = APIRouter()
@@ -46,8 +46,67 @@ if not os.path.exists("memory_log.json"):
         json.dump([], f)
 
 
-# Local embedding utility import
-from memory_api.embedding import embed_text
+from memory_api.bulk_ingest import ingest_ndjson
+from memory_api.commit_clock import COMMIT_FIELD, CommitClock, stored_stamps
+from memory_api.context_builder import build_context, chunk_by_tokens, rank_memories
+from memory_api.dedup import CONTENT_HASH_FIELD, RecentHashes, content_hash, point_id_for_hash
+from memory_api.embedding import embed_batch, embed_text, embed_texts, embedding_stats, wait_until_ready
+from memory_api.executors import executor_stats
+from memory_api.generation_cache import GenerationCache, generation_key
+from memory_api.ingest_buffer import IngestBuffer, MemoryNotCommitted
+from memory_api.lexical_index import LexicalIndex, rrf_fuse
+from memory_api.llm_client import llm_client, llm_scheduler, model_residency
+from memory_api.mmr import cosine_similarity, mmr_select
+from memory_api.recall_cache import RecallCache, normalize_query
+from memory_api.session_summary import SUMMARY_TAG, SummaryTracker, fold_prompt, summary_digest, summary_point_id
+from memory_api.token_stream import single_token, token_stream_response
+from services.config import (
+    BULK_INGEST_CHUNK_SIZE,
+    BULK_INGEST_MAX_LINE_BYTES,
+    CONTEXT_CANDIDATES,
+    CONTEXT_CHARS_PER_TOKEN,
+    CONTEXT_CHUNK_TOKENS,
+    CONTEXT_RECENCY_HALF_LIFE_HOURS,
+    CONTEXT_RECENCY_WEIGHT,
+    CONTEXT_TOKEN_BUDGET,
+    DEDUP_RECENT_HASHES,
+    GENERATION_CACHE_ENABLED,
+    GENERATION_CACHE_SIMILARITY,
+    GENERATION_CACHE_SIZE,
+    GENERATION_CACHE_TTL,
+    EMBEDDING_READY_TIMEOUT,
+    INGEST_BATCH_SIZE,
+    INGEST_COMMIT_TIMEOUT,
+    INGEST_FLUSH_INTERVAL_MS,
+    INGEST_WAL_PATH,
+    LEXICAL_INDEX_PATH,
+    RECALL_CACHE_ENABLED,
+    RECALL_CACHE_SIZE,
+    RECALL_CACHE_TTL,
+    RECALL_BATCH_MAX_QUERIES,
+    RECALL_CANDIDATES,
+    RECALL_MMR_FETCH_K,
+    RECALL_MMR_LAMBDA,
+    RECALL_MODE,
+    RECALL_RRF_K,
+    SESSION_SUMMARY_BATCH,
+    SESSION_SUMMARY_ENABLED,
+    SESSION_SUMMARY_EVERY,
+    SESSION_SUMMARY_MODEL,
+    SESSION_SUMMARY_POLL_SECONDS,
+    SESSION_SUMMARY_QUIET_SECONDS,
+)
+
+async def require_embedding_model():
+    """Route dependency: wait briefly for model warm-up, then fail fast with 503."""
+    loop = asyncio.get_running_loop()
+    ready = await loop.run_in_executor(None, wait_until_ready, EMBEDDING_READY_TIMEOUT)
+    if not ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Embedding model is still warming up. Retry shortly.",
+            headers={"Retry-After": "5"},
+        )
 
 # --- Begin get_local_identity function ---
 def get_local_identity():
@@ -61,44 +120,8 @@ def get_local_identity():
         return socket.gethostbyname(socket.gethostname())
 # --- End get_local_identity function ---
 
-def log_generic_memory(text: str, session_id: str, tags: List[str]):
-    if not text.strip():
-        logger.info("Skipping memory with empty text.")
-        return None
-    if not session_id.strip():
-        logger.info("Skipping memory with empty session_id.")
-        return None
-    # Deduplication check before embedding
-    existing = client.scroll(
-        collection_name="panai_memory",
-        scroll_filter={
-            "must": [
-                {"key": "session_id", "match": {"value": session_id}},
-                {"key": "text", "match": {"value": text}}
-            ]
-        },
-        limit=1
-    )
-
-    if existing and existing[0]:
-        logger.debug(f"Skipping duplicate memory: {text[:50]}...")
-        return None
-
-    vector = embed_text(text)
-    self_host = socket.gethostname()
-    local_peer_tag = f"synced:http://{get_local_identity()}:8000"
-    point = {
-        "id": str(uuid.uuid4()),
-        "vector": vector,
-        "payload": {
-            "text": text,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "session_id": session_id,
-            "tags": list(set(tag.lower() for tag in tags + [session_id, local_peer_tag])),
-        }
-    }
-    client.upsert(collection_name="panai_memory", points=[point])
-    # Also append to memory_log.json for testing/dev visibility
+def append_to_memory_log(payloads: List[dict]):
+    """Append committed memories to memory_log.json for testing/dev visibility."""
     try:
         with open("memory_log.json", "r+") as f:
             try:
@@ -108,12 +131,125 @@ def log_generic_memory(text: str, session_id: str, tags: List[str]):
             except (json.JSONDecodeError, ValueError) as e:
                 logger.warning(f"memory_log.json parse error: {e}. Reinitializing log.")
                 log = []
-            log.append(point["payload"])
+            log.extend(payloads)
             f.seek(0)
             json.dump(log, f, indent=2)
             f.truncate()
     except Exception as e:
         logger.warning(f"Could not write to memory_log.json: {e}")
+
+MEMORY_VECTOR_SIZE = load_collection_schema()["vectors"]["size"]
+# Uses the datetime payload index on timestamp (see panai.collection.json).
+NEWEST_FIRST = OrderBy(key="timestamp", direction=Direction.DESC)
+OLDEST_FIRST = OrderBy(key="timestamp", direction=Direction.ASC)
+# Uses the integer payload index on committed_at: the order memories reached this store.
+COMMIT_ORDER = OrderBy(key=COMMIT_FIELD, direction=Direction.ASC)
+
+# Stamps committed_at on every write; the rolling summaries page on it.
+commit_clock = CommitClock()
+
+# Hashes of memories committed recently; lets obvious duplicates skip the buffer.
+recent_hashes = RecentHashes(DEDUP_RECENT_HASHES)
+
+# BM25 index over committed memories, fused with dense search in /recall.
+lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+
+# Cached /recall and /search_by_tag results; every write path below bumps the sessions it wrote to.
+recall_cache = RecallCache(RECALL_CACHE_SIZE, RECALL_CACHE_TTL, RECALL_CACHE_ENABLED)
+
+# Follow-up work started by requests; held here so a task is not garbage-collected mid-run.
+background_tasks: set = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+def on_memories_committed(payloads: List[dict]):
+    # Buffered writes (log_generic_memory, peer sync) become searchable here, not at submit.
+    recent_hashes.add(p.get("content_hash") for p in payloads)
+    lexical_index.add(payloads)
+    recall_cache.bump(p.get("session_id") for p in payloads)
+    summary_tracker.note(payloads)
+    append_to_memory_log(payloads)
+
+async def store_points(points: list):
+    """Upsert fully built memory points and index their text for lexical recall."""
+    ids = [p["id"] if isinstance(p, dict) else p.id for p in points]
+    existing = await asyncio.to_thread(stored_stamps, client, "panai_memory", ids)
+    with commit_clock.commit(points, existing):
+        await async_client.upsert(collection_name="panai_memory", points=points)
+    payloads = [p["payload"] if isinstance(p, dict) else p.payload for p in points]
+    recent_hashes.add(p.get("content_hash") for p in payloads)
+    await asyncio.to_thread(lexical_index.add, payloads)
+    recall_cache.bump(p.get("session_id") for p in payloads)
+    summary_tracker.note(payloads)
+
+def memory_point(text: str, session_id: str, tags: List[str], vector: list = None, timestamp: str = None) -> dict:
+    """Build a memory point whose ID is derived from its content hash.
+
+    Writing the same (session_id, text) twice targets the same point, so
+    upserts are idempotent without a duplicate lookup first.
+    """
+    digest = content_hash(session_id, text)
+    point = {
+        "id": point_id_for_hash(digest),
+        "payload": {
+            "text": text,
+            "timestamp": timestamp or datetime.now(timezone.utc).isoformat(),
+            "session_id": session_id,
+            "tags": tags,
+            "content_hash": digest,
+        }
+    }
+    if vector is not None:
+        point["vector"] = vector
+    return point
+
+# Rolling summary points are stored with the memories; reads that want memories exclude them.
+SUMMARY_POINTS = {"key": "tags", "match": {"value": SUMMARY_TAG}}
+
+# Memories not yet folded into each session's rolling summary.
+summary_tracker = SummaryTracker(SESSION_SUMMARY_EVERY, SESSION_SUMMARY_QUIET_SECONDS)
+summary_locks = weakref.WeakValueDictionary()  # session_id -> lock, dropped once no update holds it
+
+# Generated reflections/summaries keyed by the memories they were built from.
+generation_cache = GenerationCache(GENERATION_CACHE_SIZE, GENERATION_CACHE_TTL,
+                                   GENERATION_CACHE_SIMILARITY, GENERATION_CACHE_ENABLED)
+
+# Write-behind buffer: memories are embedded and upserted in batches.
+ingest_buffer = IngestBuffer(
+    client,
+    embed_batch,
+    wal_path=INGEST_WAL_PATH,
+    max_batch=INGEST_BATCH_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL_MS / 1000.0,
+    on_commit=on_memories_committed,
+    commit_clock=commit_clock,
+)
+
+def log_generic_memory(text: str, session_id: str, tags: List[str], wait_for_commit: bool = False):
+    if not text.strip():
+        logger.info("Skipping memory with empty text.")
+        return None
+    if not session_id.strip():
+        logger.info("Skipping memory with empty session_id.")
+        return None
+    local_peer_tag = f"synced:http://{get_local_identity()}:8000"
+    point = memory_point(text, session_id, list(set(tag.lower() for tag in tags + [session_id, local_peer_tag])))
+    # Deduplication: the point ID is the content hash, so a repeat is at worst
+    # an idempotent upsert; recently committed hashes skip the buffer entirely.
+    if recent_hashes.seen(point["payload"]["content_hash"]):
+        logger.debug(f"Skipping duplicate memory: {text[:50]}...")
+        return None
+
+    # Durable once submitted (WAL); embedding and upsert happen at the next flush.
+    committed = ingest_buffer.submit(point)
+    if wait_for_commit:
+        try:
+            committed.result(timeout=INGEST_COMMIT_TIMEOUT)
+        except Exception as e:
+            raise MemoryNotCommitted(point["id"], e) from e
     return point["id"]
 
 def query_and_generate(session_id: str, tags: List[str], prompt_template: str, model: str = "mistral-nemo", limit: int = 25) -> str:
@@ -123,58 +259,231 @@ def query_and_generate(session_id: str, tags: List[str], prompt_template: str, m
             "must": [
                 {"key": "session_id", "match": {"value": session_id}},
                 *([{"key": "tags", "match": {"value": tag}} for tag in tags] if tags else [])
-            ]
+            ],
+            "must_not": [SUMMARY_POINTS],
         },
         limit=limit
     )
     memory_texts = [r.payload["text"] for r in results[0]]
     combined_text = "\n".join(memory_texts)
     prompt = prompt_template.format(session_id=session_id, combined_text=combined_text)
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={"model": model, "prompt": prompt, "stream": False}
-    ).json()["response"]
-    return response
-
-async def query_and_generate_async(session_id: str, tags: List[str], prompt_template: str, model: str = "mistral-nemo", limit: int = 25) -> str:
-    results = client.scroll(
+    return llm_client.generate_sync(model, prompt)
+
+async def prepare_session_prompt(session_id: str, tags: List[str], prompt_template: str, model: str = "mistral-nemo",
+                                 limit: int = 25, mmr_lambda: float | None = None, fetch_k: int = 0,
+                                 force_refresh: bool = False) -> dict:
+    """Build the prompt for a session's memories and look it up in ``generation_cache``.
+
+    The newest ``CONTEXT_CANDIDATES`` memories are ranked by relevance and
+    recency, or by MMR over ``fetch_k`` of them when ``mmr_lambda`` is set.
+    The best ``limit`` are kept and fitted into ``CONTEXT_TOKEN_BUDGET`` by
+    ``context_builder``. Returns the prompt, the cache key and vector to store
+    the answer under, and ``cached`` (the cached answer, or None).
+    """
+    diversify_context = mmr_lambda is not None
+    results = await async_client.scroll(
         collection_name="panai_memory",
         scroll_filter={
             "must": [
                 {"key": "session_id", "match": {"value": session_id}},
                 *([{"key": "tags", "match": {"value": tag}} for tag in tags] if tags else [])
-            ]
+            ],
+            "must_not": [SUMMARY_POINTS],
         },
-        limit=limit
+        limit=max(limit, fetch_k) if diversify_context else max(limit, CONTEXT_CANDIDATES),
+        with_vectors=True,
+        order_by=NEWEST_FIRST,
     )
-    memory_texts = [r.payload["text"] for r in results[0]]
-    combined_text = "\n".join(memory_texts)
-    prompt = prompt_template.format(session_id=session_id, combined_text=combined_text)
-    
-    async with httpx.AsyncClient(timeout=180.0) as http_client:
-        try:
-            response = await http_client.post(
-                "http://localhost:11434/api/generate",
-                json={"model": model, "prompt": prompt, "stream": False}
-            )
-            response.raise_for_status()
-            return response.json()["response"]
-        except httpx.HTTPError as e:
-            logger.error(f"HTTP error during LLM call: {e}")
-            return f"❌ Error from language model: {e}"
+    points = rank_memories(results[0], limit, CONTEXT_RECENCY_WEIGHT, CONTEXT_RECENCY_HALF_LIFE_HOURS, mmr_lambda)
+
+    cache_key = generation_key(model, prompt_template, session_id, [r.id for r in points])
+    prompt_vector = None
+    if generation_cache.semantic:
+        raw_text = "\n".join(r.payload["text"] for r in points)
+        prompt_vector = (await embed_texts([prompt_template.format(session_id=session_id, combined_text=raw_text)]))[0]
+    cached = None
+    if force_refresh:
+        generation_cache.note_refresh()
+    else:
+        cached = generation_cache.get(cache_key, model, prompt_template, session_id, prompt_vector)
+
+    prompt = None
+    if cached is None:
+        async def summarize_chunk(template: str, chunk_prompt: str, memory_ids: list) -> str:
+            chunk_key = generation_key(model, template, session_id, memory_ids)
+            summary = generation_cache.get(chunk_key, model, template, session_id)
+            if summary is None:
+                summary = await llm_client.generate(model, chunk_prompt)
+                generation_cache.put(chunk_key, model, template, session_id, summary)
+            return summary
+
+        context = await build_context(session_id, points, summarize_chunk, CONTEXT_TOKEN_BUDGET,
+                                      CONTEXT_CHUNK_TOKENS, CONTEXT_CHARS_PER_TOKEN)
+        if context["strategy"] != "all":
+            logger.info(f"[Context] Session '{session_id}': {len(points)} memories over budget, "
+                        f"{context['strategy']} to ~{context['tokens']} tokens")
+        prompt = prompt_template.format(session_id=session_id, combined_text=context["text"])
+    return {
+        "model": model,
+        "template": prompt_template,
+        "session_id": session_id,
+        "prompt": prompt,
+        "cache_key": cache_key,
+        "vector": prompt_vector,
+        "cached": cached,
+    }
+
+def cache_generation(prepared: dict, generated: str):
+    generation_cache.put(prepared["cache_key"], prepared["model"], prepared["template"], prepared["session_id"],
+                         generated, prepared["vector"])
+
+async def query_and_generate_async(session_id: str, tags: List[str], prompt_template: str, model: str = "mistral-nemo", limit: int = 25,
+                                   mmr_lambda: float | None = None, fetch_k: int = 0, force_refresh: bool = False) -> str:
+    """Build a prompt from a session's memories and generate with Ollama.
+
+    Answers come from ``generation_cache`` when the same memories were used
+    with this template before, unless ``force_refresh`` is set.
+    """
+    prepared = await prepare_session_prompt(session_id, tags, prompt_template, model, limit,
+                                            mmr_lambda, fetch_k, force_refresh)
+    if prepared["cached"] is not None:
+        return prepared["cached"]
+
+    try:
+        generated = await llm_client.generate(model, prepared["prompt"])
+    except httpx.HTTPError as e:
+        logger.error(f"HTTP error during LLM call: {e}")
+        return f"❌ Error from language model: {e}"
+    cache_generation(prepared, generated)
+    return generated
+
+# Reflective stages: the prompt, the memories it reads (by tag) when run on
+# its own, how its answer is stored, and which stage's answer it reads when
+# run after that stage in /pipeline.
+REFLECTIVE_STAGES = {
+    "reflect": {
+        "template": (
+            "Here is a series of memory logs from session '{session_id}':\n\n"
+            "{combined_text}\n\n"
+            "Reflect on these memories. What patterns, concerns, or deeper insights emerge?"
+        ),
+        "context_tags": [],
+        "memory_tags": ["reflection", "meta"],
+        "result_key": "reflection",
+        "reads": None,
+    },
+    "advice": {
+        "template": (
+            "Based on these reflections from session '{session_id}':\n\n"
+            "{combined_text}\n\n"
+            "What advice would you give for moving forward?"
+        ),
+        "context_tags": ["reflection"],
+        "memory_tags": ["advice", "meta"],
+        "result_key": "advice",
+        "reads": "reflect",
+    },
+    "plan": {
+        "template": (
+            "Based on this advice history for session '{session_id}', "
+            "outline a clear, step-by-step plan of action:\n\n{combined_text}\n\nPlan:"
+        ),
+        "context_tags": ["advice"],
+        "memory_tags": ["plan", "meta"],
+        "result_key": "plan",
+        "reads": "advice",
+    },
+    "next": {
+        "template": (
+            "Here’s recent advice from session '{session_id}':\n\n"
+            "{combined_text}\n\n"
+            "What is the single most important next step to take right now?"
+        ),
+        "context_tags": ["advice"],
+        "memory_tags": ["next", "meta"],
+        "result_key": "next_step",
+        "reads": "advice",
+    },
+    "dream": {
+        "template": (
+            "Here are some memories from session '{session_id}':\n\n"
+            "{combined_text}\n\n"
+            "Now close your eyes and dream. What story, vision, or idea comes from this experience?"
+        ),
+        "context_tags": [],
+        "memory_tags": ["dream", "meta"],
+        "result_key": "dream",
+        "reads": None,
+    },
+}
+
+async def reflective_response(http_request: Request, request: "GenerationOptions", stage_name: str, limit: int = 25):
+    """Run one reflective stage on a session's memories and store the answer as a new memory.
+
+    With ``request.stream`` set, tokens are streamed to the client as they are
+    generated (see ``token_stream``), and the answer is cached and stored once
+    the model has finished.
+    """
+    stage = REFLECTIVE_STAGES[stage_name]
+    tags, prompt_template = stage["context_tags"], stage["template"]
+    memory_tags, result_key = stage["memory_tags"], stage["result_key"]
+    options = generation_options(request)
+
+    async def finish(text: str) -> dict:
+        point = memory_point(text, request.session_id, memory_tags, vector=(await embed_texts([text]))[0])
+        await store_points([point])
+        return {"session_id": request.session_id, result_key: text.strip()}
+
+    if not request.stream:
+        return await finish(await query_and_generate_async(request.session_id, tags, prompt_template, limit=limit, **options))
+
+    prepared = await prepare_session_prompt(request.session_id, tags, prompt_template, limit=limit, **options)
+    if prepared["cached"] is not None:
+        return token_stream_response(http_request, single_token(prepared["cached"]), finish)
+    node = llm_client.admit(prepared["model"])
+
+    async def finish_generation(text: str) -> dict:
+        cache_generation(prepared, text)
+        return await finish(text)
+
+    return token_stream_response(http_request, llm_client.stream(prepared["model"], prepared["prompt"], node=node),
+                                 finish_generation)
 
 class MemoryEntry(BaseModel):
     text: str
     session_id: str = "default"
     tags: List[str] = []
 
-class QueryRequest(BaseModel):
-    vector: list
+class MemoryFilter(BaseModel):
+    """Scope shared by the search models; pushed down to Qdrant's payload indexes."""
+    session_id: str | None = None
+    tags: List[str] = []
+    tags_match: Literal["all", "any"] = "all"
+    since: datetime | None = None  # inclusive timestamp range
+    until: datetime | None = None
+
+class DiversityOptions(BaseModel):
+    """Optional MMR re-ranking that trades relevance for variety among near-duplicates."""
+    mmr: bool = False
+    mmr_lambda: float = RECALL_MMR_LAMBDA  # 1.0 = pure relevance, 0.0 = pure diversity
+    fetch_k: int = RECALL_MMR_FETCH_K  # candidates fetched (with vectors) before re-ranking
+
+class GenerationOptions(DiversityOptions):
+    force_refresh: bool = False  # skip the generation cache and ask the model again
+    stream: bool = False  # stream tokens as NDJSON (or SSE with Accept: text/event-stream)
+
+class SearchOptions(MemoryFilter):
     limit: int = 1
+    offset: int = 0  # pass the previous response's next_offset to page
+    score_threshold: float | None = None  # minimum dense similarity
+    with_vectors: bool = False
 
-class TextQuery(BaseModel):
+class QueryRequest(SearchOptions):
+    vector: list
+
+class TextQuery(SearchOptions, DiversityOptions):
     text: str
-    limit: int = 1
+    mode: str = RECALL_MODE  # "dense", "sparse" or "hybrid"
 
 class TagQuery(BaseModel):
     tags: List[str]
@@ -182,201 +491,436 @@ class TagQuery(BaseModel):
     
 class SummaryRequest(BaseModel):
     session_id: str
-    limit: int = 20  # number of memories to summarize    
+    limit: int = 20  # unused: the rolling summary covers the whole session
+    refresh: bool = False  # fold in memories written since the last update first
+    force_refresh: bool = False  # rebuild the summary from the first memory
+
+def context_diversity(request: DiversityOptions) -> dict:
+    return {"mmr_lambda": request.mmr_lambda, "fetch_k": request.fetch_k} if request.mmr else {}
+
+def generation_options(request: "GenerationOptions") -> dict:
+    return {**context_diversity(request), "force_refresh": request.force_refresh}
+
+def build_memory_filter(scope: MemoryFilter) -> dict:
+    """Qdrant filter for ``scope``; summary points are left out unless their tag is asked for."""
+    must = []
+    if scope.session_id:
+        must.append({"key": "session_id", "match": {"value": scope.session_id}})
+    tags = [tag.lower() for tag in scope.tags]
+    if tags and scope.tags_match == "any":
+        must.append({"key": "tags", "match": {"any": tags}})
+    else:
+        must.extend({"key": "tags", "match": {"value": tag}} for tag in tags)
+    if scope.since or scope.until:
+        must.append({"key": "timestamp", "range": {
+            **({"gte": scope.since.isoformat()} if scope.since else {}),
+            **({"lte": scope.until.isoformat()} if scope.until else {}),
+        }})
+    return {"must": must, "must_not": [] if SUMMARY_TAG in tags else [SUMMARY_POINTS]}
+
+def memory_hit(point, score: float | None = None) -> dict:
+    """Flatten a scored point into its payload plus ``id``, ``score`` and optional ``vector``."""
+    hit = {**(point.payload or {}), "id": point.id, "score": getattr(point, "score", None) if score is None else score}
+    if getattr(point, "vector", None) is not None:
+        hit["vector"] = point.vector
+    return hit
+
+def search_page(hits: list, request: SearchOptions) -> dict:
+    return {
+        "results": hits,
+        "next_offset": request.offset + request.limit if len(hits) == request.limit else None,
+    }
 
 @memory_router.post("/search", operation_id="search_memory_vector")
 def search_memory(request: QueryRequest):
     results = client.search(
         collection_name="panai_memory",
         query_vector=request.vector,
-        limit=request.limit
+        query_filter=build_memory_filter(request),
+        limit=request.limit,
+        offset=request.offset,
+        score_threshold=request.score_threshold,
+        with_vectors=request.with_vectors,
     )
-    return {"results": [r.payload for r in results]}
+    return search_page([memory_hit(r) for r in results], request)
 
-@memory_router.post("/recall", operation_id="recall_memory_by_text")
-def recall_from_text(request: TextQuery):
-    embedded_vector = embed_text(request.text)
-    results = client.search(
+RECALL_MODES = ("dense", "sparse", "hybrid")
+
+async def prune_lexical_index(digests: List[str]):
+    """Drop lexical entries whose memory no longer exists (deleted, or re-keyed by another process)."""
+    try:
+        found = await points_by_hash(digests)
+        stale = [d for d in digests if d not in found]
+        if stale:
+            removed = await asyncio.to_thread(lexical_index.remove, stale)
+            logger.info(f"[LexicalIndex] Pruned {removed} entries without a stored memory")
+    except Exception as e:
+        logger.warning(f"[LexicalIndex] Pruning failed: {e}")
+
+async def points_by_hash(digests: List[str], scope: dict | None = None, with_vectors: bool = False) -> dict:
+    """Fetch the points for lexical hits, dropping those outside ``scope``."""
+    if not digests:
+        return {}
+    points, _ = await async_client.scroll(
         collection_name="panai_memory",
-        query_vector=embedded_vector,
-        limit=request.limit
+        scroll_filter={
+            "must": [{"key": CONTENT_HASH_FIELD, "match": {"any": digests}}, *(scope or {}).get("must", [])],
+            "must_not": (scope or {}).get("must_not", []),
+        },
+        limit=len(digests),
+        with_vectors=with_vectors,
+    )
+    return {p.payload.get(CONTENT_HASH_FIELD): p for p in points}
+
+@memory_router.post("/recall", operation_id="recall_memory_by_text", dependencies=[Depends(require_embedding_model)])
+async def recall_from_text(request: TextQuery):
+    """Recall memories by dense similarity, BM25 term match, or both fused by RRF."""
+    if request.mode not in RECALL_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(RECALL_MODES)}")
+
+    options = json.dumps(request.model_dump(exclude={"text"}), sort_keys=True, default=str)
+    cache_key = ("recall", normalize_query(request.text), options)
+    version, cached = recall_cache.get(cache_key, request.session_id)
+    if cached is not None:
+        return cached
+    response = await _recall(request)
+    recall_cache.put(cache_key, response, version, request.session_id)
+    return response
+
+def diversify(hits: list, k: int, lambda_mult: float, query_vector: list | None = None) -> list:
+    """Pick ``k`` of ``hits`` by MMR over their vectors; hits without a vector are skipped."""
+    pool = [h for h in hits if h.get("vector")]
+    return [pool[i] for i in mmr_select([h["vector"] for h in pool], k, lambda_mult, query_vector)]
+
+async def _recall(request: TextQuery) -> dict:
+    scope = build_memory_filter(request)
+    wanted = request.offset + request.limit
+    # MMR needs an over-fetched candidate pool with vectors; the page is cut after re-ranking.
+    pool = max(request.fetch_k, wanted) if request.mmr else wanted
+    with_vectors = request.with_vectors or request.mmr
+    # score_threshold is a dense similarity, so sparse recall embeds too when one is set.
+    threshold = request.score_threshold
+    embedded_vector = None
+    if request.mode != "sparse" or request.mmr or threshold is not None:
+        embedded_vector = (await embed_texts([request.text]))[0]
+
+    if request.mode == "dense":
+        results = await async_client.search(
+            collection_name="panai_memory",
+            query_vector=embedded_vector,
+            query_filter=scope,
+            limit=pool if request.mmr else request.limit,
+            offset=0 if request.mmr else request.offset,
+            score_threshold=request.score_threshold,
+            with_vectors=with_vectors,
+        )
+        hits = [memory_hit(r) for r in results]
+    else:
+        # Fusion ranks whole candidate lists, so pages are cut from the fused list.
+        depth = max(pool, RECALL_CANDIDATES)
+        # The index filters by session itself; tag and time filters apply below, so over-fetch for them.
+        lexical_depth = depth * 4 if (request.tags or request.since or request.until) else depth
+        lexical_task = asyncio.create_task(
+            asyncio.to_thread(lexical_index.search, request.text, lexical_depth, request.session_id))
+        dense = []
+        if request.mode == "hybrid":
+            dense = await async_client.search(
+                collection_name="panai_memory",
+                query_vector=embedded_vector,
+                query_filter=scope,
+                limit=depth,
+                score_threshold=request.score_threshold,
+                with_vectors=with_vectors,
+            )
+        lexical = [digest for digest, _ in await lexical_task]
+
+        # Points written before content hashes existed fall back to their ID as fusion key.
+        known = {r.payload.get(CONTENT_HASH_FIELD) or str(r.id): r for r in dense}
+        dense_ranking = list(known)
+        # Hits outside the scope (or since deleted) drop out here.
+        lexical_only = await points_by_hash([d for d in lexical if d not in known], scope,
+                                            with_vectors or threshold is not None)
+        unmatched = [d for d in lexical if d not in known and d not in lexical_only]
+        if unmatched and not (request.tags or request.since or request.until):
+            # Session scope is applied by the index too, so these are most likely gone from the store.
+            run_in_background(prune_lexical_index(unmatched))
+        if threshold is not None:
+            # Dense hits already passed the threshold; hold lexical-only hits to the same similarity.
+            lexical_only = {d: p for d, p in lexical_only.items()
+                            if p.vector and cosine_similarity(embedded_vector, p.vector) >= threshold}
+            if not with_vectors:
+                for p in lexical_only.values():
+                    p.vector = None
+        known.update(lexical_only)
+        lexical_ranking = [d for d in lexical if d in known]
+        fused = rrf_fuse([dense_ranking, lexical_ranking], k=RECALL_RRF_K, limit=pool)
+        hits = [memory_hit(known[d], score) for d, score in fused]
+        if not request.mmr:
+            hits = hits[request.offset:]
+
+    if request.mmr:
+        hits = diversify(hits, wanted, request.mmr_lambda, embedded_vector)[request.offset:]
+        if not request.with_vectors:
+            for hit in hits:
+                hit.pop("vector", None)
+    return search_page(hits, request)
+
+class RecallQuery(SearchOptions):
+    text: str | None = None
+    vector: list | None = None  # skips embedding when given
+    limit: int = 5
+
+class RecallBatchRequest(BaseModel):
+    queries: List[RecallQuery]
+
+@memory_router.post("/recall_batch", operation_id="recall_memory_batch", dependencies=[Depends(require_embedding_model)])
+async def recall_batch(request: RecallBatchRequest):
+    """Run many dense recalls in one round trip: one encoder batch, one Qdrant batch search.
+
+    Results come back in query order, one ``{"results": [...]}`` per query.
+    """
+    if len(request.queries) > RECALL_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {RECALL_BATCH_MAX_QUERIES} queries per batch")
+    for i, query in enumerate(request.queries):
+        if (query.text is None) == (query.vector is None):
+            raise HTTPException(status_code=400, detail=f"Query {i}: give exactly one of 'text' or 'vector'")
+        if query.vector is not None and len(query.vector) != MEMORY_VECTOR_SIZE:
+            raise HTTPException(status_code=400, detail=f"Query {i}: 'vector' must have {MEMORY_VECTOR_SIZE} dimensions")
+    if not request.queries:
+        return {"results": []}
+
+    to_embed = [i for i, q in enumerate(request.queries) if q.vector is None]
+    vectors = [q.vector for q in request.queries]
+    if to_embed:
+        embedded = await embed_texts([request.queries[i].text for i in to_embed])
+        for i, vector in zip(to_embed, embedded):
+            if vector is None:
+                raise HTTPException(status_code=503, detail=f"Query {i}: embedding failed")
+            vectors[i] = vector
+
+    batches = await async_client.search_batch(
+        collection_name="panai_memory",
+        requests=[
+            SearchRequest(
+                vector=vector,
+                filter=build_memory_filter(query),
+                limit=query.limit,
+                offset=query.offset,
+                score_threshold=query.score_threshold,
+                with_vector=query.with_vectors,
+                with_payload=True,
+            )
+            for query, vector in zip(request.queries, vectors)
+        ],
     )
-    return {"results": [r.payload for r in results]}
+    return {"results": [search_page([memory_hit(r) for r in hits], query) for query, hits in zip(request.queries, batches)]}
 
 
 @memory_router.post("/search_by_tag", operation_id="search_memory_by_tag")
 def search_by_tag(request: TagQuery, req: Request):
     print(f"[TAG SEARCH] From {req.client.host}, Tags: {request.tags}")
+    tags = sorted(set(tag.lower() for tag in request.tags))
+    cache_key = ("tags", tuple(tags), request.limit)
+    version, cached = recall_cache.get(cache_key)
+    if cached is not None:
+        return cached
     results = client.scroll(
         collection_name="panai_memory",
         scroll_filter={
-            "must": [
-                *([{"key": "tags", "match": {"value": tag.lower()}} for tag in request.tags] if request.tags else [])
-            ]
+            "must": [{"key": "tags", "match": {"value": tag}} for tag in tags],
+            "must_not": [] if SUMMARY_TAG in tags else [SUMMARY_POINTS],
         },
         limit=request.limit
     )
-    return {"results": [r.payload for r in results[0]]}
+    response = {"results": [r.payload for r in results[0]]}
+    recall_cache.put(cache_key, response, version)
+    return response
 
 class MemoryLog(BaseModel):
     text: str
     session_id: str = "default"
     tags: List[str] = []
+    wait_for_commit: bool = False  # block until the memory is searchable
 
-@memory_router.post("/log_memory", operation_id="log_memory")
+@memory_router.post("/log_memory", operation_id="log_memory", dependencies=[Depends(require_embedding_model)])
 def log_memory(entry: MemoryLog):
-    log_generic_memory(entry.text, entry.session_id, entry.tags)
-    return {"status": "🧠 Memory logged.", "session_id": entry.session_id}
+    try:
+        memory_id = log_generic_memory(entry.text, entry.session_id, entry.tags, wait_for_commit=entry.wait_for_commit)
+    except MemoryNotCommitted as e:
+        # The memory is in the WAL and will still be flushed; only the wait failed.
+        raise HTTPException(status_code=503, detail=f"Memory {e.record_id} accepted but not yet committed: {e}")
+    except Exception as e:
+        logger.error(f"Failed to accept memory for session '{entry.session_id}': {e}")
+        raise HTTPException(status_code=500, detail=f"Memory was not accepted: {e}")
+    return {
+        "status": "🧠 Memory logged.",
+        "session_id": entry.session_id,
+        "memory_id": memory_id,
+        "committed": entry.wait_for_commit and memory_id is not None,
+    }
 
-@memory_router.post("/store", operation_id="store_memory")
+@memory_router.post("/store", operation_id="store_memory", dependencies=[Depends(require_embedding_model)])
 def store_memory_alias(entry: MemoryLog):
     return log_memory(entry)
 
-@memory_router.post("/summarize", operation_id="summarize_session")
-def summarize_session(request: SummaryRequest):
-    # Pull matching memories
-    results = client.scroll(
-        collection_name="panai_memory",
-        scroll_filter={
-            "must": [
-                {"key": "session_id", "match": {"value": request.session_id}}
-            ]
-        },
-        limit=request.limit
-    )
+async def read_session_summary(session_id: str) -> dict | None:
+    points = await async_client.retrieve(collection_name="panai_memory", ids=[summary_point_id(session_id)], with_payload=True)
+    return points[0].payload if points else None
 
-    # Combine memory texts
-    memories = [r.payload["text"] for r in results[0]]
-    combined_text = "\n".join(memories)
-
-    # Ask Mistral for a summary
-    summary = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "mistral",
-            "prompt": f"Summarize the following memories:\n{combined_text}\n\nSummary:",
-            "stream": False
-        }
-    ).json()["response"]
+async def stamp_unstamped_memories(session_id: str):
+    """Give memories stored without ``committed_at`` (older data, other writers) a stamp, oldest first."""
+    while True:
+        points, _ = await async_client.scroll(
+            collection_name="panai_memory",
+            scroll_filter={
+                "must": [{"key": "session_id", "match": {"value": session_id}}, {"is_empty": {"key": COMMIT_FIELD}}],
+                "must_not": [SUMMARY_POINTS],
+            },
+            limit=SESSION_SUMMARY_BATCH,
+            order_by=OLDEST_FIRST,
+        )
+        if not points:
+            return
+        with commit_clock.commit(points):
+            await async_client.batch_update_points(
+                collection_name="panai_memory",
+                update_operations=[
+                    SetPayloadOperation(set_payload=SetPayload(payload={COMMIT_FIELD: p.payload[COMMIT_FIELD]}, points=[p.id]))
+                    for p in points
+                ],
+            )
 
+async def update_session_summary(session_id: str, rebuild: bool = False) -> dict | None:
+    """Fold the memories committed since the last update into the session's rolling summary.
+
+    Memories are read in commit order (``committed_at``), not by their own
+    timestamp, so late and back-dated writes are folded too. Each batch holds
+    at most ``SESSION_SUMMARY_BATCH`` memories that fit ``CONTEXT_CHUNK_TOKENS``
+    and costs one generation. The summary point is rewritten after every
+    batch, so an interrupted update keeps its progress. ``rebuild`` starts
+    over from the first memory, as does a summary written before commit
+    stamps existed.
+    """
+    lock = summary_locks.setdefault(session_id, asyncio.Lock())
+    async with lock:
+        seen = summary_tracker.pending(session_id)
+        current = None if rebuild else await read_session_summary(session_id)
+        if current and "summarized_through" not in current:
+            current = None
+        summary = current["text"] if current else ""
+        through = current.get("summarized_through") if current else None
+        covered = current.get("memories", 0) if current else 0
+        folded = 0
+        await stamp_unstamped_memories(session_id)
+        horizon = commit_clock.horizon()  # later commits wait for the next update
+        while True:
+            stamps = {"lte": horizon}
+            if through:
+                stamps["gt"] = through
+            batch, _ = await async_client.scroll(
+                collection_name="panai_memory",
+                scroll_filter={
+                    "must": [{"key": "session_id", "match": {"value": session_id}},
+                             {"key": COMMIT_FIELD, "range": stamps}],
+                    "must_not": [SUMMARY_POINTS],
+                },
+                limit=SESSION_SUMMARY_BATCH,
+                order_by=COMMIT_ORDER,
+            )
+            if not batch:
+                break
+            texts = [p.payload.get("text", "") for p in batch]
+            batch = batch[:len(chunk_by_tokens(texts, CONTEXT_CHUNK_TOKENS, CONTEXT_CHARS_PER_TOKEN)[0])]
+            prompt = fold_prompt(session_id, summary, texts[:len(batch)])
+            summary = (await llm_client.generate(SESSION_SUMMARY_MODEL, prompt)).strip()
+            through = batch[-1].payload[COMMIT_FIELD]
+            folded += len(batch)
+            covered += len(batch)
+
+            point = memory_point(summary, session_id, [SUMMARY_TAG, "meta"], vector=(await embed_texts([summary]))[0])
+            point["id"] = summary_point_id(session_id)
+            point["payload"].update({
+                "content_hash": summary_digest(session_id),
+                "summarized_until": batch[-1].payload.get("timestamp"),
+                "summarized_through": through,
+                "memories": covered,
+            })
+            await store_points([point])
+            current = point["payload"]
+        summary_tracker.clear(session_id, seen, folded)
+        return current
+
+async def session_summary_loop():
+    """Bring rolling summaries up to date for sessions with enough new (or settled) memories."""
+    while True:
+        await asyncio.sleep(SESSION_SUMMARY_POLL_SECONDS)
+        for session_id in summary_tracker.due():
+            try:
+                await update_session_summary(session_id)
+            except Exception as e:
+                summary_tracker.failed(session_id)
+                logger.warning(f"[SessionSummary] Update for '{session_id}' failed: {e}")
+
+@memory_router.post("/summarize", operation_id="summarize_session", dependencies=[Depends(require_embedding_model)])
+async def summarize_session(request: SummaryRequest):
+    """Return the session's rolling summary.
+
+    The stored summary is returned as is (it may trail the newest ``pending``
+    memories). ``refresh`` folds those in first, and ``force_refresh``
+    rebuilds the summary from the first memory.
+    """
+    payload = None
+    if not (request.refresh or request.force_refresh):
+        payload = await read_session_summary(request.session_id)
+    if payload is None:
+        payload = await update_session_summary(request.session_id, rebuild=request.force_refresh)
+    payload = payload or {}
     return {
         "session_id": request.session_id,
-        "summary": summary.strip()
+        "summary": payload.get("text", ""),
+        "memories": payload.get("memories", 0),
+        "summarized_until": payload.get("summarized_until"),
+        "pending": summary_tracker.pending(request.session_id),
     }
 
-class ReflectRequest(BaseModel):
+class ReflectRequest(GenerationOptions):
     session_id: str
     limit: int = 20
 
-@memory_router.post("/reflect", operation_id="reflect_on_session")
-async def reflect_on_session(request: ReflectRequest):
-    prompt_template = (
-        "Here is a series of memory logs from session '{session_id}':\n\n"
-        "{combined_text}\n\n"
-        "Reflect on these memories. What patterns, concerns, or deeper insights emerge?"
-    )
-    reflection = await query_and_generate_async(request.session_id, [], prompt_template)
-    reflection_point = {
-        "id": str(uuid.uuid4()),
-        "vector": embed_text(reflection),
-        "payload": {
-            "text": reflection,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "session_id": request.session_id,
-            "tags": ["reflection", "meta"]
-        }
-    }
-    client.upsert(collection_name="panai_memory", points=[reflection_point])
-    return {"session_id": request.session_id, "reflection": reflection.strip()}
+@memory_router.post("/reflect", operation_id="reflect_on_session", dependencies=[Depends(require_embedding_model)])
+async def reflect_on_session(request: ReflectRequest, http_request: Request):
+    return await reflective_response(http_request, request, "reflect")
 
-class AdviceRequest(BaseModel):
+class AdviceRequest(GenerationOptions):
     session_id: str
     limit: int = 10
 
-@memory_router.post("/advice", operation_id="give_advice")
-async def give_advice(request: AdviceRequest):
-    prompt_template = (
-        "Based on these reflections from session '{session_id}':\n\n"
-        "{combined_text}\n\n"
-        "What advice would you give for moving forward?"
-    )
-    advice = await query_and_generate_async(request.session_id, ["reflection"], prompt_template, limit=request.limit)
-    advice_point = {
-        "id": str(uuid.uuid4()),
-        "vector": embed_text(advice),
-        "payload": {
-            "text": advice,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "session_id": request.session_id,
-            "tags": ["advice", "meta"]
-        }
-    }
-    client.upsert(collection_name="panai_memory", points=[advice_point])
-    return {"session_id": request.session_id, "advice": advice.strip()}
+@memory_router.post("/advice", operation_id="give_advice", dependencies=[Depends(require_embedding_model)])
+async def give_advice(request: AdviceRequest, http_request: Request):
+    return await reflective_response(http_request, request, "advice", limit=request.limit)
 
-class PlanRequest(BaseModel):
+class PlanRequest(GenerationOptions):
     session_id: str
     limit: int = 10
 
-@memory_router.post("/plan", operation_id="generate_plan")
-async def generate_plan(request: PlanRequest):
-    prompt_template = (
-        "Based on this advice history for session '{session_id}', "
-        "outline a clear, step-by-step plan of action:\n\n{combined_text}\n\nPlan:"
-    )
-    plan = await query_and_generate_async(request.session_id, ["advice"], prompt_template, limit=request.limit)
-    plan_point = {
-        "id": str(uuid.uuid4()),
-        "vector": embed_text(plan),
-        "payload": {
-            "text": plan,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "session_id": request.session_id,
-            "tags": ["plan", "meta"]
-        }
-    }
-    client.upsert(collection_name="panai_memory", points=[plan_point])
-    return {"session_id": request.session_id, "plan": plan.strip()}
+@memory_router.post("/plan", operation_id="generate_plan", dependencies=[Depends(require_embedding_model)])
+async def generate_plan(request: PlanRequest, http_request: Request):
+    return await reflective_response(http_request, request, "plan", limit=request.limit)
 
-class DreamRequest(BaseModel):
+class DreamRequest(GenerationOptions):
     session_id: str
     limit: int = 25
 
-@memory_router.post("/dream", operation_id="dream_from_memory")
-async def dream_from_memory(request: DreamRequest):
-    prompt_template = (
-        "Here are some memories from session '{session_id}':\n\n"
-        "{combined_text}\n\n"
-        "Now close your eyes and dream. What story, vision, or idea comes from this experience?"
-    )
-    dream = await query_and_generate_async(request.session_id, [], prompt_template, limit=request.limit)
-    dream_point = {
-        "id": str(uuid.uuid4()),
-        "vector": embed_text(dream),
-        "payload": {
-            "text": dream,
-            "timestamp": datetime.utcnow().isoformat(),
-            "session_id": request.session_id,
-            "tags": ["dream", "meta"]
-        }
-    }
-
-    client.upsert(
-        collection_name="panai_memory",
-        points=[dream_point]
-    )
-
-    return {
-        "session_id": request.session_id,
-        "dream": dream.strip()
-    }
+@memory_router.post("/dream", operation_id="dream_from_memory", dependencies=[Depends(require_embedding_model)])
+async def dream_from_memory(request: DreamRequest, http_request: Request):
+    return await reflective_response(http_request, request, "dream", limit=request.limit)
 
 class DreamLogRequest(BaseModel):
     text: str
     session_id: str = "default"
     tags: List[str] = ["dream", "meta"]
 
-@memory_router.post("/log_dream", operation_id="log_dream")
+@memory_router.post("/log_dream", operation_id="log_dream", dependencies=[Depends(require_embedding_model)])
 def log_dream(entry: DreamLogRequest):
     log_generic_memory(entry.text, entry.session_id, entry.tags)
     return {"status": "🌙 Dream logged.", "session_id": entry.session_id}
@@ -386,7 +930,7 @@ class ReflectionLogRequest(BaseModel):
     session_id: str = "default"
     tags: List[str] = ["reflection", "meta"]
 
-@memory_router.post("/log_reflection", operation_id="log_reflection")
+@memory_router.post("/log_reflection", operation_id="log_reflection", dependencies=[Depends(require_embedding_model)])
 def log_reflection(entry: ReflectionLogRequest):
     log_generic_memory(entry.text, entry.session_id, entry.tags)
     return {"status": "🔍 Reflection logged.", "session_id": entry.session_id}
@@ -396,7 +940,7 @@ class AdviceLogRequest(BaseModel):
     session_id: str = "default"
     tags: List[str] = ["advice", "meta"]
 
-@memory_router.post("/log_advice", operation_id="log_advice")
+@memory_router.post("/log_advice", operation_id="log_advice", dependencies=[Depends(require_embedding_model)])
 def log_advice(entry: AdviceLogRequest):
     log_generic_memory(entry.text, entry.session_id, entry.tags)
     return {"status": "💡 Advice logged.", "session_id": entry.session_id}
@@ -406,45 +950,84 @@ class PlanLogRequest(BaseModel):
     session_id: str = "default"
     tags: List[str] = ["plan", "meta"]
 
-@memory_router.post("/log_plan", operation_id="log_plan")
+@memory_router.post("/log_plan", operation_id="log_plan", dependencies=[Depends(require_embedding_model)])
 def log_plan(entry: PlanLogRequest):
     log_generic_memory(entry.text, entry.session_id, entry.tags)
     return {"status": "🧭 Plan logged.", "session_id": entry.session_id}
 
-@memory_router.post("/next", operation_id="generate_next_step")
-async def next_step(request: PlanRequest):
-    prompt_template = (
-        "Here’s recent advice from session '{session_id}':\n\n"
-        "{combined_text}\n\n"
-        "What is the single most important next step to take right now?"
-    )
-    next_step = await query_and_generate_async(request.session_id, ["advice"], prompt_template, limit=request.limit)
-    next_step_point = {
-        "id": str(uuid.uuid4()),
-        "vector": embed_text(next_step),
-        "payload": {
-            "text": next_step,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "session_id": request.session_id,
-            "tags": ["next", "meta"]
-        }
-    }
-
-    client.upsert(
-        collection_name="panai_memory",
-        points=[next_step_point]
-    )
+@memory_router.post("/next", operation_id="generate_next_step", dependencies=[Depends(require_embedding_model)])
+async def next_step(request: PlanRequest, http_request: Request):
+    return await reflective_response(http_request, request, "next", limit=request.limit)
 
+class PipelineRequest(DiversityOptions):
+    session_id: str
+    stages: List[Literal["reflect", "advice", "plan", "next", "dream"]] = ["reflect", "advice", "plan", "next"]
+    limit: int = 20  # memories read by stages that do not follow their input stage
+    force_refresh: bool = False  # skip the generation cache and ask the model again
+
+async def generate_from_text(stage: dict, session_id: str, text: str, force_refresh: bool = False,
+                             model: str = "mistral-nemo") -> str:
+    """Run a stage on another stage's answer, cached by the hash of that answer."""
+    template = stage["template"]
+    cache_key = generation_key(model, template, session_id, [content_hash(session_id, text)])
+    if force_refresh:
+        generation_cache.note_refresh()
+    else:
+        cached = generation_cache.get(cache_key, model, template, session_id)
+        if cached is not None:
+            return cached
+    generated = await llm_client.generate(model, template.format(session_id=session_id, combined_text=text))
+    generation_cache.put(cache_key, model, template, session_id, generated)
+    return generated
+
+@memory_router.post("/pipeline", operation_id="run_reflective_pipeline", dependencies=[Depends(require_embedding_model)])
+async def run_pipeline(request: PipelineRequest):
+    """Run a chain of reflective stages (by default reflect, advice, plan, next) in one request.
+
+    A stage whose input stage ran earlier in the chain (advice after reflect,
+    plan and next after advice) reads that answer directly, without a scroll.
+    Other stages read the session like their own endpoint does. All answers
+    are embedded in one batch and stored with one upsert at the end.
+    """
+    if not request.stages:
+        raise HTTPException(status_code=400, detail="stages must not be empty")
+    options = generation_options(request)
+    outputs: dict = {}
+    generated = []
+    for name in request.stages:
+        stage = REFLECTIVE_STAGES[name]
+        try:
+            if stage["reads"] in outputs:
+                text = await generate_from_text(stage, request.session_id, outputs[stage["reads"]], request.force_refresh)
+            else:
+                prepared = await prepare_session_prompt(request.session_id, stage["context_tags"], stage["template"],
+                                                        limit=request.limit, **options)
+                text = prepared["cached"]
+                if text is None:
+                    text = await llm_client.generate(prepared["model"], prepared["prompt"])
+                    cache_generation(prepared, text)
+        except httpx.HTTPError as e:
+            logger.error(f"[Pipeline] Stage '{name}' failed for session '{request.session_id}': {e}")
+            raise HTTPException(status_code=502, detail=f"Language model failed at stage '{name}': {e}")
+        outputs[name] = text
+        generated.append((stage, text))
+
+    vectors = await embed_texts([text for _, text in generated])
+    await store_points([
+        memory_point(text, request.session_id, stage["memory_tags"], vector=vector)
+        for (stage, text), vector in zip(generated, vectors)
+    ])
     return {
         "session_id": request.session_id,
-        "next_step": next_step.strip()
+        "stages": request.stages,
+        **{stage["result_key"]: text.strip() for stage, text in generated},
     }
 
 class JournalRequest(BaseModel):
     session_id: str
     entry: str
 
-@memory_router.post("/journal", operation_id="log_journal_entry")
+@memory_router.post("/journal", operation_id="log_journal_entry", dependencies=[Depends(require_embedding_model)])
 def log_journal_entry(request: JournalRequest):
     log_generic_memory(request.entry, request.session_id, ["journal", "meta"])
     return {
@@ -462,7 +1045,7 @@ class SyncRequest(BaseModel):
 async def sync_with_peer(req: SyncRequest):
     # Prevent self-syncing based on peer_url
     local_hostnames = {socket.gethostname(), socket.getfqdn(), "localhost"}
-    peer_url = normalize_peer_url(req.peer_url)
+    peer_url = await asyncio.to_thread(normalize_peer_url, req.peer_url)  # DNS lookup blocks
     print("Received sync_with_peer request")
     print(f"Request contents: {req}")
     if req.peer_url:
@@ -488,15 +1071,18 @@ async def sync_with_peer(req: SyncRequest):
     if req.tags:
         scroll_filter["should"] = [{"key": "tags", "match": {"value": tag.lower()}} for tag in req.tags]
 
+    # Each node keeps its own rolling summaries; never push them to peers.
+    scroll_filter["must_not"] = [SUMMARY_POINTS]
+
     # Always exclude entries already synced to this peer
     if req.peer_url:
         exclude_tag = f"synced:{peer_url}"
-        scroll_filter["must_not"] = [{"key": "tags", "match": {"value": exclude_tag}}]
+        scroll_filter["must_not"].append({"key": "tags", "match": {"value": exclude_tag}})
 
     # Print sync request details
     print(f"[SyncWithPeer] Received sync request from {req.peer_url} — Tags: {req.tags}, Session: {req.session_id}")
 
-    results = client.scroll(
+    results = await async_client.scroll(
         collection_name="panai_memory",
         scroll_filter=scroll_filter,
         limit=req.limit,
@@ -548,19 +1134,10 @@ async def sync_with_peer(req: SyncRequest):
                 tag = f"synced:{peer_url}"
                 if tag not in entry["tags"]:
                     entry["tags"].append(tag)
-                    client.upsert(
-                        collection_name="panai_memory",
-                        points=[{
-                            "id": entry["id"],
-                            "vector": entry["vector"],
-                            "payload": {
-                                "text": entry["text"],
-                                "timestamp": datetime.now(timezone.utc).isoformat(),
-                                "session_id": entry["session_id"],
-                                "tags": entry["tags"]
-                            }
-                        }]
-                    )
+                    # Only the tags change; timestamp and committed_at stay as first stored.
+                    await async_client.set_payload(collection_name="panai_memory",
+                                                   payload={"tags": entry["tags"]}, points=[entry["id"]])
+                    recall_cache.bump([entry["session_id"]])
                 successes += 1
             except Exception as e:
                 print(f"Failed to sync memory entry: {e}")
@@ -586,35 +1163,14 @@ def store_synced_memory(entry: dict):
     if not text:
         return
 
-    # Check if a memory with same hash exists
-    existing = client.scroll(
-        collection_name="panai_memory",
-        scroll_filter={
-            "must": [
-                {"key": "session_id", "match": {"value": session_id}},
-                {"key": "text", "match": {"value": text}}
-            ]
-        },
-        limit=1
-    )
-
-    if existing[0]:
+    # Skip if a memory with the same hash was committed recently
+    point = memory_point(text, session_id, tags)
+    if recent_hashes.seen(point["payload"]["content_hash"]):
         print(f"[Memory Sync] Skipping duplicate: {text[:40]}...")
         return
 
-    # Otherwise, embed and store it
-    vector = embed_text(text)
-    point = {
-        "id": str(uuid.uuid4()),
-        "vector": vector,
-        "payload": {
-            "text": text,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "session_id": session_id,
-            "tags": tags
-        }
-    }
-    client.upsert(collection_name="panai_memory", points=[point])
+    # Otherwise, queue it for batched embedding and storage
+    ingest_buffer.submit(point)
     # print(f"[Memory Sync] Stored: {text[:40]}...")
 
 @stats_router.get("/admin/memory_stats", operation_id="memory_stats")
@@ -633,7 +1189,88 @@ def memory_stats():
             "message": str(e)
         }
 
-@memory_router.post("/mesh/log_chat", operation_id="log_chat_to_mesh")
+@stats_router.get("/admin/embedding_stats", operation_id="embedding_stats")
+def embedding_batch_stats():
+    return {"embedding": embedding_stats(), "status": "ok"}
+
+@stats_router.get("/admin/ingest_stats", operation_id="ingest_stats")
+def ingest_buffer_stats():
+    return {"ingest": ingest_buffer.stats(), "dedup": recent_hashes.stats(), "lexical_index": lexical_index.stats(), "status": "ok"}
+
+@stats_router.get("/admin/recall_cache_stats", operation_id="recall_cache_stats")
+def recall_cache_stats():
+    return {"recall_cache": recall_cache.stats(), "status": "ok"}
+
+@stats_router.get("/admin/generation_cache_stats", operation_id="generation_cache_stats")
+def generation_cache_stats():
+    return {"generation_cache": generation_cache.stats(), "status": "ok"}
+
+@stats_router.get("/admin/session_summary_stats", operation_id="session_summary_stats")
+def session_summary_stats():
+    return {"session_summaries": summary_tracker.stats(), "commit_clock": commit_clock.stats(), "status": "ok"}
+
+@stats_router.get("/admin/llm_stats", operation_id="llm_client_stats")
+def llm_stats():
+    return {"llm_client": llm_client.stats(), "scheduler": llm_scheduler.stats(), "status": "ok"}
+
+@stats_router.get("/admin/model_residency", operation_id="model_residency_stats")
+def model_residency_stats():
+    return {"residency": model_residency.stats(), "enabled": llm_client.residency is not None, "status": "ok"}
+
+@stats_router.get("/admin/inference_routing", operation_id="inference_routing_stats")
+def inference_routing_stats():
+    routing = llm_client.router.stats() if llm_client.router is not None else {"enabled": False}
+    return {"routing": routing, "status": "ok"}
+
+@stats_router.get("/admin/executor_stats", operation_id="executor_stats")
+def executor_pool_stats():
+    return {**executor_stats(), "qdrant_client": qdrant_stats(), "status": "ok"}
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    """Stream a response that is produced while the request body is still being read.
+
+    ``StreamingResponse`` (ASGI spec < 2.4) listens for client disconnects by
+    calling ``receive()`` concurrently, which steals the body chunks that
+    ``request.stream()`` is waiting for. Here, a disconnect instead surfaces
+    as a failed ``send``.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@memory_router.post("/ingest", operation_id="bulk_ingest_memories", dependencies=[Depends(require_embedding_model)])
+async def bulk_ingest(request: Request, report: str = "all"):
+    """Ingest newline-delimited JSON memories and stream back NDJSON results.
+
+    Use ``report=errors`` to only stream failed lines (plus the final summary)
+    when pushing very large files.
+    """
+    if report not in ("all", "errors"):
+        raise HTTPException(status_code=400, detail="report must be 'all' or 'errors'")
+
+    async def upsert(points):
+        await store_points(points)
+
+    async def results():
+        async for result in ingest_ndjson(
+            request.stream(),
+            embed_texts,
+            upsert,
+            MEMORY_VECTOR_SIZE,
+            chunk_size=BULK_INGEST_CHUNK_SIZE,
+            max_line_bytes=BULK_INGEST_MAX_LINE_BYTES,
+            seen=recent_hashes.check_and_add,
+            forget=recent_hashes.discard,
+        ):
+            if report == "errors" and result.get("status") in ("ok", "duplicate"):
+                continue
+            yield json.dumps(result) + "\n"
+
+    return RequestBodyStreamingResponse(results(), media_type="application/x-ndjson")
+
+@memory_router.post("/mesh/log_chat", operation_id="log_chat_to_mesh", dependencies=[Depends(require_embedding_model)])
 def log_chat_to_mesh(entry: MemoryEntry):
     log_generic_memory(entry.text, entry.session_id, entry.tags)
     return {"status": "🌐 Chat memory logged to mesh.", "session_id": entry.session_id}
@@ -656,11 +1293,11 @@ async def sync_all_peers():
                 # skip self by IP
                 if ip != socket.gethostbyname(socket.gethostname()):
                     local_peers.add(f"{ip}:8000")
-    zeroconf = Zeroconf()
+    zeroconf = await asyncio.to_thread(Zeroconf)
     browser = ServiceBrowser(zeroconf, SERVICE_TYPE, handlers=[on_service_state_change])
     # Give mDNS a moment to discover peers
     await asyncio.sleep(2)
-    zeroconf.close()
+    await asyncio.to_thread(zeroconf.close)
     # Filter out localhost variants from mDNS-discovered peers
     local_peers = {peer for peer in local_peers if not peer.startswith("127.") and "localhost" not in peer}
     print(f"[Memory Sync] Discovered LAN peers via mDNS: {local_peers}")
@@ -701,7 +1338,7 @@ async def sync_all_peers():
             return "127.0.0.1"
         finally:
             s.close()
-    local_fqdn = get_local_ip()
+    local_fqdn = await asyncio.to_thread(get_local_ip)
     local_names = {local_short, local_fqdn, "localhost"}
     print(f"[Memory Sync] Local host names: short={local_short}, fqdn={local_fqdn}")
 
@@ -733,7 +1370,7 @@ async def sync_all_peers():
         # Try to resolve hostname; if fails, fallback to IP
         original_hostname = hostname
         try:
-            socket.gethostbyname(hostname)
+            await asyncio.to_thread(socket.gethostbyname, hostname)
         except socket.gaierror:
             hostname = node.get("ip")
             print(f"[Memory Sync] Fallback to IP: {hostname}")
@@ -800,7 +1437,7 @@ async def memory_sync_loop():
         except Exception as e:
             print(f"[Memory Sync Loop] ERROR: {e}")
 
-__all__ = ["memory_router", "stats_router", "log_memory", "store_synced_memory", "MemoryEntry", "log_chat_to_mesh", "memory_sync_loop", "sync_all_peers"]
+__all__ = ["memory_router", "stats_router", "require_embedding_model", "ingest_buffer", "log_memory", "store_synced_memory", "MemoryEntry", "log_chat_to_mesh", "memory_sync_loop", "sync_all_peers"]
 
 
 @stats_router.get("/admin/dump_memories", operation_id="dump_memories")
@@ -827,7 +1464,7 @@ def dump_all_memories(limit: int = 20):
 # Qdrant does not support filtering on null/missing vectors directly.
 # As a workaround, this endpoint will fetch the first `limit` entries (with no filter)
 # and attempt to re-embed those whose vector is missing or None.
-@stats_router.post("/admin/reembed_missing", operation_id="reembed_missing")
+@stats_router.post("/admin/reembed_missing", operation_id="reembed_missing", dependencies=[Depends(require_embedding_model)])
 def reembed_missing(limit: int = 100):
     results = client.scroll(
         collection_name="panai_memory",
@@ -844,26 +1481,18 @@ def reembed_missing(limit: int = 100):
         if vector is not None and isinstance(vector, list) and len(vector) > 0:
             continue
         text = point.payload.get("text", "")
-        session_id = point.payload.get("session_id", "default")
-        tags = point.payload.get("tags", [])
         if not text:
             skipped += 1
             continue
         try:
             vector = embed_text(text)
+            # Keep the payload as is so content_hash (dedup, lexical joins) survives.
             client.upsert(
                 collection_name="panai_memory",
-                points=[{
-                    "id": point.id,
-                    "vector": vector,
-                    "payload": {
-                        "text": text,
-                        "timestamp": point.payload.get("timestamp"),
-                        "session_id": session_id,
-                        "tags": tags
-                    }
-                }]
+                points=[{"id": point.id, "vector": vector, "payload": {**point.payload}}]
             )
+            lexical_index.add([point.payload])
+            recall_cache.bump([point.payload.get("session_id")])
             reembedded += 1
         except Exception as e:
             # print(f"[ERROR] Failed to re-embed: {text[:40]}... | {e}")
@@ -921,4 +1550,9 @@ async def start_background_tasks():
         with open(log_path, "w") as f:
             json.dump([], f)
 
+    # Replay any memories left in the WAL by a crash and start flushing.
+    ingest_buffer.start()
+    if SESSION_SUMMARY_ENABLED:
+        asyncio.create_task(session_summary_loop())
+
     asyncio.create_task(memory_sync_loop())
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""Maximal-marginal-relevance (MMR) re-ranking over candidate vectors.
+
+Active sessions accumulate near-duplicate memories, such as the same
+reflection logged many times. Plain similarity ranking then fills the result
+list, and the LLM context built from it, with copies. MMR picks results one
+at a time and trades relevance to the query against similarity to what was
+already picked:
+
+    score(d) = lambda * sim(q, d) - (1 - lambda) * max_{s in selected} sim(d, s)
+
+Each greedy step computes the similarity of every candidate to the newest
+pick only and folds it into a running "closest selected" vector, so
+selecting k of n candidates costs O(n * dim * k) and never builds the
+n x n matrix. With a few hundred candidates this takes a few milliseconds.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return float(_normalize(a) @ _normalize(b))
+
+
+def mmr_select(candidates: Sequence[Sequence[float]], k: int, lambda_mult: float = 0.5,
+               query: Optional[Sequence[float]] = None) -> list:
+    """Return indices of ``k`` candidates chosen by MMR, in selection order.
+
+    Without a ``query`` the candidates' centroid stands in for it, which
+    favours memories that are representative yet not redundant. That suits
+    building an LLM context from a session.
+    """
+    if k <= 0 or len(candidates) == 0:
+        return []
+    vectors = _normalize(np.asarray(candidates, dtype=np.float32))
+    n = vectors.shape[0]
+    k = min(k, n)
+    target = vectors.mean(axis=0) if query is None else np.asarray(query, dtype=np.float32)
+    relevance = vectors @ _normalize(target)
+    selected = [int(np.argmax(relevance))]
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    closest = vectors @ vectors[selected[0]]
+    for _ in range(k - 1):
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * closest
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(closest, vectors @ vectors[pick], out=closest)
+    return selected
+
+
+__all__ = ["cosine_similarity", "mmr_select"]
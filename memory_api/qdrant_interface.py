@@ -1,28 +1,364 @@
-"""Qdrant database interface and helper functions."""
+"""Qdrant database interface and helper functions.
 
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance
+All modules reach the vector store through the handles built here: ``client``
+(sync) for threads and sync routes, and ``async_client`` for async routes.
+Both are created once from ``services/config.py``. They keep a pool of
+keep-alive connections (or a gRPC channel with ``QDRANT_PREFER_GRPC``), bound
+every request by ``QDRANT_TIMEOUT``, and retry transient failures with backoff.
 
-client = QdrantClient(
-    host="localhost",
-    port=6333,
-    prefer_grpc=False,
+With ``MEMORY_BACKEND=embedded`` the same handles are instead backed by
+``memory_api.embedded_store``, which keeps vectors in local files and needs no
+Qdrant server. Both backends expose the same client methods.
+"""
+
+import asyncio
+import copy
+import functools
+import inspect
+import time
+
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+from qdrant_client.http.models import (
+    Disabled,
+    Distance,
+    HnswConfigDiff,
+    PayloadSchemaType,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from memory_api.config_loader import load_config
+from memory_api.embedded_store import AsyncEmbeddedClient, EmbeddedClient
+from memory_api.memory_logger import logger
+from services.config import (
+    EMBEDDED_INDEX,
+    EMBEDDED_IVF_MIN_POINTS,
+    EMBEDDED_IVF_NPROBE,
+    EMBEDDED_STORE_PATH,
+    MEMORY_BACKEND,
+    QDRANT_API_KEY,
+    QDRANT_COLLECTION_SCHEMA,
+    QDRANT_GRPC_PORT,
+    QDRANT_HOST,
+    QDRANT_POOL_SIZE,
+    QDRANT_PORT,
+    QDRANT_PREFER_GRPC,
+    QDRANT_RETRIES,
+    QDRANT_RETRY_BACKOFF_MS,
+    QDRANT_TIMEOUT,
 )
 
-__all__ = ["client", "ensure_panai_memory_collection", "get_qdrant_client"]
+try:
+    import grpc
+
+    _RETRYABLE_GRPC_CODES = {
+        grpc.StatusCode.UNAVAILABLE,
+        grpc.StatusCode.DEADLINE_EXCEEDED,
+        grpc.StatusCode.RESOURCE_EXHAUSTED,
+    }
+except ImportError:  # grpcio is only needed with QDRANT_PREFER_GRPC
+    grpc = None
+    _RETRYABLE_GRPC_CODES = set()
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """Connection problems, timeouts, 5xx and 429 are worth retrying; bad requests are not."""
+    if isinstance(exc, (ResponseHandlingException, httpx.TransportError)):
+        return True
+    if isinstance(exc, UnexpectedResponse):
+        return exc.status_code is not None and (exc.status_code >= 500 or exc.status_code == 429)
+    if grpc is not None and isinstance(exc, grpc.RpcError):
+        return exc.code() in _RETRYABLE_GRPC_CODES
+    return False
+
+
+class RetryingQdrantClient:
+    """Wrap a (sync or async) Qdrant client so public calls retry transient errors.
+
+    Attribute access is passed through, so the wrapper can be used anywhere a
+    ``QdrantClient`` or ``AsyncQdrantClient`` is expected. Qdrant writes in
+    this codebase use deterministic IDs, so retrying an upsert is safe.
+    """
+
+    def __init__(self, inner, retries: int = QDRANT_RETRIES, backoff: float = QDRANT_RETRY_BACKOFF_MS / 1000.0):
+        self._inner = inner
+        self._retries = max(0, retries)
+        self._backoff = backoff
+        self.retried = 0
+        self.failed = 0
+
+    def _delay(self, attempt: int) -> float:
+        return self._backoff * (2 ** attempt)
+
+    def _give_up(self, name: str, attempt: int, exc: Exception) -> bool:
+        if attempt >= self._retries or not _is_retryable(exc):
+            self.failed += 1
+            return True
+        self.retried += 1
+        logger.warning(f"[Qdrant] {name} failed ({exc}); retry {attempt + 1}/{self._retries}")
+        return False
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            @functools.wraps(attr)
+            async def call_async(*args, **kwargs):
+                attempt = 0
+                while True:
+                    try:
+                        return await attr(*args, **kwargs)
+                    except Exception as e:
+                        if self._give_up(name, attempt, e):
+                            raise
+                    await asyncio.sleep(self._delay(attempt))
+                    attempt += 1
+            return call_async
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return attr(*args, **kwargs)
+                except Exception as e:
+                    if self._give_up(name, attempt, e):
+                        raise
+                time.sleep(self._delay(attempt))
+                attempt += 1
+        return call
+
+    def stats(self) -> dict:
+        return {"retries": self.retried, "failed_calls": self.failed}
+
+
+def create_qdrant_client(host=None, port=None, *, prefer_grpc=None, timeout=None, asynchronous=False):
+    """Build a new retrying client; most callers want the shared handles instead."""
+    client_cls = AsyncQdrantClient if asynchronous else QdrantClient
+    inner = client_cls(
+        host=host or QDRANT_HOST,
+        port=port or QDRANT_PORT,
+        grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=QDRANT_PREFER_GRPC if prefer_grpc is None else prefer_grpc,
+        api_key=QDRANT_API_KEY,
+        timeout=timeout or QDRANT_TIMEOUT,
+        # qdrant-client turns keep-alive off for localhost by default; pooling
+        # is what saves the per-request connection setup.
+        limits=httpx.Limits(max_connections=QDRANT_POOL_SIZE, max_keepalive_connections=QDRANT_POOL_SIZE),
+        check_compatibility=False,
+    )
+    return RetryingQdrantClient(inner)
+
+
+@functools.lru_cache(maxsize=None)
+def _shared_client(host, port, asynchronous):
+    return create_qdrant_client(host, port, asynchronous=asynchronous)
+
+
+@functools.lru_cache(maxsize=1)
+def _embedded_client():
+    return EmbeddedClient(EMBEDDED_STORE_PATH, index=EMBEDDED_INDEX,
+                          ivf_min_points=EMBEDDED_IVF_MIN_POINTS, ivf_nprobe=EMBEDDED_IVF_NPROBE)
+
+
+def get_qdrant_client(host=None, port=None):
+    """Shared sync client for ``host:port`` (defaults from config), or the embedded store."""
+    if MEMORY_BACKEND == "embedded":
+        return _embedded_client()
+    return _shared_client(host or QDRANT_HOST, port or QDRANT_PORT, False)
+
+
+def get_async_qdrant_client(host=None, port=None):
+    """Shared ``AsyncQdrantClient`` for ``host:port`` (defaults from config), or the embedded store."""
+    if MEMORY_BACKEND == "embedded":
+        return AsyncEmbeddedClient(_embedded_client())
+    return _shared_client(host or QDRANT_HOST, port or QDRANT_PORT, True)
+
 
-def get_qdrant_client(host="qdrant", port=6333):
-    return QdrantClient(host=host, port=port)
+def qdrant_stats() -> dict:
+    if MEMORY_BACKEND == "embedded":
+        return client.stats()
+    return {"sync": client.stats(), "async": async_client.stats(), "grpc": QDRANT_PREFER_GRPC}
 
-def ensure_panai_memory_collection(client=None):
+
+client = get_qdrant_client()
+async_client = get_async_qdrant_client()
+
+__all__ = [
+    "client",
+    "async_client",
+    "create_qdrant_client",
+    "get_qdrant_client",
+    "get_async_qdrant_client",
+    "qdrant_stats",
+    "RetryingQdrantClient",
+    "ensure_panai_memory_collection",
+    "load_collection_schema",
+    "DEFAULT_COLLECTION_SCHEMA",
+]
+
+# Used for any key missing from panai.collection.json (or if the file is absent).
+DEFAULT_COLLECTION_SCHEMA = {
+    "name": "panai_memory",
+    "vectors": {"size": 768, "distance": "Cosine", "on_disk": False},
+    "hnsw": {"m": 16, "ef_construct": 128, "full_scan_threshold": 10000},
+    "quantization": {"enabled": False, "type": "int8", "quantile": 0.99, "always_ram": True},
+    "payload_indexes": {
+        "session_id": "keyword",
+        "tags": "keyword",
+        "timestamp": "datetime",
+        "content_hash": "keyword",
+        "committed_at": "integer",
+    },
+}
+
+
+def load_collection_schema(path=QDRANT_COLLECTION_SCHEMA):
+    """Load the declarative collection schema, filling gaps from the defaults."""
+    schema = copy.deepcopy(DEFAULT_COLLECTION_SCHEMA)
+    try:
+        overrides = load_config(path)
+    except FileNotFoundError:
+        print(f"[PanAI] No collection schema at {path}, using defaults.")
+        return schema
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(schema.get(key), dict) and key != "payload_indexes":
+            schema[key].update(value)
+        else:
+            schema[key] = value
+    return schema
+
+
+def _hnsw_diff(schema):
+    return HnswConfigDiff(**{k: v for k, v in schema["hnsw"].items() if v is not None})
+
+
+def _quantization_config(schema):
+    quant = schema["quantization"]
+    if not quant.get("enabled"):
+        return None
+    if quant.get("type", "int8") != "int8":
+        raise ValueError(f"Unsupported quantization type '{quant['type']}' (only 'int8' scalar quantization)")
+    return ScalarQuantization(
+        scalar=ScalarQuantizationConfig(
+            type=ScalarType.INT8,
+            quantile=quant.get("quantile"),
+            always_ram=quant.get("always_ram"),
+        )
+    )
+
+
+def _create_collection(client, schema):
+    vectors = schema["vectors"]
+    client.create_collection(
+        collection_name=schema["name"],
+        vectors_config=VectorParams(
+            size=vectors["size"],
+            distance=Distance(vectors.get("distance", "Cosine")),
+            on_disk=vectors.get("on_disk"),
+        ),
+        hnsw_config=_hnsw_diff(schema),
+        quantization_config=_quantization_config(schema),
+    )
+
+
+def _collection_diff(info, schema) -> dict:
+    """Return the update_collection kwargs needed to match the schema (empty if in sync)."""
+    changes = {}
+    config = info.config
+
+    current_hnsw = config.hnsw_config
+    wanted_hnsw = {k: v for k, v in schema["hnsw"].items() if v is not None}
+    if any(getattr(current_hnsw, k, None) != v for k, v in wanted_hnsw.items()):
+        changes["hnsw_config"] = HnswConfigDiff(**wanted_hnsw)
+
+    wanted_quant = _quantization_config(schema)
+    current_quant = config.quantization_config
+    if wanted_quant is None:
+        if current_quant is not None:
+            changes["quantization_config"] = Disabled.DISABLED
+    else:
+        current_scalar = getattr(current_quant, "scalar", None)
+        wanted_scalar = wanted_quant.scalar
+        if current_scalar is None or (
+            current_scalar.type != wanted_scalar.type
+            or current_scalar.quantile != wanted_scalar.quantile
+            or bool(current_scalar.always_ram) != bool(wanted_scalar.always_ram)
+        ):
+            changes["quantization_config"] = wanted_quant
+
+    vectors = config.params.vectors
+    wanted_on_disk = schema["vectors"].get("on_disk")
+    if isinstance(vectors, VectorParams):
+        if vectors.size != schema["vectors"]["size"]:
+            # Size and distance cannot be changed in place; the collection has to be rebuilt.
+            print(f"[PanAI] Warning: '{schema['name']}' has vector size {vectors.size}, "
+                  f"schema expects {schema['vectors']['size']}. Recreate the collection to change it.")
+        if wanted_on_disk is not None and bool(vectors.on_disk) != bool(wanted_on_disk):
+            changes["vectors_config"] = {"": VectorParamsDiff(on_disk=wanted_on_disk)}
+    return changes
+
+
+def _ensure_payload_indexes(client, schema, existing: dict) -> list:
+    applied = []
+    for field, field_type in schema["payload_indexes"].items():
+        wanted = PayloadSchemaType(field_type)
+        current = existing.get(field)
+        if current is not None and current.data_type == wanted:
+            continue
+        if current is not None:
+            print(f"[PanAI] Re-indexing '{field}' as {wanted.value} (was {current.data_type.value}).")
+            client.delete_payload_index(collection_name=schema["name"], field_name=field)
+        client.create_payload_index(
+            collection_name=schema["name"],
+            field_name=field,
+            field_schema=wanted,
+        )
+        applied.append(f"index:{field}={wanted.value}")
+    return applied
+
+
+def ensure_panai_memory_collection(client=None, schema=None):
+    """Create or reconcile ``panai_memory`` with the declarative schema.
+
+    A missing collection is created with the configured vector params, HNSW
+    settings and quantization. An existing one is compared with the schema and
+    any HNSW, quantization, on-disk or payload index differences are applied
+    in place. Returns the list of changes made.
+    """
     if client is None:
         client = get_qdrant_client()
+    if schema is None:
+        schema = load_collection_schema()
+    if isinstance(client, EmbeddedClient):
+        return client.ensure_collection(schema)
+    name = schema["name"]
+    changes = []
+
     collections = client.get_collections().collections
-    if not any(col.name == "panai_memory" for col in collections):
-        print("[PanAI] Creating missing 'panai_memory' collection...")
-        client.create_collection(
-            collection_name="panai_memory",
-            vectors_config=VectorParams(size=768, distance=Distance.COSINE)
-        )
+    if not any(col.name == name for col in collections):
+        print(f"[PanAI] Creating missing '{name}' collection...")
+        _create_collection(client, schema)
+        changes.append("created")
     else:
-        print("[PanAI] Collection 'panai_memory' already exists.")
\ No newline at end of file
+        print(f"[PanAI] Collection '{name}' already exists.")
+
+    info = client.get_collection(name)
+    if "created" not in changes:
+        diff = _collection_diff(info, schema)
+        if diff:
+            print(f"[PanAI] Updating '{name}' collection config: {', '.join(diff)}")
+            client.update_collection(collection_name=name, **diff)
+            changes.extend(diff)
+
+    changes.extend(_ensure_payload_indexes(client, schema, info.payload_schema or {}))
+    if changes:
+        print(f"[PanAI] Collection '{name}' schema applied: {changes}")
+    return changes
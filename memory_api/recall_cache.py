@@ -0,0 +1,118 @@
+"""Query-result cache for recall and tag search.
+
+Agents repeat the same recall and tag queries many times within a session.
+Results are cached per (kind, normalized query, filter, limit) with a TTL and
+LRU eviction. Write counters guard freshness: every write path bumps the
+counter of the sessions it wrote to, and an entry is served only while the
+counter for its scope is unchanged. A query filtered to one session is
+scoped to that session, so writes to other sessions leave it cached; an
+unscoped query is invalidated by any write. The counter is read *before*
+the query runs, so a write that lands while a search is in flight also makes
+that search's result unservable. Invalidated entries are not swept; they age
+out of the LRU.
+
+The counter is per process. With several uvicorn workers, a write made by
+another worker is only noticed once the TTL expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+from memory_api.embedding_cache import normalize_text
+
+
+def normalize_query(text: str) -> str:
+    return normalize_text(text)
+
+
+class RecallCache:
+    """TTL + LRU result cache invalidated by per-session write counters."""
+
+    def __init__(self, max_items: int = 1024, ttl: float = 60.0, enabled: bool = True):
+        self.max_items = max(0, max_items)
+        self.ttl = ttl
+        self.enabled = enabled and self.max_items > 0
+        self._entries: "OrderedDict[Hashable, Tuple[tuple, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0  # bumped by writes of unknown scope; invalidates everything
+        self.writes = 0  # scoped writes so far; unscoped entries check this
+        self._sessions: "OrderedDict[str, int]" = OrderedDict()  # session_id -> ``writes`` at its last write
+        self._session_capacity = max(1024, self.max_items)
+        self._forgotten = 0  # highest counter dropped from ``_sessions``; stands in for unknown sessions
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+
+    def bump(self, session_ids: Optional[Iterable[str]] = None):
+        """Record a write to ``session_ids``; without them, everything cached becomes unservable."""
+        with self._lock:
+            self.invalidations += 1
+            if session_ids is None:
+                self.generation += 1
+                self._entries.clear()
+                return
+            self.writes += 1
+            for session_id in set(session_ids):
+                self._sessions[session_id] = self.writes
+                self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self._session_capacity:
+                _, last_write = self._sessions.popitem(last=False)
+                self._forgotten = max(self._forgotten, last_write)
+
+    def _version(self, session_id: Optional[str]) -> tuple:
+        if session_id is None:
+            return self.generation, self.writes
+        return self.generation, self._sessions.get(session_id, self._forgotten)
+
+    def get(self, key: Hashable, session_id: Optional[str] = None) -> Tuple[tuple, Optional[Any]]:
+        """Return ``(version, value)`` for a query scoped to ``session_id``; ``value`` is None on a miss.
+
+        Pass the returned version to ``put`` so a result computed across a
+        concurrent write is not cached as fresh.
+        """
+        with self._lock:
+            version = self._version(session_id)
+            if not self.enabled:
+                return version, None
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, stored_at, value = entry
+                if entry_version == version and time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return version, value
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+            return version, None
+
+    def put(self, key: Hashable, value: Any, version: tuple, session_id: Optional[str] = None):
+        with self._lock:
+            if not self.enabled or version != self._version(session_id):
+                return
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "capacity": self.max_items,
+            "ttl_seconds": self.ttl,
+            "generation": self.generation,
+            "writes": self.writes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired_or_stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+__all__ = ["RecallCache", "normalize_query"]
@@ -0,0 +1,117 @@
+"""Rolling per-session summaries, folded forward as memories arrive.
+
+Each session has one summary point (stable ID, ``session_summary`` tag) that
+records how far it has read in ``summarized_through``, a commit stamp (see
+``memory_api/commit_clock.py``). An update folds only memories committed
+after it, one token-bounded batch at a time. ``SummaryTracker``
+marks a session due after ``every`` new memories, or after ``quiet_seconds``
+of quiet with memories pending.
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from memory_api.dedup import content_hash, point_id_for_hash
+
+SUMMARY_TAG = "session_summary"
+
+INITIAL_TEMPLATE = (
+    "Summarize the following memories from session '{session_id}'. "
+    "Keep names, decisions and open questions:\n{combined_text}\n\nSummary:"
+)
+FOLD_TEMPLATE = (
+    "Here is the running summary of session '{session_id}':\n{summary}\n\n"
+    "New memories since then:\n{combined_text}\n\n"
+    "Rewrite the summary so it also covers the new memories. "
+    "Keep names, decisions and open questions.\n\nSummary:"
+)
+
+
+def summary_digest(session_id: str) -> str:
+    return content_hash(session_id, f"\x00{SUMMARY_TAG}")
+
+
+def summary_point_id(session_id: str) -> str:
+    return point_id_for_hash(summary_digest(session_id))
+
+
+def fold_prompt(session_id: str, summary: str, texts: List[str]) -> str:
+    combined_text = "\n".join(texts)
+    if not summary:
+        return INITIAL_TEMPLATE.format(session_id=session_id, combined_text=combined_text)
+    return FOLD_TEMPLATE.format(session_id=session_id, summary=summary, combined_text=combined_text)
+
+
+class SummaryTracker:
+    """Thread-safe count of memories not yet folded into each session's summary."""
+
+    def __init__(self, every: int = 20, quiet_seconds: float = 120.0):
+        self.every = max(1, every)
+        self.quiet_seconds = quiet_seconds
+        self._pending: Dict[str, int] = {}
+        self._last_write: Dict[str, float] = {}
+        self._retry_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.folded = 0
+        self.failures = 0
+
+    def note(self, payloads: Iterable[dict]):
+        """Record committed memories (summary points themselves are ignored)."""
+        now = time.monotonic()
+        with self._lock:
+            for payload in payloads:
+                if SUMMARY_TAG in (payload.get("tags") or []):
+                    continue
+                session_id = payload.get("session_id", "default")
+                self._pending[session_id] = self._pending.get(session_id, 0) + 1
+                self._last_write[session_id] = now
+
+    def due(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                session_id for session_id, count in self._pending.items()
+                if self._retry_at.get(session_id, 0.0) <= now
+                and (count >= self.every or now - self._last_write[session_id] >= self.quiet_seconds)
+            ]
+
+    def pending(self, session_id: str) -> int:
+        with self._lock:
+            return self._pending.get(session_id, 0)
+
+    def clear(self, session_id: str, seen: int, folded: int):
+        """Record an update that covered the ``seen`` memories pending when it started."""
+        with self._lock:
+            remaining = self._pending.get(session_id, 0) - seen
+            if remaining > 0:
+                self._pending[session_id] = remaining  # arrived while the update ran
+            else:
+                self._pending.pop(session_id, None)
+                self._last_write.pop(session_id, None)
+            self._retry_at.pop(session_id, None)
+        self.updates += 1
+        self.folded += folded
+
+    def failed(self, session_id: str):
+        """Back off a session whose update failed for one quiet period."""
+        with self._lock:
+            self._retry_at[session_id] = time.monotonic() + self.quiet_seconds
+        self.failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = dict(self._pending)
+        return {
+            "every": self.every,
+            "quiet_seconds": self.quiet_seconds,
+            "sessions_pending": len(pending),
+            "memories_pending": sum(pending.values()),
+            "updates": self.updates,
+            "memories_folded": self.folded,
+            "failures": self.failures,
+        }
+
+
+__all__ = ["SummaryTracker", "SUMMARY_TAG", "fold_prompt", "summary_digest", "summary_point_id"]
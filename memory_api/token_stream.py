@@ -0,0 +1,70 @@
+"""Pass Ollama's token stream through to HTTP clients.
+
+A reflection or chat answer takes tens of seconds to generate on CPU. Without
+streaming, the caller sees nothing until the whole answer exists.
+``llm_client.stream`` yields Ollama's tokens as they are generated, and
+``token_stream_response`` forwards each one to the client as soon as it
+arrives, as either chunked NDJSON or Server-Sent Events (chosen by the
+request's ``Accept`` header). The full text is collected along the way.
+Once the model has finished, a ``finish`` callback gets that text (to embed
+and store it, log it, cache it), and whatever it returns is sent as the
+final ``{"done": true, ...}`` frame.
+
+Frames are ``{"token": "..."}`` per token, then one ``{"done": true, ...}``.
+If the model fails mid-stream, or its queue refuses the call once the
+response has started (``SchedulerBusy``), a final ``{"error": "..."}`` frame
+is sent instead and ``finish`` is not called.
+"""
+
+import json
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from memory_api.memory_logger import logger
+
+
+async def single_token(text: str) -> AsyncIterator[str]:
+    """A one-chunk stream, for answers that are already known (cache hits)."""
+    yield text
+
+
+def wants_event_stream(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "")
+
+
+def token_stream_response(request: Request, tokens: AsyncIterator[str],
+                          finish: Callable[[str], Awaitable[dict]]) -> StreamingResponse:
+    """Stream ``tokens`` to the client, then send ``await finish(full_text)`` as the last frame."""
+    event_stream = wants_event_stream(request)
+
+    def frame(data: dict) -> str:
+        encoded = json.dumps(data)
+        return f"data: {encoded}\n\n" if event_stream else encoded + "\n"
+
+    async def frames():
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield frame({"token": token})
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"[TokenStream] LLM stream failed after {len(parts)} tokens: {e}")
+            yield frame({"error": f"❌ Error from language model: {e}"})
+            return
+        except HTTPException as e:
+            logger.warning(f"[TokenStream] LLM stream refused after {len(parts)} tokens: {e.detail}")
+            yield frame({"error": f"❌ Error from language model: {e.detail}", "status": e.status_code})
+            return
+        yield frame({"done": True, **(await finish("".join(parts)))})
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream" if event_stream else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+__all__ = ["single_token", "token_stream_response", "wants_event_stream"]
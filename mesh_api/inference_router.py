@@ -0,0 +1,364 @@
+"""Send each generation to the mesh node that will finish it soonest.
+
+``main.py`` installs ``inference_router`` as ``llm_client.router``, so every
+async ``llm_client`` call is routed here. ``/health`` carries a ``load``
+section (see ``InferenceRouter.local_load``): queue depth per model, Ollama's
+measured tokens/sec, and resident and installed models. ``InferenceRouter``
+polls it from every peer in ``nodes.json`` every ``MESH_ROUTING_POLL_SECONDS``.
+
+For each call, every node that has the model installed (and answered its last
+poll) gets an estimated completion time:
+
+    (rounds of queue ahead + 1) * tokens_per_request / tokens_per_second
+    + MESH_ROUTING_LOAD_PENALTY_SECONDS if the model is not resident
+    + MESH_ROUTING_REMOTE_PENALTY_SECONDS for a peer
+
+The call goes to the cheapest node. A peer gets its request through
+``POST /mesh/generate``, which always generates locally, so a request is
+forwarded at most once, and only with this node's ``FEDERATION_SECRET`` in
+the ``X-Federation-Secret`` header. Peers always stream their answer. If a peer fails,
+refuses (429), or sends no token for ``MESH_ROUTING_DEADLINE_SECONDS``, the
+call falls back to the local model (a stream only before its first token).
+Calls sent to a peer count towards its queue until they return, so a burst
+spreads across nodes before the next poll.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+
+from memory_api.llm_client import llm_client, llm_scheduler, model_residency
+from memory_api.llm_scheduler import PRIORITY_BACKGROUND, PRIORITY_WARMUP
+from memory_api.memory_logger import logger
+from memory_api.token_stream import token_stream_response
+from services.config import (
+    FEDERATION_SECRET,
+    MESH_ROUTING_DEADLINE_SECONDS,
+    MESH_ROUTING_ENABLED,
+    MESH_ROUTING_LOAD_PENALTY_SECONDS,
+    MESH_ROUTING_POLL_SECONDS,
+    MESH_ROUTING_REMOTE_PENALTY_SECONDS,
+)
+
+NODES_FILE = Path("nodes.json")
+LOCAL = "local"
+FORWARDED_HEADER = "X-Mesh-Forwarded"
+SECRET_HEADER = "X-Federation-Secret"
+DEFAULT_TOKENS_PER_SECOND = 5.0
+DEFAULT_TOKENS_PER_REQUEST = 200.0
+# Ollama sampling options a peer may set; resource options (num_gpu, num_thread, ...) stay local.
+SAMPLING_OPTIONS = frozenset({
+    "num_ctx", "num_predict", "temperature", "top_k", "top_p", "min_p", "typical_p", "repeat_last_n",
+    "repeat_penalty", "presence_penalty", "frequency_penalty", "mirostat", "mirostat_tau", "mirostat_eta",
+    "seed", "stop",
+})
+
+
+def model_key(model: str) -> str:
+    return model if ":" in model else f"{model}:latest"
+
+
+def peer_url(peer: dict) -> str:
+    return (peer.get("url") or f"http://{peer.get('hostname') or peer.get('ip')}:8000").rstrip("/")
+
+
+def load_peers() -> List[dict]:
+    try:
+        with open(NODES_FILE, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    nodes = data.get("nodes", []) if isinstance(data, dict) else data
+    return [n for n in nodes if isinstance(n, dict) and (n.get("url") or n.get("hostname") or n.get("ip"))]
+
+
+class InferenceRouter:
+    """Picks the least-loaded node per model and forwards generations to peers."""
+
+    def __init__(self, client, scheduler, residency, enabled: bool = True, poll_seconds: float = 15.0,
+                 deadline: float = 60.0, remote_penalty: float = 1.0, load_penalty: float = 20.0,
+                 secret: str = ""):
+        self.client = client
+        self.scheduler = scheduler
+        self.residency = residency
+        self.enabled = enabled
+        self.poll_seconds = poll_seconds
+        self.deadline = deadline
+        self.remote_penalty = remote_penalty
+        self.load_penalty = load_penalty
+        self.secret = secret  # sent to peers, and required from them on /mesh/generate
+        self.node_name: Optional[str] = None
+        self._peers: Dict[str, dict] = {}  # url -> last load report
+        self._sent: Dict[str, Dict[str, int]] = {}  # url -> model -> calls in flight
+        self._http: Optional[httpx.AsyncClient] = None
+        self._http_loop = None
+        self.routed = {LOCAL: 0}
+        self.fallbacks = 0
+        self.polls = 0
+
+    def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http_loop is not loop:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(self.deadline, connect=2.0))
+            self._http_loop = loop
+        return self._http
+
+    def local_load(self) -> dict:
+        """This node's load, as published in ``/health``."""
+        scheduler = self.scheduler.stats()
+        models = {
+            model_key(model): {"active": q["active"], "queued": q["queued"], "limit": q["limit"]}
+            for model, q in scheduler["models"].items()
+        }
+        return {
+            "queue_depth": sum(m["active"] + m["queued"] for m in models.values()),
+            "default_concurrency": scheduler["default_concurrency"],
+            "models": models,
+            "tokens_per_second": round(self.client.tokens_per_second, 2),
+            "tokens_per_request": round(self.client.tokens_per_request, 1),
+            "resident_models": self.residency.resident_models(),
+            "installed_models": self.residency.installed_models(),
+            "cpu_count": os.cpu_count(),
+        }
+
+    async def _poll_peer(self, url: str):
+        try:
+            response = await self._client().get(f"{url}/health", timeout=5.0)
+            response.raise_for_status()
+            health = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self._peers.pop(url, None)
+            logger.debug(f"[Router] No load report from {url}: {e}")
+            return
+        if health.get("node") == self.node_name or "load" not in health:
+            self._peers.pop(url, None)  # ourselves, or a node that predates load reports
+            return
+        self._peers[url] = {**health["load"], "node": health.get("node"), "fetched_at": time.monotonic()}
+
+    async def poll(self):
+        urls = {peer_url(peer) for peer in await asyncio.to_thread(load_peers)}
+        for url in set(self._peers) - urls:
+            self._peers.pop(url, None)
+        await asyncio.gather(*[self._poll_peer(url) for url in urls])
+        self.polls += 1
+
+    async def run(self):
+        if self.enabled and self.secret == "change-me":
+            logger.warning("[Router] FEDERATION_SECRET is the default; set one shared secret on every mesh node")
+        while True:
+            await self.poll()
+            await asyncio.sleep(self.poll_seconds)
+
+    def _cost(self, load: dict, model: str, sent: int = 0, resident_known: bool = True) -> float:
+        queue = load.get("models", {}).get(model, {})
+        limit = max(1, queue.get("limit") or load.get("default_concurrency") or 1)
+        ahead = max(0, queue.get("active", 0) + queue.get("queued", 0) + sent - limit + 1)
+        tokens = self.client.tokens_per_request or DEFAULT_TOKENS_PER_REQUEST
+        rate = load.get("tokens_per_second") or DEFAULT_TOKENS_PER_SECOND
+        cost = (ahead / limit + 1) * tokens / rate
+        if resident_known and model not in load.get("resident_models", []):
+            cost += self.load_penalty
+        return cost
+
+    def ranked(self, model: str) -> List[tuple]:
+        """``(estimated_seconds, node)`` for every node that can serve ``model``, best first."""
+        model = model_key(model)
+        # Without residency polling the local resident list is unknown, not empty.
+        costs = [(self._cost(self.local_load(), model, resident_known=self.residency.last_poll is not None), LOCAL)]
+        if self.enabled:
+            stale = time.monotonic() - 3 * self.poll_seconds
+            for url, load in list(self._peers.items()):
+                if load["fetched_at"] < stale or model not in load.get("installed_models", []):
+                    continue
+                sent = self._sent.get(url, {}).get(model, 0)
+                costs.append((self._cost(load, model, sent) + self.remote_penalty, url))
+        return sorted(costs, key=lambda c: c[0])
+
+    def _choose(self, model: str) -> str:
+        return self.ranked(model)[0][1]
+
+    def _track(self, url: str, model: str, delta: int):
+        per_model = self._sent.setdefault(url, {})
+        per_model[model_key(model)] = max(0, per_model.get(model_key(model), 0) + delta)
+
+    def _failed(self, url: str, model: str, exc: Exception):
+        self._peers.pop(url, None)  # skip it until it answers a poll again
+        self.fallbacks += 1
+        logger.warning(f"[Router] Peer {url} failed for {model} ({exc!r}); generating locally")
+
+    def _route(self, model: str, options: dict) -> str:
+        # Only Ollama's sampling ``options`` travel to a peer; calls with other fields stay local.
+        return self._choose(model) if set(options) <= {"options"} else LOCAL
+
+    @staticmethod
+    def _request(model: str, prompt: str, priority: int, stream: bool, options: dict) -> dict:
+        return {"model": model, "prompt": prompt, "priority": priority, "stream": stream,
+                "options": options.get("options") or {}}
+
+    def admit(self, model: str, priority: int = PRIORITY_BACKGROUND) -> str:
+        """Choose the node for a streamed call; pass it to ``stream``.
+
+        Raises ``SchedulerBusy`` when the local node is chosen and its queue is full.
+        """
+        node = self._choose(model)
+        if node == LOCAL:
+            self.client.admit_local(model, priority)
+        return node
+
+    async def _remote_tokens(self, url: str, model: str, prompt: str, priority: int, options: dict) -> AsyncIterator[str]:
+        """Tokens streamed from a peer's ``/mesh/generate``.
+
+        ``deadline`` is the read timeout: it bounds the wait for the first
+        token and for each later one, never the whole answer.
+        """
+        self._track(url, model, 1)
+        try:
+            async with self._client().stream(
+                "POST", f"{url}/mesh/generate", json=self._request(model, prompt, priority, True, options),
+                headers={FORWARDED_HEADER: self.node_name or "peer", SECRET_HEADER: self.secret},
+            ) as response:
+                response.raise_for_status()
+                done = False
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    frame = json.loads(line)
+                    if frame.get("error"):
+                        raise httpx.HTTPError(frame["error"])
+                    if frame.get("token"):
+                        yield frame["token"]
+                    done = done or bool(frame.get("done"))
+                if not done:
+                    raise httpx.HTTPError("peer stream ended before it was done")
+            self.routed[url] = self.routed.get(url, 0) + 1
+        finally:
+            self._track(url, model, -1)
+
+    async def generate(self, model: str, prompt: str, priority: int = PRIORITY_BACKGROUND, **options) -> str:
+        """``llm_client.generate`` on the best node, falling back to the local model.
+
+        Peers always stream, so a long answer is not cut off by the deadline.
+        """
+        url = self._route(model, options)
+        if url != LOCAL:
+            try:
+                return "".join([token async for token in self._remote_tokens(url, model, prompt, priority, options)])
+            except (httpx.HTTPError, ValueError) as e:
+                self._failed(url, model, e)
+        self.routed[LOCAL] += 1
+        return await self.client.generate_local(model, prompt, priority, **options)
+
+    async def stream(self, model: str, prompt: str, priority: int = PRIORITY_BACKGROUND, node: Optional[str] = None,
+                     **options) -> AsyncIterator[str]:
+        """``llm_client.stream`` on ``node`` (from ``admit``) or the best node.
+
+        Falls back locally if the peer fails before its first token.
+        """
+        url = node or self._route(model, options)
+        if url != LOCAL:
+            yielded = False
+            try:
+                async for token in self._remote_tokens(url, model, prompt, priority, options):
+                    yielded = True
+                    yield token
+                return
+            except (httpx.HTTPError, ValueError) as e:
+                if yielded:
+                    raise
+                self._failed(url, model, e)
+        self.routed[LOCAL] += 1
+        async for token in self.client.stream_local(model, prompt, priority, **options):
+            yield token
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "deadline_seconds": self.deadline,
+            "peers": {
+                url: {
+                    "node": load.get("node"),
+                    "age_seconds": round(now - load["fetched_at"], 1),
+                    "queue_depth": load.get("queue_depth"),
+                    "tokens_per_second": load.get("tokens_per_second"),
+                    "resident_models": load.get("resident_models", []),
+                    "in_flight": dict(self._sent.get(url, {})),
+                }
+                for url, load in self._peers.items()
+            },
+            "routed": dict(self.routed),
+            "fallbacks": self.fallbacks,
+            "polls": self.polls,
+        }
+
+
+inference_router = InferenceRouter(
+    llm_client,
+    llm_scheduler,
+    model_residency,
+    enabled=MESH_ROUTING_ENABLED,
+    poll_seconds=MESH_ROUTING_POLL_SECONDS,
+    deadline=MESH_ROUTING_DEADLINE_SECONDS,
+    remote_penalty=MESH_ROUTING_REMOTE_PENALTY_SECONDS,
+    load_penalty=MESH_ROUTING_LOAD_PENALTY_SECONDS,
+    secret=FEDERATION_SECRET,
+)
+
+router = APIRouter()
+
+
+class ForwardedGeneration(BaseModel):
+    model: str
+    prompt: str
+    priority: int = PRIORITY_BACKGROUND
+    stream: bool = False
+    options: dict = {}  # Ollama sampling options, limited to SAMPLING_OPTIONS
+
+
+def require_federation_secret(request: Request):
+    """Reject callers that do not present this node's ``FEDERATION_SECRET``."""
+    presented = request.headers.get(SECRET_HEADER, "")
+    if not inference_router.secret or not hmac.compare_digest(presented.encode(), inference_router.secret.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid federation secret")
+
+
+@router.post("/generate", operation_id="mesh_generate", dependencies=[Depends(require_federation_secret)])
+async def mesh_generate(req: ForwardedGeneration, request: Request):
+    """Generate on this node's Ollama for a peer's inference router (never forwarded again).
+
+    Streams the same NDJSON frames as ``/chat`` when ``stream`` is set. A
+    forwarded call never outranks this node's own interactive calls.
+    """
+    unknown = set(req.options) - SAMPLING_OPTIONS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported options: {', '.join(sorted(unknown))}")
+    priority = min(max(req.priority, PRIORITY_BACKGROUND), PRIORITY_WARMUP)
+    options = {"options": req.options} if req.options else {}
+    if req.stream:
+        async def finish(text: str) -> dict:
+            return {"node": inference_router.node_name}
+
+        llm_client.admit_local(req.model, priority)
+        tokens = llm_client.stream_local(req.model, req.prompt, priority, **options)
+        return token_stream_response(request, tokens, finish)
+    try:
+        text = await llm_client.generate_local(req.model, req.prompt, priority, **options)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Error from language model: {e}")
+    return {"response": text, "node": inference_router.node_name}
+
+
+__all__ = ["InferenceRouter", "inference_router", "load_peers", "router"]
@@ -5,6 +5,8 @@ import json
 import os
 from datetime import datetime, timedelta
 
+from services.config import OLLAMA_BASE_URL
+
 # Load NODE_NAME from config.json
 CONFIG_JSON_PATH = os.path.join(os.path.dirname(__file__), "..", "config.json")
 
@@ -21,7 +23,7 @@ except Exception as e:
     NODE_NAME = "unknown-node"
 
 # Constants
-OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_HOST = OLLAMA_BASE_URL
 MODELS_JSON_PATH = os.path.join(os.path.dirname(__file__), "..", "models.json")
 
 # Cache variables
@@ -54,6 +56,25 @@ def load_models_from_json():
         log(f"[ModelManager] Error loading models.json: {e}", level="WARNING")
         return []
 
+def save_models_json(models):
+    try:
+        with open(MODELS_JSON_PATH, "w") as f:
+            json.dump({
+                "node_name": NODE_NAME,
+                "models": models
+            }, f, indent=2)
+        log("[ModelManager] models.json updated successfully.", level="INFO")
+    except Exception as e:
+        log(f"[ModelManager] Warning: Failed to update models.json: {e}", level="WARNING")
+
+def set_available_models(models):
+    """Record a model list fetched elsewhere (the residency manager polls /api/tags)."""
+    global models_available, last_refresh
+    if models != models_available:
+        save_models_json(models)
+    models_available = list(models)
+    last_refresh = datetime.now()
+
 def get_available_models(force_refresh=False):
     global models_available, last_refresh
 
@@ -64,15 +85,7 @@ def get_available_models(force_refresh=False):
         models = load_models_from_ollama()
         if models:
             models_available = models
-            try:
-                with open(MODELS_JSON_PATH, "w") as f:
-                    json.dump({
-                        "node_name": NODE_NAME,
-                        "models": models_available
-                    }, f, indent=2)
-                log("[ModelManager] models.json updated successfully.", level="INFO")
-            except Exception as e:
-                log(f"[ModelManager] Warning: Failed to update models.json: {e}", level="WARNING")
+            save_models_json(models_available)
         else:
             models_available = load_models_from_json()
 
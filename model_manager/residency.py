@@ -0,0 +1,289 @@
+"""Which Ollama models stay loaded, for how long, and which get evicted.
+
+``ModelResidency`` polls ``/api/ps`` and ``/api/tags`` and sees every
+generation ``llm_client`` starts. It sets ``keep_alive`` to three times a
+model's mean request gap (clamped to ``MODEL_KEEP_ALIVE_MIN``..``MAX``),
+pre-warms models with recent traffic, and evicts least recently used idle
+models before a load would exceed ``MODEL_RAM_LIMIT_MB``.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from memory_api.llm_scheduler import PRIORITY_WARMUP
+from memory_api.memory_logger import logger
+from model_manager.model_manager import set_available_models
+
+KEEP_ALIVE_FACTOR = 3.0
+TAGS_REFRESH_SECONDS = 600.0
+
+
+def physical_ram_bytes() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def _model_name(name: str) -> str:
+    return name if ":" in name else f"{name}:latest"
+
+
+class _Traffic:
+    def __init__(self, window: int = 32):
+        self.arrivals = deque(maxlen=window)
+        self.last_used = 0.0
+        self.in_flight = 0
+
+
+class ModelResidency:
+    """Tracks resident Ollama models and decides keep-alive, pre-warm and eviction."""
+
+    def __init__(self, client, ram_limit_bytes: int = 0, keep_alive_min: float = 120.0,
+                 keep_alive_max: float = 3600.0, window_seconds: float = 3600.0, prewarm_min_requests: int = 3,
+                 poll_seconds: float = 30.0):
+        self.client = client
+        self.ram_limit = ram_limit_bytes or int(physical_ram_bytes() * 0.8)
+        self.keep_alive_min = keep_alive_min
+        self.keep_alive_max = max(keep_alive_min, keep_alive_max)
+        self.window_seconds = window_seconds
+        self.prewarm_min_requests = max(1, prewarm_min_requests)
+        self.poll_seconds = poll_seconds
+        self._traffic: Dict[str, _Traffic] = {}
+        self._resident: Dict[str, dict] = {}
+        self._sizes: Dict[str, int] = {}
+        self._installed: List[str] = []
+        self._tags_at = 0.0
+        self._lock = threading.Lock()
+        self._evict_lock: Optional[asyncio.Lock] = None
+        self._evict_loop = None
+        self.polls = 0
+        self.poll_errors = 0
+        self.last_poll: Optional[float] = None
+        self.prewarms = 0
+        self.evictions = 0
+
+    def _entry(self, model: str) -> _Traffic:
+        traffic = self._traffic.get(model)
+        if traffic is None:
+            traffic = self._traffic[model] = _Traffic()
+        return traffic
+
+    def _recent(self, traffic: _Traffic, now: float) -> List[float]:
+        return [t for t in traffic.arrivals if now - t <= self.window_seconds]
+
+    def keep_alive(self, model: str) -> int:
+        """Seconds Ollama should keep ``model`` loaded after its current request."""
+        now = time.monotonic()
+        with self._lock:
+            traffic = self._traffic.get(_model_name(model))
+            recent = self._recent(traffic, now) if traffic else []
+        if len(recent) < 2:
+            return int(self.keep_alive_min)
+        mean_gap = (recent[-1] - recent[0]) / (len(recent) - 1)
+        return int(min(self.keep_alive_max, max(self.keep_alive_min, KEEP_ALIVE_FACTOR * mean_gap)))
+
+    def note_request(self, model: str, priority: Optional[int] = None) -> int:
+        """Count a request for ``model`` (warm-ups are not traffic) and return its keep-alive."""
+        if priority != PRIORITY_WARMUP:
+            now = time.monotonic()
+            with self._lock:
+                traffic = self._entry(_model_name(model))
+                traffic.arrivals.append(now)
+                traffic.last_used = now
+        return self.keep_alive(model)
+
+    async def acquire(self, model: str, priority: Optional[int] = None) -> int:
+        """Called by ``llm_client`` before each generation; makes room for ``model`` if needed."""
+        keep_alive = self.note_request(model, priority)
+        name = _model_name(model)
+        with self._lock:
+            self._entry(name).in_flight += 1
+        try:
+            await self.make_room(name)
+        except Exception:
+            self.release(model, priority)
+            raise
+        return keep_alive
+
+    def release(self, model: str, priority: Optional[int] = None):
+        with self._lock:
+            traffic = self._entry(_model_name(model))
+            traffic.in_flight = max(0, traffic.in_flight - 1)
+            if priority != PRIORITY_WARMUP:
+                traffic.last_used = max(traffic.last_used, time.monotonic())
+
+    def _eviction_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._evict_lock is None or self._evict_loop is not loop:
+            self._evict_lock = asyncio.Lock()
+            self._evict_loop = loop
+        return self._evict_lock
+
+    def _projected_size(self, model: str) -> int:
+        return self._sizes.get(model, 0)
+
+    def _score(self, model: str, now: float) -> int:
+        traffic = self._traffic.get(model)
+        return len(self._recent(traffic, now)) if traffic else 0
+
+    async def make_room(self, model: str, below_score: Optional[int] = None) -> bool:
+        """Evict LRU idle models until ``model`` fits under the RAM limit.
+
+        With ``below_score`` only models with fewer recent requests may go.
+        Returns False if ``model`` still does not fit.
+        """
+        if not self.ram_limit:
+            return True
+        async with self._eviction_lock():
+            while True:
+                now = time.monotonic()
+                with self._lock:
+                    if model in self._resident:
+                        return True
+                    used = sum(info["size"] for info in self._resident.values())
+                    needed = self._projected_size(model)
+                    if used + needed <= self.ram_limit:
+                        self._resident[model] = {"size": needed, "size_vram": 0, "expires_at": None}
+                        return True
+                    idle = [
+                        name for name in self._resident
+                        if self._entry(name).in_flight == 0
+                        and (below_score is None or self._score(name, now) < below_score)
+                    ]
+                    if not idle:
+                        return False
+                    victim = min(idle, key=lambda name: self._entry(name).last_used)
+                try:
+                    await self.client.unload(victim)
+                except httpx.HTTPError as e:
+                    logger.warning(f"[Residency] Failed to evict {victim}: {e}")
+                    return False
+                with self._lock:
+                    self._resident.pop(victim, None)
+                self.evictions += 1
+                logger.info(f"[Residency] Evicted {victim} to make room for {model} "
+                            f"({(used + needed) / 2**20:.0f} MB projected, limit {self.ram_limit / 2**20:.0f} MB)")
+
+    async def refresh(self):
+        """Re-read resident models from ``/api/ps`` (and installed models from ``/api/tags`` now and then)."""
+        try:
+            if time.monotonic() - self._tags_at >= TAGS_REFRESH_SECONDS:
+                tags = (await self.client.get_json("/api/tags")).get("models", [])
+                with self._lock:
+                    for tag in tags:
+                        self._sizes.setdefault(tag["model"], int(tag.get("size") or 0))
+                    self._installed = [tag["model"] for tag in tags]
+                    self._tags_at = time.monotonic()
+                await asyncio.to_thread(set_available_models, self._installed)
+            running = (await self.client.get_json("/api/ps")).get("models", [])
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            self.poll_errors += 1
+            logger.warning(f"[Residency] Could not read model residency from Ollama: {e}")
+            return
+        with self._lock:
+            self._resident = {
+                m["model"]: {
+                    "size": int(m.get("size") or 0),
+                    "size_vram": int(m.get("size_vram") or 0),
+                    "expires_at": m.get("expires_at"),
+                }
+                for m in running
+            }
+            for name, info in self._resident.items():
+                if info["size"]:
+                    self._sizes[name] = info["size"]  # loaded size beats file size
+        self.polls += 1
+        self.last_poll = time.time()
+
+    def predicted(self) -> List[str]:
+        """Models with enough recent traffic to be worth keeping loaded, busiest first."""
+        now = time.monotonic()
+        with self._lock:
+            scores = {name: self._score(name, now) for name in self._traffic}
+        return [name for name, score in sorted(scores.items(), key=lambda kv: -kv[1])
+                if score >= self.prewarm_min_requests]
+
+    async def prewarm(self, extra: Iterable[str] = ()):
+        """Load predicted (and ``extra``) models that Ollama has unloaded, if they fit."""
+        now = time.monotonic()
+        candidates = list(dict.fromkeys([_model_name(m) for m in extra] + self.predicted()))
+        for name in candidates:
+            with self._lock:
+                if name in self._resident or (self._installed and name not in self._installed):
+                    continue
+                score = self._score(name, now)
+            if not await self.make_room(name, below_score=max(score, 1)):
+                continue
+            try:
+                # An empty prompt only loads the model; the keep-alive comes from llm_client.
+                await self.client.generate_local(name, "", PRIORITY_WARMUP)
+                self.prewarms += 1
+                logger.info(f"[Residency] Pre-warmed {name}")
+            except Exception as e:
+                with self._lock:
+                    self._resident.pop(name, None)
+                logger.warning(f"[Residency] Pre-warm of {name} failed: {e}")
+
+    async def run(self, warmup_models: Iterable[str] = ()):
+        """Poll Ollama and pre-warm forever; ``warmup_models`` are loaded on the first round."""
+        extra = list(warmup_models)
+        while True:
+            await self.refresh()
+            if self.last_poll is not None:
+                await self.prewarm(extra)
+                extra = []
+            await asyncio.sleep(self.poll_seconds)
+
+    def resident_models(self) -> List[str]:
+        with self._lock:
+            return list(self._resident)
+
+    def installed_models(self) -> List[str]:
+        with self._lock:
+            return list(self._installed)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            resident = {
+                name: {
+                    "size_mb": round(info["size"] / 2**20, 1),
+                    "vram_mb": round(info["size_vram"] / 2**20, 1),
+                    "expires_at": info["expires_at"],
+                }
+                for name, info in self._resident.items()
+            }
+            traffic = {
+                name: {
+                    "recent_requests": self._score(name, now),
+                    "in_flight": t.in_flight,
+                    "idle_seconds": round(now - t.last_used, 1) if t.last_used else None,
+                }
+                for name, t in self._traffic.items()
+            }
+            installed = list(self._installed)
+        for name, info in traffic.items():
+            info["keep_alive_seconds"] = self.keep_alive(name)
+        return {
+            "ram_limit_mb": round(self.ram_limit / 2**20, 1),
+            "resident_mb": round(sum(m["size_mb"] for m in resident.values()), 1),
+            "resident": resident,
+            "traffic": traffic,
+            "predicted": self.predicted(),
+            "installed": installed,
+            "polls": self.polls,
+            "poll_errors": self.poll_errors,
+            "last_poll": self.last_poll,
+            "prewarms": self.prewarms,
+            "evictions": self.evictions,
+        }
+
+
+__all__ = ["ModelResidency", "physical_ram_bytes"]
@@ -4,11 +4,74 @@ import os
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "panai_memory")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", 6334))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY") or None
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", 10))  # seconds per request
+QDRANT_RETRIES = int(os.getenv("QDRANT_RETRIES", 3))  # retries for transient errors
+QDRANT_RETRY_BACKOFF_MS = float(os.getenv("QDRANT_RETRY_BACKOFF_MS", 200))  # doubled per attempt
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", 16))  # pooled keep-alive connections per client
+QDRANT_COLLECTION_SCHEMA = os.getenv("QDRANT_COLLECTION_SCHEMA", "panai.collection.json")  # indexes, HNSW, quantization
+
+# Storage backend: "qdrant" (server) or "embedded" (local files, no server, single worker)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "qdrant").lower()
+EMBEDDED_STORE_PATH = os.getenv("EMBEDDED_STORE_PATH", "embedded_store")
+EMBEDDED_INDEX = os.getenv("EMBEDDED_INDEX", "exact")  # or "ivf"
+EMBEDDED_IVF_MIN_POINTS = int(os.getenv("EMBEDDED_IVF_MIN_POINTS", 5000))  # exact search below this
+EMBEDDED_IVF_NPROBE = int(os.getenv("EMBEDDED_IVF_NPROBE", 8))  # lists probed per query
 
 # Ollama or LLM API configuration
-OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+# OLLAMA_API_URL (the old name, a full .../api/generate URL) is still read when OLLAMA_BASE_URL is unset.
+OLLAMA_BASE_URL = (os.getenv("OLLAMA_BASE_URL")
+                   or os.getenv("OLLAMA_API_URL", "http://localhost:11434").rstrip("/").removesuffix("/api/generate")
+                   ).rstrip("/")
 LLM_MODEL = os.getenv("LLM_MODEL", "mistral-nemo")
-LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", 60))  # seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 180))  # seconds for a whole answer, or between streamed tokens
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))  # seconds
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))  # retries for connection errors, 5xx and 429
+LLM_RETRY_BACKOFF_MS = float(os.getenv("LLM_RETRY_BACKOFF_MS", 500))  # doubled per attempt
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 8))  # pooled keep-alive connections to Ollama
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 1))  # concurrent generations per model
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")  # per-model overrides, e.g. "llama3.2:latest=2"
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", 8))  # queued calls ahead before 429; 0 = unbounded
+
+# Model residency (model_manager/residency.py)
+MODEL_RESIDENCY_ENABLED = os.getenv("MODEL_RESIDENCY_ENABLED", "true").lower() == "true"
+MODEL_RAM_LIMIT_MB = float(os.getenv("MODEL_RAM_LIMIT_MB", 0))  # resident model ceiling; 0 = 80% of RAM
+MODEL_KEEP_ALIVE_MIN = float(os.getenv("MODEL_KEEP_ALIVE_MIN", 120))  # seconds, for rarely used models
+MODEL_KEEP_ALIVE_MAX = float(os.getenv("MODEL_KEEP_ALIVE_MAX", 3600))  # seconds, for busy models
+MODEL_TRAFFIC_WINDOW_SECONDS = float(os.getenv("MODEL_TRAFFIC_WINDOW_SECONDS", 3600))  # traffic considered
+MODEL_PREWARM_MIN_REQUESTS = int(os.getenv("MODEL_PREWARM_MIN_REQUESTS", 3))  # in the window, to pre-warm
+MODEL_RESIDENCY_POLL_SECONDS = float(os.getenv("MODEL_RESIDENCY_POLL_SECONDS", 30))  # /api/ps poll interval
+
+# Load-aware inference routing across mesh peers (mesh_api/inference_router.py)
+MESH_ROUTING_ENABLED = os.getenv("MESH_ROUTING_ENABLED", "true").lower() == "true"
+MESH_ROUTING_POLL_SECONDS = float(os.getenv("MESH_ROUTING_POLL_SECONDS", 15))  # peer /health poll interval
+MESH_ROUTING_DEADLINE_SECONDS = float(os.getenv("MESH_ROUTING_DEADLINE_SECONDS", 60))  # max wait for a peer's next token, else local
+MESH_ROUTING_REMOTE_PENALTY_SECONDS = float(os.getenv("MESH_ROUTING_REMOTE_PENALTY_SECONDS", 1.0))  # prefer local on ties
+MESH_ROUTING_LOAD_PENALTY_SECONDS = float(os.getenv("MESH_ROUTING_LOAD_PENALTY_SECONDS", 20))  # cost of a cold model
+
+# Generation cache (memory_api/generation_cache.py)
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", 256))  # cached LLM responses (LRU)
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", 3600))  # seconds
+GENERATION_CACHE_SIMILARITY = float(os.getenv("GENERATION_CACHE_SIMILARITY", 0))  # prompt cosine for reuse; 0 = exact only
+
+# Context assembly for reflective prompts
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))  # tokens of memory text per prompt
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", 1500))  # tokens per map-reduce chunk
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", 4.0))  # token estimate
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 200))  # newest memories ranked per prompt
+CONTEXT_RECENCY_WEIGHT = float(os.getenv("CONTEXT_RECENCY_WEIGHT", 0.3))  # 0 = relevance only, 1 = recency only
+CONTEXT_RECENCY_HALF_LIFE_HOURS = float(os.getenv("CONTEXT_RECENCY_HALF_LIFE_HOURS", 72))
+
+# Rolling session summaries served by /memory/summarize
+SESSION_SUMMARY_ENABLED = os.getenv("SESSION_SUMMARY_ENABLED", "true").lower() == "true"
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL", "mistral")
+SESSION_SUMMARY_EVERY = int(os.getenv("SESSION_SUMMARY_EVERY", 20))  # new memories that trigger an update
+SESSION_SUMMARY_QUIET_SECONDS = float(os.getenv("SESSION_SUMMARY_QUIET_SECONDS", 120))  # or this long without writes
+SESSION_SUMMARY_POLL_SECONDS = float(os.getenv("SESSION_SUMMARY_POLL_SECONDS", 5))
+SESSION_SUMMARY_BATCH = int(os.getenv("SESSION_SUMMARY_BATCH", 50))  # memories read per fold (also token-bounded)
 
 # Dynamic model selection
 ALLOW_DYNAMIC_MODEL_SELECTION = os.getenv("ALLOW_DYNAMIC_MODEL_SELECTION", "true").lower() == "true"
@@ -17,6 +80,32 @@ DEFAULT_MODEL_NAME = os.getenv("DEFAULT_MODEL_NAME", LLM_MODEL)
 # Thread settings for embedding models or Ollama (optional)
 NUM_THREADS = int(os.getenv("NUM_THREADS", 14))
 
+# Executor that keeps embedding work off the asyncio event loop
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", 2))
+EXECUTOR_MAX_PENDING = int(os.getenv("EXECUTOR_MAX_PENDING", 64))  # callers wait beyond this
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", 250))
+
+# Write-behind memory ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+INGEST_FLUSH_INTERVAL_MS = float(os.getenv("INGEST_FLUSH_INTERVAL_MS", 500))
+INGEST_WAL_PATH = os.getenv("INGEST_WAL_PATH", "ingest_wal.jsonl")
+INGEST_COMMIT_TIMEOUT = float(os.getenv("INGEST_COMMIT_TIMEOUT", 30))  # seconds, for wait_for_commit
+BULK_INGEST_CHUNK_SIZE = int(os.getenv("BULK_INGEST_CHUNK_SIZE", 256))  # lines per embed + upsert in /memory/ingest
+BULK_INGEST_MAX_LINE_BYTES = int(os.getenv("BULK_INGEST_MAX_LINE_BYTES", 1 << 20))
+DEDUP_RECENT_HASHES = int(os.getenv("DEDUP_RECENT_HASHES", 100000))  # in-process duplicate short-circuit
+
+# Recall: dense, sparse (local BM25) or hybrid reciprocal-rank fusion of both
+RECALL_MODE = os.getenv("RECALL_MODE", "dense")
+RECALL_CANDIDATES = int(os.getenv("RECALL_CANDIDATES", 50))  # depth of each ranking fed into fusion
+RECALL_RRF_K = int(os.getenv("RECALL_RRF_K", 60))
+RECALL_MMR_LAMBDA = float(os.getenv("RECALL_MMR_LAMBDA", 0.5))  # default relevance/diversity trade-off when mmr=true
+RECALL_MMR_FETCH_K = int(os.getenv("RECALL_MMR_FETCH_K", 100))  # candidates re-ranked by MMR
+RECALL_BATCH_MAX_QUERIES = int(os.getenv("RECALL_BATCH_MAX_QUERIES", 64))  # per /memory/recall_batch call
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.sqlite3")
+RECALL_CACHE_ENABLED = os.getenv("RECALL_CACHE_ENABLED", "true").lower() == "true"
+RECALL_CACHE_SIZE = int(os.getenv("RECALL_CACHE_SIZE", 1024))  # cached query results (LRU)
+RECALL_CACHE_TTL = float(os.getenv("RECALL_CACHE_TTL", 60))  # seconds; also bounds staleness across workers
+
 # Embedding model for SentenceTransformer
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-small-en")
 
@@ -30,7 +119,16 @@ FEDERATION_SECRET = os.getenv("FEDERATION_SECRET", "change-me")
 PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() == "true"
 
 # Embedding configuration
-EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 8))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5))  # max time a batch stays open
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", 10000))
+EMBEDDING_READY_TIMEOUT = float(os.getenv("EMBEDDING_READY_TIMEOUT", 10))  # seconds a request waits on warm-up before 503
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", 120))  # seconds a blocking embed call waits on the batcher
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")  # or "onnx"
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "models/onnx/all-mpnet-base-v2")
+EMBEDDING_ONNX_QUANTIZE = os.getenv("EMBEDDING_ONNX_QUANTIZE", "true").lower() == "true"  # dynamic int8
 
 # Vector configuration
 VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", 384))
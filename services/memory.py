@@ -1,33 +1,35 @@
-
-
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, Distance, VectorParams, Filter, FieldCondition, MatchValue
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import PointStruct, Filter, FieldCondition, MatchValue
 from datetime import datetime
+from functools import lru_cache
 import uuid
 import logging
 
-# Initialize Qdrant client and embedding model
-client = QdrantClient(host="localhost", port=6333)
-embedder = SentenceTransformer("BAAI/bge-small-en-v1")
+from memory_api.qdrant_interface import ensure_panai_memory_collection, get_qdrant_client
 
 # Ensure the collection exists
 COLLECTION_NAME = "panai_memory"
 VECTOR_SIZE = 384
 
-try:
-    client.get_collection(COLLECTION_NAME)
-except Exception:
-    client.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
-    )
+# Qdrant is checked and the embedding model loaded on first use so importing
+# this module does not block on model loading or a Qdrant round trip.
+@lru_cache(maxsize=1)
+def get_client():
+    client = get_qdrant_client()
+    # Creates the collection only when Qdrant lists it as missing; an error
+    # while checking propagates instead of dropping existing memories.
+    ensure_panai_memory_collection(client)
+    return client
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer("BAAI/bge-small-en-v1")
 
 def log_memory_entry(session_id: str, text: str, tags: list = None):
     if tags is None:
         tags = []
 
-    vector = embedder.encode(text).tolist()
+    vector = get_embedder().encode(text).tolist()
     payload = {
         "session_id": session_id,
         "text": text,
@@ -36,7 +38,7 @@ def log_memory_entry(session_id: str, text: str, tags: list = None):
     }
     point = PointStruct(id=str(uuid.uuid4()), vector=vector, payload=payload)
 
-    client.upsert(collection_name=COLLECTION_NAME, points=[point])
+    get_client().upsert(collection_name=COLLECTION_NAME, points=[point])
     logging.info(f"Memory logged for session: {session_id}, tags: {tags}")
 
 def fetch_memories_by_tag(session_id: str, tag: str, limit: int = 10):
@@ -46,5 +48,5 @@ def fetch_memories_by_tag(session_id: str, tag: str, limit: int = 10):
             FieldCondition(key="tags", match=MatchValue(value=tag))
         ]
     )
-    result, _ = client.scroll(collection_name=COLLECTION_NAME, scroll_filter=scroll_filter, limit=limit)
-    return [point.payload["text"] for point in result]
\ No newline at end of file
+    result, _ = get_client().scroll(collection_name=COLLECTION_NAME, scroll_filter=scroll_filter, limit=limit)
+    return [point.payload["text"] for point in result]
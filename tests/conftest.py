@@ -0,0 +1,62 @@
+"""Shared fixtures. Every file the services write goes to a throwaway directory."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="panai-tests-")
+
+# services.config reads the environment once, at first import.
+for name, value in {
+    "MEMORY_BACKEND": "embedded",
+    "EMBEDDED_STORE_PATH": os.path.join(SCRATCH, "embedded_store"),
+    "INGEST_WAL_PATH": os.path.join(SCRATCH, "ingest_wal.jsonl"),
+    "LEXICAL_INDEX_PATH": os.path.join(SCRATCH, "lexical_index.sqlite3"),
+    "EMBEDDING_CACHE_PATH": os.path.join(SCRATCH, "embedding_cache.sqlite3"),
+    "QDRANT_COLLECTION_SCHEMA": os.path.join(REPO_ROOT, "panai.collection.json"),
+    "SESSION_SUMMARY_BATCH": "2",
+}.items():
+    os.environ[name] = value
+
+DIM = 768
+
+
+def fake_embed(texts):
+    """Bag-of-words hashing embedder: texts sharing words get similar vectors."""
+    vectors = []
+    for text in texts:
+        vector = np.zeros(DIM)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+        vectors.append((vector / (np.linalg.norm(vector) or 1.0)).tolist())
+    return vectors
+
+
+@pytest.fixture(scope="session")
+def memory_api():
+    """The memory routes module, wired to the embedded store and ``fake_embed``."""
+    cwd = os.getcwd()
+    os.chdir(SCRATCH)  # memory_log.json is created in the working directory on import
+    try:
+        from memory_api import memory_api as module
+        from memory_api.qdrant_interface import ensure_panai_memory_collection
+    finally:
+        os.chdir(cwd)
+    ensure_panai_memory_collection(module.client)
+
+    async def embed_texts(texts):
+        return fake_embed(texts)
+
+    module.embed_texts = embed_texts
+    module.ingest_buffer.embed_batch = fake_embed
+    yield module
+    module.ingest_buffer.stop()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH, ignore_errors=True)
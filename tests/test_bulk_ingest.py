@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+from memory_api.bulk_ingest import ingest_ndjson
+from memory_api.dedup import content_hash
+
+
+def _line(text):
+    return (json.dumps({"text": text, "session_id": "bulk"}) + "\n").encode()
+
+
+class Seen:
+    def __init__(self):
+        self.hashes = set()
+
+    def check_and_add(self, digest):
+        if digest in self.hashes:
+            return True
+        self.hashes.add(digest)
+        return False
+
+
+def _ingest(chunks, stored, seen, embed=None, chunk_size=2):
+    async def default_embed(texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    async def upsert(points):
+        await asyncio.sleep(0.01)
+        stored.extend(p.payload["text"] for p in points)
+
+    return ingest_ndjson(chunks, embed or default_embed, upsert, vector_size=2, chunk_size=chunk_size,
+                         seen=seen.check_and_add, forget=seen.hashes.discard)
+
+
+def test_lines_are_committed_in_chunks():
+    async def body():
+        yield b"".join(_line(t) for t in ["one", "two", "three"]) + b"not json\n"
+
+    async def run():
+        stored, seen = [], Seen()
+        results = [r async for r in _ingest(body(), stored, seen)]
+        return stored, results
+
+    stored, results = asyncio.run(run())
+    assert stored == ["one", "two", "three"]
+    assert [r.get("status") for r in results[:-1]] == ["error", "ok", "ok", "ok"]
+    assert results[-1]["summary"]["ok"] == 3
+
+
+def test_disconnect_finishes_the_chunk_in_flight_and_releases_the_rest():
+    async def body():
+        yield b"".join(_line(t) for t in ["one", "two", "three"])
+        raise ConnectionError("client disconnected")
+
+    async def run():
+        stored, seen = [], Seen()
+        with pytest.raises(ConnectionError):
+            async for _ in _ingest(body(), stored, seen):
+                pass
+        return stored, seen
+
+    stored, seen = asyncio.run(run())
+    assert stored == ["one", "two"]
+    assert content_hash("bulk", "three") not in seen.hashes  # a retry is not a duplicate
+    assert content_hash("bulk", "one") in seen.hashes
+
+
+def test_closing_the_stream_early_still_commits_the_chunk_in_flight():
+    async def body():
+        yield b"".join(_line(t) for t in ["one", "two"]) + b"not json\n" + _line("three")
+
+    async def run():
+        stored, seen = [], Seen()
+        results = _ingest(body(), stored, seen)
+        first = await results.__anext__()  # the bad line, reported while "one" and "two" are being committed
+        await results.aclose()
+        return first, stored, seen
+
+    first, stored, seen = asyncio.run(run())
+    assert first == {"line": 3, "status": "error", "error": first["error"]}
+    assert stored == ["one", "two"]
+
+
+def test_embedding_failure_reports_errors_and_keeps_streaming():
+    async def body():
+        yield b"".join(_line(t) for t in ["one", "two", "three"])
+
+    async def broken(texts):
+        raise RuntimeError("encoder down")
+
+    async def run():
+        stored, seen = [], Seen()
+        results = [r async for r in _ingest(body(), stored, seen, embed=broken)]
+        return stored, seen, results
+
+    stored, seen, results = asyncio.run(run())
+    assert stored == []
+    assert [r["status"] for r in results[:-1]] == ["error"] * 3
+    assert seen.hashes == set()
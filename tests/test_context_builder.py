@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from qdrant_client.http.models import Record
+
+from memory_api.context_builder import build_context, chunk_by_tokens, pack, rank_memories
+
+
+def _point(n, text, hours_ago=0.0, vector=None):
+    timestamp = (datetime.now(timezone.utc) - timedelta(hours=hours_ago)).isoformat()
+    return Record(id=n, payload={"text": text, "timestamp": timestamp}, vector=vector)
+
+
+def test_chunks_respect_the_token_budget():
+    texts = ["a" * 40, "b" * 40, "c" * 200, "d" * 4]  # 11, 11, 51 and 2 tokens with separators
+    assert chunk_by_tokens(texts, chunk_tokens=25) == [[0, 1], [2], [3]]
+
+
+def test_pack_keeps_the_best_texts_that_fit():
+    assert pack(["a" * 40, "b" * 200, "c" * 40], budget=25) == [0, 2]
+
+
+def test_ranking_blends_relevance_and_recency():
+    close = [1.0, 0.0]
+    points = [_point(1, "old and on topic", 500, close), _point(2, "new and off topic", 0, [0.0, 1.0]),
+              _point(3, "new and on topic", 0, close)]
+    assert [p.id for p in rank_memories(points, 2, recency_weight=0.3)] == [3, 1]
+    assert {p.id for p in rank_memories(points, 2, recency_weight=1.0)} == {2, 3}
+    assert rank_memories(points[:2], 5) == points[:2]
+
+
+def test_context_that_fits_is_joined_in_time_order():
+    points = [_point(1, "second", 1), _point(2, "first", 2)]
+
+    async def never(*args):
+        raise AssertionError("nothing to summarize")
+
+    context = asyncio.run(build_context("s1", points, never, budget=100, chunk_tokens=50))
+    assert context == {"text": "first\nsecond", "strategy": "all", "tokens": 3}
+
+
+def test_long_context_is_map_reduced_with_chunk_ids():
+    points = [_point(n, f"memory {n} " + "x" * 80, hours_ago=10 - n) for n in range(6)]
+    calls = []
+
+    async def summarize(template, prompt, ids):
+        calls.append(ids)
+        return f"summary of {len(ids)}"
+
+    context = asyncio.run(build_context("s1", points, summarize, budget=20, chunk_tokens=50))
+    assert context["strategy"] == "map_reduce"
+    assert context["tokens"] <= 20
+    assert calls[0] == [0, 1]  # chunks are chronological runs of memory ids
+
+
+def test_failed_summaries_fall_back_to_packing():
+    points = [_point(n, "y" * 40, hours_ago=n) for n in range(5)]
+
+    async def broken(*args):
+        raise RuntimeError("model unavailable")
+
+    context = asyncio.run(build_context("s1", points, broken, budget=25, chunk_tokens=50))
+    assert context["strategy"] == "packed"
+    assert context["text"] == "\n".join(["y" * 40] * 2)
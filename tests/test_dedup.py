@@ -0,0 +1,46 @@
+from memory_api.dedup import RecentHashes, content_hash, point_id_for_hash
+
+
+def test_content_hash_ignores_whitespace_but_not_session():
+    assert content_hash("s1", "hello   world\n") == content_hash("s1", " hello world")
+    assert content_hash("s1", "hello world") != content_hash("s2", "hello world")
+    assert content_hash("s1", "hello world") != content_hash("s1", "hello there")
+
+
+def test_point_id_is_a_stable_uuid():
+    digest = content_hash("s1", "hello")
+    assert point_id_for_hash(digest) == point_id_for_hash(content_hash("s1", "hello"))
+    assert len(point_id_for_hash(digest)) == 36
+
+
+def test_check_and_add_records_the_hash():
+    recent = RecentHashes()
+    assert recent.check_and_add("a") is False
+    assert recent.check_and_add("a") is True
+    assert recent.stats()["duplicates_skipped"] == 1
+
+
+def test_seen_does_not_record():
+    recent = RecentHashes()
+    assert recent.seen("a") is False
+    assert recent.seen("a") is False
+    recent.add(["a", None, ""])
+    assert recent.seen("a") is True
+    assert recent.stats()["size"] == 1
+
+
+def test_discard_forgets_a_hash():
+    recent = RecentHashes()
+    recent.add(["a"])
+    recent.discard("a")
+    recent.discard("missing")
+    assert recent.seen("a") is False
+
+
+def test_capacity_evicts_least_recently_used():
+    recent = RecentHashes(capacity=2)
+    recent.add(["a", "b"])
+    assert recent.seen("a")  # "b" is now the oldest
+    recent.add(["c"])
+    assert recent.seen("a") and recent.seen("c")
+    assert not recent.seen("b")
@@ -0,0 +1,103 @@
+import pytest
+from qdrant_client.http.models import Direction, Distance, OrderBy, SetPayload, SetPayloadOperation, VectorParams
+
+from memory_api.embedded_store import EmbeddedClient
+
+COLLECTION = "panai_memory"
+
+
+def _point(n, session_id, tags, timestamp, **extra):
+    return {
+        "id": n,
+        "vector": [1.0, float(n), 0.0, 0.0],
+        "payload": {"text": f"memory {n}", "session_id": session_id, "tags": tags, "timestamp": timestamp, **extra},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    client = EmbeddedClient(str(tmp_path))
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=4, distance=Distance.COSINE))
+    client.upsert(COLLECTION, points=[
+        _point(1, "s1", ["note"], "2024-01-01T00:00:00+00:00", committed_at=30),
+        _point(2, "s1", ["note", "reflection"], "2024-01-02T00:00:00Z", committed_at=10),
+        _point(3, "s1", ["summary"], "2024-01-03T00:00:00+00:00", committed_at=20),
+        _point(4, "s2", ["note"], "2024-01-04T00:00:00+00:00"),
+    ])
+    yield client
+    client.close()
+
+
+def _ids(points):
+    return sorted(p.id for p in points)
+
+
+def test_must_should_and_must_not(store):
+    session = {"key": "session_id", "match": {"value": "s1"}}
+    points, _ = store.scroll(COLLECTION, scroll_filter={"must": [session]}, limit=10)
+    assert _ids(points) == [1, 2, 3]
+    points, _ = store.scroll(COLLECTION, scroll_filter={
+        "must": [session], "must_not": [{"key": "tags", "match": {"value": "summary"}}]}, limit=10)
+    assert _ids(points) == [1, 2]
+    points, _ = store.scroll(COLLECTION, scroll_filter={
+        "should": [{"key": "tags", "match": {"any": ["reflection", "summary"]}}]}, limit=10)
+    assert _ids(points) == [2, 3]
+    assert store.count(COLLECTION, count_filter={"must": [{"key": "tags", "match": {"value": "note"}}]}).count == 3
+
+
+def test_range_on_timestamps_and_integers(store):
+    points, _ = store.scroll(COLLECTION, scroll_filter={"must": [
+        {"key": "timestamp", "range": {"gte": "2024-01-02T00:00:00+00:00", "lt": "2024-01-04T00:00:00Z"}}]}, limit=10)
+    assert _ids(points) == [2, 3]
+    points, _ = store.scroll(COLLECTION, scroll_filter={"must": [
+        {"key": "committed_at", "range": {"gt": 10, "lte": 30}}]}, limit=10)
+    assert _ids(points) == [1, 3]
+
+
+def test_is_empty(store):
+    points, _ = store.scroll(COLLECTION, scroll_filter={"must": [{"is_empty": {"key": "committed_at"}}]}, limit=10)
+    assert _ids(points) == [4]
+
+
+def test_order_by_skips_points_without_the_key(store):
+    points, next_offset = store.scroll(COLLECTION, limit=2, order_by=OrderBy(key="committed_at", direction=Direction.ASC))
+    assert [p.id for p in points] == [2, 3]
+    assert next_offset is None
+    points, _ = store.scroll(COLLECTION, limit=10, order_by=OrderBy(key="committed_at", direction=Direction.DESC))
+    assert [p.id for p in points] == [1, 3, 2]
+
+
+def test_scroll_pages_with_an_offset(store):
+    first, offset = store.scroll(COLLECTION, limit=3)
+    rest, end = store.scroll(COLLECTION, limit=3, offset=offset)
+    assert _ids(first + rest) == [1, 2, 3, 4]
+    assert end is None
+
+
+def test_filtered_search(store):
+    hits = store.search(COLLECTION, query_vector=[1.0, 4.0, 0.0, 0.0], limit=2,
+                        query_filter={"must": [{"key": "session_id", "match": {"value": "s1"}}]})
+    assert [h.id for h in hits] == [3, 2]
+    assert hits[0].score >= hits[1].score
+
+
+def test_writes_survive_a_reopen(store, tmp_path):
+    store.set_payload(COLLECTION, payload={"tags": ["note", "synced:peer"]}, points=[1])
+    store.delete(COLLECTION, points_selector=[4])
+    store.close()
+    reopened = EmbeddedClient(str(tmp_path))
+    points, _ = reopened.scroll(COLLECTION, scroll_filter={
+        "must": [{"key": "tags", "match": {"value": "synced:peer"}}]}, limit=10)
+    assert [(p.id, p.payload["committed_at"]) for p in points] == [(1, 30)]
+    assert reopened.retrieve(COLLECTION, ids=[4]) == []
+    reopened.close()
+
+
+def test_batch_update_points_sets_payloads(store):
+    store.batch_update_points(COLLECTION, update_operations=[
+        SetPayloadOperation(set_payload=SetPayload(payload={"committed_at": 40}, points=[4])),
+        SetPayloadOperation(set_payload=SetPayload(payload={"tags": ["note", "late"]}, points=[4])),
+    ])
+    payload = store.retrieve(COLLECTION, ids=[4])[0].payload
+    assert payload["committed_at"] == 40 and payload["tags"] == ["note", "late"]
+    assert _ids(store.scroll(COLLECTION, scroll_filter={"must": [{"key": "tags", "match": {"value": "late"}}]})[0]) == [4]
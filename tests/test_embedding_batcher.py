@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from memory_api.embedding import EmbeddingBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=50)
+    futures = batcher.submit(["a", "bb", "ccc"])
+    assert [f.result(timeout=5) for f in futures] == [[1.0], [2.0], [3.0]]
+    assert calls == [["a", "bb", "ccc"]]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    sizes = []
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait(5)
+        sizes.append(len(texts))
+        return [[0.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=20)
+    futures = batcher.submit([str(i) for i in range(10)])
+    release.set()
+    for f in futures:
+        f.result(timeout=5)
+    assert sum(sizes) == 10
+    assert max(sizes) <= 4
+    stats = batcher.stats()
+    assert stats["texts"] == 10
+    assert stats["largest_batch"] <= 4
+
+
+def test_a_lone_request_waits_at_most_max_wait():
+    batcher = EmbeddingBatcher(lambda texts: [[1.0] for _ in texts], max_batch_size=64, max_wait_ms=20)
+    started = time.monotonic()
+    batcher.submit(["only"])[0].result(timeout=5)
+    assert time.monotonic() - started < 1.0
+
+
+def test_encoder_failure_fails_every_future_in_the_batch():
+    def encode(texts):
+        raise RuntimeError("encoder down")
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, max_wait_ms=20)
+    futures = batcher.submit(["a", "b"])
+    for f in futures:
+        with pytest.raises(RuntimeError, match="encoder down"):
+            f.result(timeout=5)
+    assert batcher.stats()["failed_batches"] >= 1
+
+
+def test_cancelled_requests_do_not_stop_the_worker():
+    release = threading.Event()
+    calls = []
+
+    def encode(texts):
+        release.wait(5)
+        calls.append(list(texts))
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=1, max_wait_ms=0)
+    running = batcher.submit(["running"])[0]
+    time.sleep(0.05)  # let the worker pick it up
+    abandoned = batcher.submit(["abandoned"])[0]
+    assert abandoned.cancel()
+    release.set()
+    assert running.result(timeout=5) == [1.0]
+    assert batcher.submit(["later"])[0].result(timeout=5) == [1.0]
+    assert ["abandoned"] not in calls
+
+
+def test_wrong_number_of_vectors_fails_the_batch():
+    batcher = EmbeddingBatcher(lambda texts: [[1.0]], max_batch_size=8, max_wait_ms=50)
+    futures = batcher.submit(["a", "b"])
+    for f in futures:
+        with pytest.raises(ValueError, match="1 vectors for 2 texts"):
+            f.result(timeout=5)
+    batcher.encode_fn = lambda texts: [[2.0] for _ in texts]
+    assert batcher.submit(["c"])[0].result(timeout=5) == [2.0]
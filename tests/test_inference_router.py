@@ -0,0 +1,27 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from mesh_api.inference_router import SECRET_HEADER, inference_router, router
+
+
+@pytest.fixture
+def mesh(monkeypatch):
+    monkeypatch.setattr(inference_router, "secret", "s3cret")
+    app = FastAPI()
+    app.include_router(router, prefix="/mesh")
+    return TestClient(app)
+
+
+def test_generate_requires_the_federation_secret(mesh):
+    request = {"model": "m", "prompt": "hi", "options": {"num_gpu": 1}}
+    assert mesh.post("/mesh/generate", json=request).status_code == 401
+    assert mesh.post("/mesh/generate", json=request, headers={SECRET_HEADER: "guess"}).status_code == 401
+    # With the secret the request reaches validation, which refuses resource options.
+    assert mesh.post("/mesh/generate", json=request, headers={SECRET_HEADER: "s3cret"}).status_code == 400
+
+
+def test_an_empty_secret_refuses_every_caller(mesh, monkeypatch):
+    monkeypatch.setattr(inference_router, "secret", "")
+    response = mesh.post("/mesh/generate", json={"model": "m", "prompt": "hi"}, headers={SECRET_HEADER: ""})
+    assert response.status_code == 401
@@ -0,0 +1,158 @@
+import json
+import time
+
+import pytest
+from qdrant_client.http.models import Distance, VectorParams
+
+from memory_api.commit_clock import COMMIT_FIELD
+from memory_api.embedded_store import EmbeddedClient
+from memory_api.ingest_buffer import IngestBuffer
+
+COLLECTION = "panai_memory"
+ID_A = "00000000-0000-0000-0000-00000000000a"
+ID_B = "00000000-0000-0000-0000-00000000000b"
+
+
+def _record(point_id, text):
+    return {"id": point_id, "payload": {"text": text, "session_id": "s1", "tags": []}}
+
+
+def _embed(texts):
+    return [[1.0, float(len(t)), 0.0] for t in texts]
+
+
+class FlakyClient:
+    """Forwards to an embedded store; upserts fail while ``down`` is set."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.down = False
+
+    def upsert(self, **kwargs):
+        if self.down:
+            raise ConnectionError("store unavailable")
+        return self.inner.upsert(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+@pytest.fixture
+def store(tmp_path):
+    client = EmbeddedClient(str(tmp_path / "store"))
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=3, distance=Distance.COSINE))
+    yield client
+    client.close()
+
+
+def _buffer(client, tmp_path, embed=_embed):
+    buffer = IngestBuffer(client, embed, wal_path=str(tmp_path / "wal.jsonl"), max_batch=64, flush_interval=60)
+    buffer.max_retry_delay = 0.0
+    return buffer
+
+
+def _wal(tmp_path):
+    return [json.loads(line) for line in (tmp_path / "wal.jsonl").read_text().splitlines()]
+
+
+def test_submitted_records_are_committed_in_one_upsert(store, tmp_path):
+    buffer = _buffer(store, tmp_path)
+    futures = [buffer.submit(_record(ID_A, "first")), buffer.submit(_record(ID_B, "second"))]
+    assert len(_wal(tmp_path)) == 2
+    assert buffer.flush() == 2
+    assert all(f.result(timeout=1) for f in futures)
+    stored = store.retrieve(COLLECTION, ids=[ID_A, ID_B])
+    assert len(stored) == 2 and all(p.payload[COMMIT_FIELD] for p in stored)
+    assert _wal(tmp_path) == []
+    buffer.stop()
+
+
+def test_wal_is_replayed_after_a_crash(store, tmp_path):
+    crashed = FlakyClient(store)
+    crashed.down = True
+    first = _buffer(crashed, tmp_path)
+    fut = first.submit(_record(ID_A, "survives"))
+    assert first.flush() == 0
+    with pytest.raises(ConnectionError):
+        fut.result(timeout=1)
+    with open(tmp_path / "wal.jsonl", "a", encoding="utf-8") as wal:
+        wal.write('{"id": "torn')  # a write cut short by the crash
+
+    restarted = _buffer(store, tmp_path)
+    restarted.start()
+    restarted.stop()
+    assert [p.payload["text"] for p in store.retrieve(COLLECTION, ids=[ID_A])] == ["survives"]
+    assert _wal(tmp_path) == []
+    assert restarted.stats()["committed"] == 1
+
+
+def test_failed_upsert_keeps_the_record_queued(store, tmp_path):
+    flaky = FlakyClient(store)
+    buffer = _buffer(flaky, tmp_path)
+    flaky.down = True
+    buffer.submit(_record(ID_A, "retry me"))
+    buffer.flush_all()
+    assert buffer.stats()["failed_flushes"] == 1
+    assert buffer.stats()["pending"] == 1
+    assert len(_wal(tmp_path)) == 1
+
+    flaky.down = False
+    assert buffer.flush() == 1
+    assert store.count(COLLECTION).count == 1
+    assert _wal(tmp_path) == []
+    buffer.stop()
+
+
+def test_unembeddable_record_is_retried_without_blocking_others(store, tmp_path):
+    broken = {"on": True}
+
+    def embed(texts):
+        return [None if broken["on"] and t == "bad" else v for t, v in zip(texts, _embed(texts))]
+
+    buffer = _buffer(store, tmp_path, embed=embed)
+    good = buffer.submit(_record(ID_A, "good"))
+    bad = buffer.submit(_record(ID_B, "bad"))
+    assert buffer.flush() == 1
+    assert good.result(timeout=1) is True
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        bad.result(timeout=1)
+    assert [r["id"] for r in _wal(tmp_path)] == [ID_B]
+    assert ID_B in buffer._retries
+    assert buffer.stats()["embed_failures"] == 1
+
+    broken["on"] = False
+    time.sleep(0.01)
+    assert buffer.flush() == 1
+    assert buffer._retries == {}
+    assert store.count(COLLECTION).count == 2
+    buffer.stop()
+
+
+def test_redelivery_keeps_the_first_commit_stamp(store, tmp_path):
+    buffer = _buffer(store, tmp_path)
+    buffer.submit(_record(ID_A, "once"))
+    buffer.flush()
+    stamp = store.retrieve(COLLECTION, ids=[ID_A])[0].payload[COMMIT_FIELD]
+    buffer.submit(_record(ID_A, "once"))
+    buffer.flush()
+    assert store.retrieve(COLLECTION, ids=[ID_A])[0].payload[COMMIT_FIELD] == stamp
+    buffer.stop()
+
+
+def test_resubmitted_id_is_written_once_and_wakes_every_caller(store, tmp_path):
+    upserts = []
+
+    class CountingClient(FlakyClient):
+        def upsert(self, **kwargs):
+            upserts.append([p.id for p in kwargs["points"]])
+            return super().upsert(**kwargs)
+
+    buffer = _buffer(CountingClient(store), tmp_path)
+    first = buffer.submit(_record(ID_A, "draft"))
+    second = buffer.submit(_record(ID_A, "final"))
+    assert buffer.stats()["pending"] == 1
+    assert buffer.flush() == 1
+    assert first.result(timeout=1) is True and second.result(timeout=1) is True
+    assert upserts == [[ID_A]]
+    assert store.retrieve(COLLECTION, ids=[ID_A])[0].payload["text"] == "final"
+    buffer.stop()
@@ -0,0 +1,58 @@
+import asyncio
+import uuid
+
+from qdrant_client.http.models import Distance, VectorParams
+
+from memory_api.dedup import content_hash, migrate_content_hashes
+from memory_api.embedded_store import EmbeddedClient
+from memory_api.lexical_index import LexicalIndex, rrf_fuse
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = rrf_fuse([["a", "b", "c"], ["b", "c", "a"]], k=60)
+    assert [key for key, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_rrf_keeps_keys_from_either_ranking_and_applies_limit():
+    fused = rrf_fuse([["a"], ["b", "c"]], k=1, limit=2)
+    assert fused == [("a", 0.5), ("b", 0.5)]
+    assert rrf_fuse([]) == []
+
+
+def test_readding_a_hash_replaces_its_terms_and_remove_drops_it():
+    index = LexicalIndex(None)
+    index.add([{"text": "gem10 hosts qdrant", "session_id": "s1", "content_hash": "h1"}])
+    index.add([{"text": "gem11 hosts ollama", "session_id": "s1", "content_hash": "h1"}])
+    assert index.search("gem10") == []
+    assert [d for d, _ in index.search("gem11")] == ["h1"]
+    assert index.remove(["h1", "missing", None]) == 1
+    assert index.search("gem11") == [] and index.count() == 0
+
+
+def test_migration_rekeys_lexical_entries(tmp_path):
+    client = EmbeddedClient(str(tmp_path))
+    client.create_collection("panai_memory", vectors_config=VectorParams(size=4, distance=Distance.COSINE))
+    payload = {"text": "tomatoes in the garden", "session_id": "s1", "content_hash": "outdated"}
+    client.upsert("panai_memory", points=[{"id": str(uuid.uuid4()), "vector": [1.0, 0, 0, 0], "payload": payload}])
+    index = LexicalIndex(None)
+    index.add([payload])
+
+    migrate_content_hashes(client, lexical_index=index)
+    assert [d for d, _ in index.search("tomatoes")] == [content_hash("s1", "tomatoes in the garden")]
+    client.close()
+
+
+def test_recall_prunes_hits_whose_memory_is_gone(memory_api):
+    memory_api.log_generic_memory("xylophone lessons on tuesday", "prune", ["note"], wait_for_commit=True)
+    memory_api.lexical_index.add([{"text": "xylophone repair shop", "session_id": "prune", "content_hash": "deleted"}])
+
+    async def recall():
+        response = await memory_api._recall(memory_api.TextQuery(text="xylophone", mode="sparse", limit=5))
+        await asyncio.gather(*memory_api.background_tasks)
+        return response
+
+    response = asyncio.run(recall())
+    assert [hit["text"] for hit in response["results"]] == ["xylophone lessons on tuesday"]
+    assert [d for d, _ in memory_api.lexical_index.search("xylophone")] == [
+        content_hash("prune", "xylophone lessons on tuesday")]
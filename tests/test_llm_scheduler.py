@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from memory_api.llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_WARMUP,
+    LLMScheduler,
+    SchedulerBusy,
+    parse_model_concurrency,
+)
+
+
+async def _hold(scheduler, model, priority, order, label, release):
+    async with scheduler.slot(model, priority):
+        order.append(label)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_by_priority():
+    scheduler = LLMScheduler(concurrency=1, max_queue=8)
+    order = []
+    release = asyncio.Event()
+    first = asyncio.create_task(_hold(scheduler, "m", PRIORITY_BACKGROUND, order, "first", release))
+    await asyncio.sleep(0)
+    waiters = [
+        asyncio.create_task(_hold(scheduler, "m", priority, order, label, release))
+        for priority, label in [(PRIORITY_WARMUP, "warmup"), (PRIORITY_BACKGROUND, "background"),
+                                (PRIORITY_INTERACTIVE, "interactive")]
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.stats()["models"]["m"] == {"limit": 1, "active": 1, "queued": 3}
+    release.set()
+    await asyncio.gather(first, *waiters)
+    assert order == ["first", "interactive", "background", "warmup"]
+    assert scheduler.stats()["models"]["m"]["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_refused_with_429():
+    scheduler = LLMScheduler(concurrency=1, max_queue=1)
+    release = asyncio.Event()
+    order = []
+    running = asyncio.create_task(_hold(scheduler, "m", PRIORITY_BACKGROUND, order, "running", release))
+    await asyncio.sleep(0)
+    scheduler.admit("m", PRIORITY_BACKGROUND)  # the queue is empty: admitted
+    queued = asyncio.create_task(_hold(scheduler, "m", PRIORITY_BACKGROUND, order, "queued", release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(SchedulerBusy) as refused:
+        scheduler.admit("m", PRIORITY_BACKGROUND)
+    assert refused.value.status_code == 429
+    assert int(refused.value.headers["Retry-After"]) >= 1
+    with pytest.raises(SchedulerBusy):
+        async with scheduler.slot("m", PRIORITY_WARMUP):
+            pass
+    scheduler.admit("m", PRIORITY_INTERACTIVE)  # nobody of higher or equal priority is waiting
+    assert scheduler.stats()["rejected"] == {"interactive": 0, "background": 1, "warmup": 1}
+
+    release.set()
+    await asyncio.gather(running, queued)
+    assert order == ["running", "queued"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = LLMScheduler(concurrency=1, max_queue=4)
+    release = asyncio.Event()
+    order = []
+    running = asyncio.create_task(_hold(scheduler, "m", PRIORITY_BACKGROUND, order, "running", release))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_hold(scheduler, "m", PRIORITY_BACKGROUND, order, "cancelled", release))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    release.set()
+    await running
+    assert order == ["running"]
+    assert scheduler.stats()["models"]["m"] == {"limit": 1, "active": 0, "queued": 0}
+
+
+def test_parse_model_concurrency():
+    assert parse_model_concurrency("mistral-nemo=1, llama3.2:latest=2,bad,x=y") == {
+        "mistral-nemo": 1, "llama3.2:latest": 2,
+    }
+    assert parse_model_concurrency("") == {}
@@ -0,0 +1,24 @@
+import numpy as np
+
+from memory_api.mmr import mmr_select
+
+
+def test_mmr_skips_near_duplicates():
+    candidates = [[1.0, 0.0, 0.0], [0.99, 0.01, 0.0], [0.6, 0.8, 0.0]]
+    assert mmr_select(candidates, k=2, lambda_mult=1.0, query=[1.0, 0.0, 0.0]) == [0, 1]
+    assert mmr_select(candidates, k=2, lambda_mult=0.3, query=[1.0, 0.0, 0.0]) == [0, 2]
+
+
+def test_mmr_with_lambda_one_is_plain_similarity_ranking():
+    rng = np.random.default_rng(0)
+    candidates = rng.normal(size=(20, 8))
+    query = rng.normal(size=8)
+    unit = candidates / np.linalg.norm(candidates, axis=1, keepdims=True)
+    expected = list(np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5])
+    assert mmr_select(candidates, k=5, lambda_mult=1.0, query=query) == expected
+
+
+def test_mmr_bounds():
+    assert mmr_select([], k=3) == []
+    assert mmr_select([[1.0, 0.0]], k=0) == []
+    assert sorted(mmr_select([[1.0, 0.0], [0.0, 1.0]], k=5)) == [0, 1]
@@ -0,0 +1,58 @@
+from memory_api.recall_cache import RecallCache
+
+
+def _cache(cache, key, value, session_id=None):
+    version, _ = cache.get(key, session_id)
+    cache.put(key, value, version, session_id)
+
+
+def test_writes_to_other_sessions_keep_scoped_entries():
+    cache = RecallCache(max_items=8, ttl=60)
+    _cache(cache, "a", "hits for a", "s1")
+    cache.bump(["s2"])
+    assert cache.get("a", "s1")[1] == "hits for a"
+    cache.bump(["s1"])
+    assert cache.get("a", "s1")[1] is None
+
+
+def test_unscoped_entries_are_invalidated_by_any_write():
+    cache = RecallCache(max_items=8, ttl=60)
+    _cache(cache, "all", "hits")
+    assert cache.get("all")[1] == "hits"
+    cache.bump(["s9"])
+    assert cache.get("all")[1] is None
+
+
+def test_write_during_a_query_keeps_its_result_out():
+    cache = RecallCache(max_items=8, ttl=60)
+    version, _ = cache.get("a", "s1")
+    cache.bump(["s1"])  # lands while the query runs
+    cache.put("a", "stale", version, "s1")
+    assert cache.get("a", "s1")[1] is None
+
+
+def test_bump_without_sessions_invalidates_everything():
+    cache = RecallCache(max_items=8, ttl=60)
+    _cache(cache, "a", "hits", "s1")
+    cache.bump()
+    assert cache.get("a", "s1")[1] is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_forgotten_sessions_never_serve_stale_entries():
+    cache = RecallCache(max_items=8, ttl=60)
+    cache._session_capacity = 2
+    _cache(cache, "a", "before", "s1")
+    cache.bump(["s1"])
+    cache.bump(["s2"])
+    cache.bump(["s3"])  # s1's counter is dropped
+    assert "s1" not in cache._sessions
+    assert cache.get("a", "s1")[1] is None
+    _cache(cache, "a", "after", "s1")
+    assert cache.get("a", "s1")[1] == "after"
+
+
+def test_expired_entries_are_misses():
+    cache = RecallCache(max_items=8, ttl=-1)
+    _cache(cache, "a", "hits", "s1")
+    assert cache.get("a", "s1")[1] is None
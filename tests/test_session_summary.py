@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from memory_api.commit_clock import COMMIT_FIELD, CommitClock
+from tests.conftest import fake_embed
+
+
+def test_stamps_are_strictly_increasing_and_existing_ones_are_kept():
+    clock = CommitClock()
+    first = [{"id": "a", "payload": {}}, {"id": "b", "payload": {}}]
+    with clock.commit(first):
+        pass
+    again = [{"id": "a", "payload": {}}, {"id": "c", "payload": {}}]
+    with clock.commit(again, existing={"a": first[0]["payload"][COMMIT_FIELD]}):
+        pass
+    a, b = (p["payload"][COMMIT_FIELD] for p in first)
+    assert a < b < again[1]["payload"][COMMIT_FIELD]
+    assert again[0]["payload"][COMMIT_FIELD] == a
+    assert clock.horizon() == clock.stats()["last_stamp"]
+
+
+def test_horizon_stays_below_writes_in_flight():
+    clock = CommitClock()
+    slow = [{"id": "slow", "payload": {}}]
+    fast = [{"id": "fast", "payload": {}}]
+    with clock.commit(slow):
+        with clock.commit(fast):
+            pass
+        assert clock.horizon() == slow[0]["payload"][COMMIT_FIELD] - 1
+        assert clock.stats()["batches_in_flight"] == 1
+    assert clock.horizon() == fast[0]["payload"][COMMIT_FIELD]
+
+
+@pytest.fixture
+def folds(memory_api, monkeypatch):
+    """Replace the summarizer with a stub that records the memories each fold saw."""
+    seen = []
+
+    async def generate(model, prompt, *args, **kwargs):
+        seen.append(prompt)
+        return f"summary {len(seen)}"
+
+    monkeypatch.setattr(memory_api.llm_client, "generate", generate)
+    return seen
+
+
+def _update(memory_api, session_id, **kwargs):
+    return asyncio.run(memory_api.update_session_summary(session_id, **kwargs))
+
+
+def test_cursor_advances_over_new_commits_only(memory_api, folds):
+    for text in ["alpha one", "bravo two", "charlie three"]:
+        memory_api.log_generic_memory(text, "cursor", ["note"], wait_for_commit=True)
+
+    summary = _update(memory_api, "cursor")
+    assert len(folds) == 2  # SESSION_SUMMARY_BATCH=2: two batches for three memories
+    assert summary["memories"] == 3
+    assert summary["text"] == "summary 2"
+    through = summary["summarized_through"]
+
+    assert _update(memory_api, "cursor")["summarized_through"] == through
+    assert len(folds) == 2  # nothing new, nothing folded
+
+    late = memory_api.memory_point("delta back-dated", "cursor", ["note"], vector=fake_embed(["delta"])[0],
+                                   timestamp="2000-01-01T00:00:00+00:00")
+    asyncio.run(memory_api.store_points([late]))
+    summary = _update(memory_api, "cursor")
+    assert len(folds) == 3
+    assert "delta back-dated" in folds[-1] and "alpha one" not in folds[-1]
+    assert summary["memories"] == 4
+    assert summary["summarized_through"] > through
+
+
+def test_retagging_does_not_refold(memory_api, folds):
+    memory_api.log_generic_memory("echo four", "retag", ["note"], wait_for_commit=True)
+    through = _update(memory_api, "retag")["summarized_through"]
+    points, _ = memory_api.client.scroll(
+        "panai_memory", limit=10,
+        scroll_filter={"must": [{"key": "session_id", "match": {"value": "retag"}}],
+                       "must_not": [memory_api.SUMMARY_POINTS]})
+    memory_api.client.set_payload("panai_memory", payload={"tags": ["note", "synced:peer"]}, points=[points[0].id])
+    memory_api.log_generic_memory("echo four", "retag", ["note"], wait_for_commit=True)  # re-delivered
+
+    folded = len(folds)
+    assert _update(memory_api, "retag")["summarized_through"] == through
+    assert len(folds) == folded
+
+
+def test_rebuild_starts_from_the_first_memory(memory_api, folds):
+    for text in ["foxtrot", "golf"]:
+        memory_api.log_generic_memory(text, "rebuild", ["note"], wait_for_commit=True)
+    _update(memory_api, "rebuild")
+    summary = _update(memory_api, "rebuild", rebuild=True)
+    assert summary["memories"] == 2
+    assert "foxtrot" in folds[-1] and "golf" in folds[-1]
+
+
+def test_unstamped_memories_are_stamped_in_one_call_per_page(memory_api, folds, monkeypatch):
+    legacy = [memory_api.memory_point(f"legacy {n}", "legacy", ["note"], vector=fake_embed([f"legacy {n}"])[0],
+                                      timestamp=f"2020-01-0{n}T00:00:00+00:00") for n in (1, 2, 3)]
+    memory_api.client.upsert("panai_memory", points=legacy)  # written without commit stamps
+    calls = []
+    batch_update_points = memory_api.async_client.batch_update_points
+
+    async def counting(**kwargs):
+        calls.append(len(kwargs["update_operations"]))
+        return await batch_update_points(**kwargs)
+
+    monkeypatch.setattr(memory_api.async_client, "batch_update_points", counting)
+    summary = _update(memory_api, "legacy")
+    assert calls == [2, 1]  # SESSION_SUMMARY_BATCH=2
+    assert summary["memories"] == 3
+    stamps = [p.payload[COMMIT_FIELD] for p in memory_api.client.retrieve("panai_memory", ids=[p["id"] for p in legacy])]
+    assert stamps == sorted(stamps)  # oldest memory first
+    assert "legacy" not in memory_api.summary_locks